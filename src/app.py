@@ -1,8 +1,10 @@
 import osmnx
-import pickle as pkl
+import os
 from context import Context
-from routing_actions import RoutingDijkstra, RoutingAStar, RoutingBFS, RoutingDFS
+from routing_actions import ROUTING_MODES
 from routing_helper import RoutingHelper
+from map import load_map, load_compiled_map, get_compiled_map_filename, load_cached_map, find_map, get_map_filename, GEOCODER_FILENAME
+from geocoder import Geocoder
 import tkinter as tk
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -16,11 +18,15 @@ class App:
 		self.x = None
 		self.transportation_mode = None
 		self.graph = None
-		self.ROUTING_METHODS = ["dijkstra", "a*", "dfs"]
+		self.plot_graph = None
+		self.map_filename = None
+		self.ROUTING_METHODS = list(ROUTING_MODES)
 		self.TRANSPORTATION_MODES = ["drive", "walk", "bike"]
 		self.ELEVATION_MODES = ["maximize", "minimize", ""]
 		self.start = None
 		self.end = None
+		self.start_location = None
+		self.end_location = None
 		self.routing_method = None
 
 	def set_user_inputs(self):
@@ -36,7 +42,7 @@ class App:
 
 		self.routing_method = ""
 		while self.routing_method not in self.ROUTING_METHODS:
-			self.routing_method = input("Enter the routing algorithm you would like to use (Dijkstra, A*, DFS): ").lower()
+			self.routing_method = input("Enter the routing algorithm you would like to use (Dijkstra, A*, DFS, Label-Setting, Bidirectional): ").lower()
 
 		self.elevation_gain_mode = input("Type 'maximize' if you want to maximize elevation gain, or 'minimize' if you want to minimize elevation gain (no quotes), or press enter to skip & to get the shortest route: ")
 		while self.elevation_gain_mode not in self.ELEVATION_MODES:
@@ -58,37 +64,54 @@ class App:
 		while self.transportation_mode not in self.TRANSPORTATION_MODES:
 			self.transportation_mode = input("Please enter a valid option between drive, walk, bike: ")
 
-	def set_graph(self):
-		with open("cached_maps/boulder-{}.pkl".format(self.transportation_mode), "rb") as file:
-				self.graph = pkl.load(file)
-		
-	def set_start_end_nodes(self):
-		try:
+	def set_start_end_locations(self):
+		#addresses geocoded before or in the gazetteer of a local OSM extract are resolved without Nominatim
+		geocoder = Geocoder(os.path.join("cached_maps", GEOCODER_FILENAME))
+		start_latitude_longitude, end_latitude_longitude = geocoder.geocode_many([self.start_address, self.end_address])
 
-			start_latitude_longitude = osmnx.geocoder.geocode(self.start_address)
-			self.start = osmnx.distance.nearest_nodes(self.graph, start_latitude_longitude[1], start_latitude_longitude[0])
-			
-			end_latitude_longitude = osmnx.geocoder.geocode(self.end_address)
-			self.end = osmnx.distance.nearest_nodes(self.graph, end_latitude_longitude[1], end_latitude_longitude[0])
-		
-		except ValueError:
+		if start_latitude_longitude is None or end_latitude_longitude is None:
 			print("Error: Invalid addresses given. Please enter a valid address for start and end locations.")
 			exit()
 
-	def strategy_find_route(self):
-		if self.routing_method == "dijkstra":
-			context = Context(RoutingDijkstra())
-			return context.execute_routing_mode(self.graph, self.start, self.end, self.x, self.elevation_gain_mode)
-		elif self.routing_method == "a*":
-			context = Context(RoutingAStar())
-			return context.execute_routing_mode(self.graph, self.start, self.end, self.x, self.elevation_gain_mode)
-		elif self.routing_method  == "dfs":
-			context = Context(RoutingDFS())
-			return context.execute_routing_mode(self.graph, self.start, self.end, self.x, self.elevation_gain_mode)
+		self.start_location = (start_latitude_longitude[1], start_latitude_longitude[0])
+		self.end_location = (end_latitude_longitude[1], end_latitude_longitude[0])
+
+	def set_graph(self):
+		#use the smallest converted map that covers both locations, falling back to the Boulder map
+		map_name = find_map([self.start_location, self.end_location], self.transportation_mode)
+		if map_name is not None:
+			self.map_filename = get_map_filename(map_name)
+			self.graph = load_cached_map(map_name)
+			return
+
+		self.map_filename = "cached_maps/boulder-{}.pkl".format(self.transportation_mode)
+
+		#routing only needs the compiled map, which is memory mapped instead of unpickled
+		if os.path.exists(get_compiled_map_filename(self.map_filename)):
+			self.graph = load_compiled_map(self.map_filename)
 		else:
+			self.graph = load_map(self.map_filename)
+			self.plot_graph = self.graph
+
+	def get_plot_graph(self):
+		#drawing the route needs the full networkx graph, so it is only unpickled once a route was found
+		if self.plot_graph is None:
+			self.plot_graph = load_map(self.map_filename)
+		return self.plot_graph
+
+	def set_start_end_nodes(self):
+		#route from the closest point on the closest street rather than the closest intersection
+		longitudes, latitudes = zip(self.start_location, self.end_location)
+		self.graph, (self.start, self.end) = RoutingHelper().snap_locations(self.graph, longitudes, latitudes)
+
+	def strategy_find_route(self):
+		if self.routing_method not in ROUTING_MODES:
 			print("Invalid routing method selected.")
 			return None
-    
+
+		context = Context(ROUTING_MODES[self.routing_method]())
+		return context.execute_routing_mode(self.graph, self.start, self.end, self.x, self.elevation_gain_mode)
+
 	def display_path(self, path, shortest_path):
 		root = tk.Tk()
 
@@ -139,20 +162,29 @@ class App:
 		label_shortest_distance_value.config(font=('helvetica', 10))
 		canvas1.create_window(400, 590, window=label_shortest_distance_value)
 
-		osmnx.plot.plot_graph_routes(self.graph, [path, shortest_path], route_colors=["r", "b"], route_linewidths=[4, 2], route_alpha=0.8)
+		#the virtual start and end nodes are not in the map that is drawn
+		routes = [self.graph.base_path(path), self.graph.base_path(shortest_path)]
+		#a route that starts and ends at the same node has no edges to draw
+		if len(routes[0]) > 1 and len(routes[1]) > 1:
+			osmnx.plot.plot_graph_routes(self.get_plot_graph(), routes, route_colors=["r", "b"], route_linewidths=[4, 2], route_alpha=0.8)
+		elif len(routes[0]) > 1:
+			osmnx.plot.plot_graph_route(self.get_plot_graph(), routes[0], route_color="r", route_linewidth=4, route_alpha=0.8)
+		else:
+			osmnx.plot.plot_graph(self.get_plot_graph())
 
 		root.mainloop()
 
 def main():
 	app = App()
 	app.set_user_inputs()
+	app.set_start_end_locations()
 	app.set_graph()
 	app.set_start_end_nodes()
 	path = app.strategy_find_route()
 	if path is None:
 		print("No path found.")
 		return
-	shortest_path = osmnx.distance.shortest_path(app.graph, app.start, app.end)
+	shortest_path = RoutingHelper().get_shortest_path(app.graph, app.start, app.end, point_to_point=True)
 	app.display_path(path, shortest_path)
 
 if __name__ == '__main__':
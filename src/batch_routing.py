@@ -0,0 +1,184 @@
+import os
+import sys
+import csv
+import json
+from itertools import islice
+from concurrent.futures import wait, FIRST_COMPLETED
+
+sys.path.insert(0, '.')
+from src.context import Context
+from src.routing_actions import ROUTING_MODES, RoutingDijkstra
+from src.routing_helper import RoutingHelper
+from src.map import load_compiled_map
+from src.query_executor import QueryExecutor
+
+#number of queries read from the input at a time and grouped by end location
+BATCH_WINDOW = 10000
+
+#largest number of queries with the same end location routed by one call in a worker
+GROUP_SIZE = 64
+
+#fields of every result, in the order of the CSV columns
+RESULT_FIELDS = ["index", "start", "end", "x", "elevation_setting", "path", "length", "elevation_gain", "error"]
+
+def route_batch(filename, queries, routing_mode=None, workers=None, timeout=None, window=BATCH_WINDOW):
+	"""
+	Routes many queries on a map and yields their results as they complete, so results can be written out without
+	holding all of them in memory.
+
+	Queries are read `window` at a time and grouped by end location: the shortest distance bound and the pruning
+	bounds of every query come from the reverse shortest distance tree of its end, which is cached per graph, so
+	all the queries of a group share one tree. Groups are routed in parallel in the worker processes of a
+	QueryExecutor, which attach to the compiled copy of the map.
+
+	params:
+		filename: path of the pickle file of a cached map with a compiled copy
+		queries: iterable of (start, end[, x[, elevation_setting]]) tuples or dicts with those keys
+		routing_mode: RoutingMode or the name of one in ROUTING_MODES (None for Dijkstra)
+		workers: int - number of worker processes (None for one per core, 0 to route in this process)
+		timeout: float - number of seconds a group of queries can run (None for no limit)
+		window: int - number of queries grouped at a time
+
+	return: generator of dicts with the fields in RESULT_FIELDS; `index` is the position of the query in
+		`queries`, `path` is None if there is no route and `error` describes why a query could not be routed
+	"""
+	if routing_mode is None:
+		routing_mode = RoutingDijkstra()
+	elif isinstance(routing_mode, str):
+		routing_mode = ROUTING_MODES[routing_mode]()
+
+	groups = _group_queries(queries, window)
+	if workers == 0:
+		compiled = load_compiled_map(filename)
+		for end, group in groups:
+			yield from _route_group(compiled, routing_mode, end, group)
+		return
+
+	with QueryExecutor(filename, workers, timeout=timeout) as executor:
+		#keep every worker busy without queueing more groups than needed, so the input is read as it is routed
+		max_pending = 2 * executor.workers
+		pending = {}
+		for end, group in groups:
+			while len(pending) >= max_pending:
+				yield from _get_finished_results(pending)
+			pending[executor.submit_function(_route_group, routing_mode, end, group)] = (end, group)
+
+		while pending:
+			yield from _get_finished_results(pending)
+
+def read_queries(filename):
+	"""
+	Reads the queries of a batch from a CSV file with `start`, `end` and optionally `x` and `elevation_setting`
+	columns, or from a JSON lines file with an object per query with the same keys. The file is read lazily.
+
+	params:
+		filename: path of the `.csv` or `.jsonl` file
+
+	return: generator of dicts
+	"""
+	with open(filename, newline="") as file:
+		if filename.endswith(".csv"):
+			rows = csv.DictReader(file)
+		else:
+			rows = (json.loads(line) for line in file if line.strip())
+
+		for row in rows:
+			query = {"start": int(row["start"]), "end": int(row["end"]), "x": float(row.get("x") or 0)}
+			query["elevation_setting"] = row.get("elevation_setting") or None
+			yield query
+
+def write_results(results, file, format="jsonl"):
+	"""
+	Writes results of `route_batch` to `file` as they arrive, as JSON lines or as CSV (with the path as node IDs
+	separated by spaces).
+
+	params:
+		results: iterable of result dicts
+		file: text file
+		format: string - "jsonl" or "csv"
+
+	return: int, the number of results written
+	"""
+	if format == "csv":
+		writer = csv.DictWriter(file, RESULT_FIELDS)
+		writer.writeheader()
+
+	count = 0
+	for result in results:
+		if format == "csv":
+			row = dict(result)
+			row["path"] = "" if result["path"] is None else " ".join(str(node) for node in result["path"])
+			writer.writerow(row)
+		else:
+			file.write(json.dumps(result) + "\n")
+		count += 1
+	return count
+
+def _group_queries(queries, window):
+	#yields (end, list of (index, start, x, elevation_setting)) groups of at most GROUP_SIZE queries
+	queries = enumerate(queries)
+	while True:
+		groups = {}
+		for index, query in islice(queries, window):
+			start, end, x, elevation_setting = _parse_query(query)
+			groups.setdefault(end, []).append((index, start, x, elevation_setting))
+		if not groups:
+			return
+
+		for end, group in groups.items():
+			for i in range(0, len(group), GROUP_SIZE):
+				yield end, group[i:i + GROUP_SIZE]
+
+def _parse_query(query):
+	if isinstance(query, dict):
+		return query["start"], query["end"], query.get("x", 0), query.get("elevation_setting")
+
+	query = tuple(query)
+	return query[0], query[1], query[2] if len(query) > 2 else 0, query[3] if len(query) > 3 else None
+
+def _route_group(compiled, routing_mode, end, group):
+	#runs in a worker: routes queries sharing their end location, so they share its reverse shortest distance tree
+	context = Context(routing_mode)
+	results = []
+	for index, start, x, elevation_setting in group:
+		result = {"index": index, "start": start, "end": end, "x": x, "elevation_setting": elevation_setting, "path": None, "length": None, "elevation_gain": None, "error": None}
+		try:
+			path = context.execute_routing_mode(compiled, start, end, x, elevation_setting)
+			if path is not None:
+				result["path"] = path
+				result["length"] = float(RoutingHelper().get_total_path_length(path, compiled))
+				result["elevation_gain"] = float(RoutingHelper().get_path_elevation(path, compiled))
+		except Exception as error:
+			result["error"] = "{}: {}".format(type(error).__name__, error)
+		results.append(result)
+	return results
+
+def _get_finished_results(pending):
+	#waits for at least one group to finish and returns the results of the finished groups
+	done, _ = wait(pending, return_when=FIRST_COMPLETED)
+	results = []
+	for future in done:
+		end, group = pending.pop(future)
+		try:
+			results.extend(future.result())
+		except Exception as error:
+			#the whole group failed, e.g. because it timed out
+			for index, start, x, elevation_setting in group:
+				results.append({"index": index, "start": start, "end": end, "x": x, "elevation_setting": elevation_setting,
+					"path": None, "length": None, "elevation_gain": None, "error": "{}: {}".format(type(error).__name__, error)})
+	return results
+
+if __name__ == '__main__':
+	options = dict(zip(sys.argv[4::2], sys.argv[5::2]))
+	if len(sys.argv) < 4 or len(sys.argv) % 2 != 0 or any(option not in ("--method", "--workers", "--timeout") for option in options):
+		print("Expected: python src/batch_routing.py <cached map> <queries .csv or .jsonl> <results .csv or .jsonl> [--method <routing method>] [--workers <worker processes>] [--timeout <seconds>]")
+		exit()
+
+	workers = int(options["--workers"]) if "--workers" in options else None
+	timeout = float(options["--timeout"]) if "--timeout" in options else None
+	output_filename = sys.argv[3]
+
+	with open(output_filename, "w", newline="") as file:
+		results = route_batch(sys.argv[1], read_queries(sys.argv[2]), options.get("--method"), workers, timeout)
+		count = write_results(results, file, "csv" if output_filename.endswith(".csv") else "jsonl")
+	print("Routed {} queries into {}.".format(count, os.path.abspath(output_filename)))
@@ -0,0 +1,676 @@
+import os
+import heapq
+import weakref
+import numpy as np
+
+#arrays stored by `CompiledGraph.save`, one .npy file each so they can be memory mapped independently
+GRAPH_ARRAYS = ["node_ids", "offsets", "targets", "lengths", "elevation_gains", "elevations", "x", "y"]
+
+#side file with the edge geometry, which only drawing a route needs
+GEOMETRY_FILENAME = "geometry.npz"
+
+class CompiledGraph:
+	"""
+		CompiledGraph is a compact, array-backed (CSR) copy of a networkx multidigraph that the routing strategies
+		search on. Nodes are renumbered to integer indices 0..n-1 (in sorted node ID order when possible, so ties are
+		broken exactly like they are on the original node IDs) and the outgoing edges of node i are stored in
+		targets[offsets[i]:offsets[i+1]], with the matching edge lengths and elevation gains.
+
+		Preprocessing built offline for the graph (such as `landmarks`, `contraction_hierarchy` and `spatial_index`) is attached to it when the map is loaded.
+
+		Parallel edges are collapsed into a single edge using the shortest length and self loops are dropped since
+		no route ever uses them.
+
+		A compiled graph can be stored with `save` and loaded with `load`, which memory maps the arrays instead of
+		unpickling a networkx graph, so loading is near-instant and processes loading the same map share its pages.
+		Only the arrays are shared, though: the adjacency lists and the node ID index the searches use are plain
+		Python objects built by every process on first use, at about 175 bytes per edge for each direction of
+		adjacency and 110 bytes per node for the index (versus 24 bytes per edge and 40 per node in the arrays).
+	"""
+
+	def __init__(self, node_ids, offsets, targets, lengths, elevation_gains, elevations, x, y):
+		self.node_ids = node_ids
+		self.offsets = offsets
+		self.targets = targets
+		self.lengths = lengths
+		self.elevation_gains = elevation_gains
+		self.elevations = elevations
+		self.x = x
+		self.y = y
+		self.landmarks = None
+		self.contraction_hierarchy = None
+		self.spatial_index = None
+		self.directory = None
+
+		self._index = None
+		self._ids = None
+		self._adjacency = None
+		self._reverse_adjacency = None
+		self._geometry = None
+
+	@classmethod
+	def from_graph(cls, graph):
+		"""
+		Builds the compiled representation of `graph`.
+
+		params:
+			graph: networkx multidigraph - nodes contain x, y and elevation data, edges contain length and
+				(optionally) elevation_gain
+
+		return: CompiledGraph
+		"""
+		nodes = list(graph.nodes)
+		try:
+			nodes.sort()
+		except TypeError:
+			pass
+
+		try:
+			node_ids = np.asarray(nodes, dtype=np.int64)
+		except (TypeError, ValueError, OverflowError):
+			node_ids = np.empty(len(nodes), dtype=object)
+			node_ids[:] = nodes
+
+		index = {node: i for i, node in enumerate(nodes)}
+
+		elevations = np.array([graph.nodes[node].get("elevation", 0) for node in nodes], dtype=np.float64)
+		x = np.array([graph.nodes[node].get("x", np.nan) for node in nodes], dtype=np.float64)
+		y = np.array([graph.nodes[node].get("y", np.nan) for node in nodes], dtype=np.float64)
+
+		#keep the shortest of any parallel edges, along with its precomputed elevation gain (if any)
+		edge_data = {}
+		for u, v, data in graph.edges(data=True):
+			if u == v:
+				continue
+			key = (index[u], index[v])
+			length = data["length"]
+			if key not in edge_data or length < edge_data[key][0]:
+				edge_data[key] = (length, data.get("elevation_gain", np.nan))
+
+		edge_count = len(edge_data)
+		sources = np.empty(edge_count, dtype=np.int64)
+		targets = np.empty(edge_count, dtype=np.int64)
+		lengths = np.empty(edge_count, dtype=np.float64)
+		elevation_gains = np.empty(edge_count, dtype=np.float64)
+		for i, ((u, v), (length, elevation_gain)) in enumerate(edge_data.items()):
+			sources[i] = u
+			targets[i] = v
+			lengths[i] = length
+			elevation_gains[i] = elevation_gain
+
+		order = np.lexsort((targets, sources))
+		sources = sources[order]
+		targets = targets[order]
+		lengths = lengths[order]
+		elevation_gains = elevation_gains[order]
+
+		offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+		np.cumsum(np.bincount(sources, minlength=len(nodes)), out=offsets[1:])
+
+		#graphs cached before edges stored their elevation gain fall back to the node elevations
+		missing = np.isnan(elevation_gains)
+		elevation_gains[missing] = np.maximum(0, elevations[targets[missing]] - elevations[sources[missing]])
+
+		compiled = cls(node_ids, offsets, targets, lengths, elevation_gains, elevations, x, y)
+		compiled._index = index
+		compiled._ids = nodes
+		return compiled
+
+	@classmethod
+	def load(cls, directory, mmap=True):
+		"""
+		Loads a compiled graph stored by `save`.
+
+		params:
+			directory: path of the directory the graph was stored in
+			mmap: bool - if True, memory map the arrays (read only) instead of reading them into memory
+
+		return: CompiledGraph
+		"""
+		mmap_mode = "r" if mmap else None
+		arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode) for name in GRAPH_ARRAYS]
+
+		compiled = cls(*arrays)
+		compiled.directory = directory
+		return compiled
+
+	def save(self, directory):
+		"""
+		Stores the arrays of the graph as .npy files in `directory`, which is created if needed.
+
+		params:
+			directory: path of the directory
+		"""
+		if self.node_ids.dtype == object:
+			raise ValueError("Only graphs with integer node IDs can be stored.")
+
+		os.makedirs(directory, exist_ok=True)
+		for name in GRAPH_ARRAYS:
+			np.save(os.path.join(directory, name + ".npy"), np.ascontiguousarray(getattr(self, name)))
+
+	@property
+	def node_count(self):
+		"""
+		Number of nodes in the graph.
+		"""
+		return len(self.node_ids)
+
+	@property
+	def edge_count(self):
+		"""
+		Number of (collapsed) edges in the graph.
+		"""
+		return len(self.targets)
+
+	def __contains__(self, node):
+		return node in self._get_index()
+
+	def index_of(self, node):
+		"""
+		Returns the integer index of the node with ID `node`.
+
+		params:
+			node: int - node ID
+
+		return: int
+		"""
+		return self._get_index()[node]
+
+	def node_id(self, index):
+		"""
+		Returns the node ID of the node with integer index `index`.
+
+		params:
+			index: int
+
+		return: int - node ID
+		"""
+		return self._get_ids()[index]
+
+	def path_to_ids(self, indices):
+		"""
+		Maps a path of integer indices back to node IDs.
+
+		params:
+			indices: list of ints
+
+		return: list of node IDs
+		"""
+		ids = self._get_ids()
+		return [ids[i] for i in indices]
+
+	def adjacency(self):
+		"""
+		Returns the outgoing edges of every node as a list (indexed by node index) of lists of
+		(target, length, elevation gain) tuples. This is built once and reused by every query, since iterating
+		over plain Python tuples is much faster than indexing NumPy arrays one element at a time. The lists take
+		about 175 bytes per edge and, unlike the arrays, are private to the process that built them.
+
+		return: list of lists of (int, float, float)
+		"""
+		if self._adjacency is None:
+			offsets = self.offsets.tolist()
+			edges = list(zip(self.targets.tolist(), self.lengths.tolist(), self.elevation_gains.tolist()))
+			self._adjacency = [edges[offsets[i]:offsets[i + 1]] for i in range(self.node_count)]
+		return self._adjacency
+
+	def reverse_adjacency(self):
+		"""
+		Returns the incoming edges of every node as a list (indexed by node index) of lists of
+		(source, length, elevation gain) tuples, i.e. the adjacency of the reversed graph.
+
+		return: list of lists of (int, float, float)
+		"""
+		if self._reverse_adjacency is None:
+			sources = np.repeat(np.arange(self.node_count), np.diff(self.offsets))
+			order = np.argsort(self.targets, kind="stable")
+			counts = np.bincount(self.targets, minlength=self.node_count)
+			offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+			np.cumsum(counts, out=offsets[1:])
+
+			offsets = offsets.tolist()
+			edges = list(zip(sources[order].tolist(), self.lengths[order].tolist(), self.elevation_gains[order].tolist()))
+			self._reverse_adjacency = [edges[offsets[i]:offsets[i + 1]] for i in range(self.node_count)]
+		return self._reverse_adjacency
+
+	def edge_length(self, node1, node2):
+		"""
+		Returns the length of the edge between two node indices.
+
+		params:
+			node1: int - node index
+			node2: int - node index
+
+		return: float, or None if there is no such edge
+		"""
+		for next_node, length, _ in self.adjacency()[node1]:
+			if next_node == node2:
+				return length
+		return None
+
+	def edge_geometry(self, node1, node2):
+		"""
+		Returns the shape of the edge between two node indices, from the geometry side file when the graph was
+		loaded from a directory that has one, or a straight line between the nodes otherwise.
+
+		params:
+			node1: int - node index
+			node2: int - node index
+
+		return: list of (longitude, latitude) tuples
+		"""
+		straight_line = [(float(self.x[node1]), float(self.y[node1])), (float(self.x[node2]), float(self.y[node2]))]
+
+		geometry = self._get_geometry()
+		if geometry is None:
+			return straight_line
+
+		point_offsets, point_x, point_y = geometry
+		start, end = int(self.offsets[node1]), int(self.offsets[node1 + 1])
+		edge = start + int(np.searchsorted(self.targets[start:end], node2))
+		if edge >= end or self.targets[edge] != node2 or point_offsets[edge] == point_offsets[edge + 1]:
+			return straight_line
+
+		points = slice(point_offsets[edge], point_offsets[edge + 1])
+		return list(zip(point_x[points].tolist(), point_y[points].tolist()))
+
+	def _get_geometry(self):
+		if self._geometry is None and self.directory is not None:
+			filename = os.path.join(self.directory, GEOMETRY_FILENAME)
+			if os.path.exists(filename):
+				with np.load(filename) as data:
+					self._geometry = (data["point_offsets"], data["point_x"], data["point_y"])
+		return self._geometry
+
+	def _get_index(self):
+		if self._index is None:
+			self._index = {node: i for i, node in enumerate(self._get_ids())}
+		return self._index
+
+	def _get_ids(self):
+		if self._ids is None:
+			self._ids = self.node_ids.tolist()
+		return self._ids
+
+def save_edge_geometry(compiled, graph, directory):
+	"""
+	Stores the shape of every edge of `compiled` (taken from the `geometry` of the matching, shortest parallel
+	edge in `graph`) in the geometry side file of `directory`. Edges without a geometry are stored as empty and
+	drawn as a straight line.
+
+	params:
+		compiled: CompiledGraph - compiled from `graph`
+		graph: networkx multidigraph - edges may contain a shapely LineString `geometry`
+		directory: path of the directory the compiled graph is stored in
+	"""
+	counts = np.zeros(compiled.edge_count, dtype=np.int64)
+	point_x = []
+	point_y = []
+
+	sources = np.repeat(np.arange(compiled.node_count), np.diff(compiled.offsets)).tolist()
+	for edge, (node1, node2) in enumerate(zip(sources, compiled.targets.tolist())):
+		edges = graph.get_edge_data(compiled.node_id(node1), compiled.node_id(node2))
+		data = min(edges.values(), key=lambda data: data["length"])
+		if "geometry" in data:
+			x, y = data["geometry"].xy
+			point_x.extend(x)
+			point_y.extend(y)
+			counts[edge] = len(x)
+
+	point_offsets = np.zeros(compiled.edge_count + 1, dtype=np.int64)
+	np.cumsum(counts, out=point_offsets[1:])
+
+	with open(os.path.join(directory, GEOMETRY_FILENAME), "wb") as file:
+		np.savez(file, point_offsets=point_offsets, point_x=np.array(point_x, dtype=np.float64), point_y=np.array(point_y, dtype=np.float64))
+
+class SnappedGraph(CompiledGraph):
+	"""
+		SnappedGraph is a routing view of a compiled graph with virtual nodes added at positions along its edges,
+		such as the start and end locations of a route snapped to the closest street. A virtual node splits the
+		street it is on (in both directions, if the street is two-way) into two edges with the matching part of the
+		length and elevation gain; the original edges stay in place. Virtual nodes have the IDs -1, -2, ... and the
+		node indices that follow the nodes of the base graph.
+
+		The base graph is shared and never modified: only the adjacency lists of the nodes at the ends of the split
+		streets are replaced in the view, and the per-node arrays read the base arrays followed by small arrays with
+		the virtual nodes, so creating a view for a query does not copy anything the size of the base graph.
+		The view can be searched like any compiled graph.
+	"""
+
+	def __init__(self, base, virtual_nodes):
+		"""
+		params:
+			base: CompiledGraph
+			virtual_nodes: list of (node1 index, node2 index, position) tuples - the edge every virtual node is on
+				and its position along it, from 0 at node1 to 1 at node2
+		"""
+		self.base = base
+		self.virtual_nodes = list(virtual_nodes)
+		self.directory = None
+
+		self._x = None
+		self._y = None
+		self._elevations = None
+		self._reverse_adjacency = None
+
+		base_count = base.node_count
+		base_adjacency = base.adjacency()
+		base_elevations = base.elevations
+
+		#several virtual nodes on the same street are chained in order along it
+		streets = {}
+		for i, (node1, node2, position) in enumerate(self.virtual_nodes):
+			if node1 > node2:
+				node1, node2, position = node2, node1, 1 - position
+			streets.setdefault((node1, node2), []).append((position, base_count + i))
+
+		self._virtual_elevations = [0.0] * len(self.virtual_nodes)
+		added_edges = {}
+		for (node1, node2), positions in streets.items():
+			positions.sort()
+			for position, node in positions:
+				self._virtual_elevations[node - base_count] = float(base_elevations[node1] + position * (base_elevations[node2] - base_elevations[node1]))
+
+			for source, target, chain in ((node1, node2, positions), (node2, node1, [(1 - position, node) for position, node in reversed(positions)])):
+				length = base.edge_length(source, target)
+				if length is None:
+					continue
+
+				chain = [(0.0, source)] + chain + [(1.0, target)]
+				for (start, node), (end, next_node) in zip(chain, chain[1:]):
+					elevation_gain = max(0.0, self._get_elevation(next_node) - self._get_elevation(node))
+					added_edges.setdefault(node, []).append((next_node, length * (end - start), elevation_gain))
+
+		self._added_edges = added_edges
+		self._adjacency = _OverlayAdjacency(base_adjacency, {node: (base_adjacency[node] if node < base_count else []) + edges for node, edges in added_edges.items()}, len(self.virtual_nodes))
+		for i in range(len(self.virtual_nodes)):
+			self._adjacency.overrides.setdefault(base_count + i, [])
+
+	@property
+	def node_count(self):
+		"""
+		Number of nodes in the view, including the virtual nodes.
+		"""
+		return self.base.node_count + len(self.virtual_nodes)
+
+	@property
+	def edge_count(self):
+		"""
+		Number of edges in the view, including the edges added by splitting streets.
+		"""
+		return self.base.edge_count + sum(len(edges) for edges in self._added_edges.values())
+
+	@property
+	def x(self):
+		return self._get_coordinates()[0]
+
+	@property
+	def y(self):
+		return self._get_coordinates()[1]
+
+	@property
+	def elevations(self):
+		if self._elevations is None:
+			self._elevations = _OverlayArray(self.base.elevations, self._virtual_elevations)
+		return self._elevations
+
+	@property
+	def landmarks(self):
+		return self.base.landmarks
+
+	@property
+	def contraction_hierarchy(self):
+		return self.base.contraction_hierarchy
+
+	@property
+	def spatial_index(self):
+		return self.base.spatial_index
+
+	def __contains__(self, node):
+		return self.is_virtual(node) or node in self.base
+
+	def is_virtual(self, node):
+		"""
+		Checks whether the node with ID `node` is a virtual node.
+		"""
+		return isinstance(node, (int, np.integer)) and node < 0 and -node <= len(self.virtual_nodes)
+
+	def index_of(self, node):
+		if self.is_virtual(node):
+			return self.base.node_count - node - 1
+		return self.base.index_of(node)
+
+	def node_id(self, index):
+		if index >= self.base.node_count:
+			return self.base.node_count - index - 1
+		return self.base.node_id(index)
+
+	def path_to_ids(self, indices):
+		return [self.node_id(i) for i in indices]
+
+	def base_path(self, nodes):
+		"""
+		Turns a path of node IDs into a path on the base graph (to draw the route on the base map, for example).
+		Virtual nodes inside the path are dropped, since the streets they split are still in the base graph. A
+		route that starts or ends at a virtual node starts or ends at the far end of its street instead, so a route
+		between two virtual nodes on the same street keeps that street rather than losing all of its nodes.
+
+		params:
+			nodes: list of node IDs
+
+		return: list of node IDs
+		"""
+		runs = []
+		for i, node in enumerate(nodes):
+			if not self.is_virtual(node):
+				continue
+			if runs and runs[-1][1] == i:
+				runs[-1][1] = i + 1
+			else:
+				runs.append([i, i + 1])
+
+		path = []
+		last = 0
+		for start, end in runs:
+			path.extend(nodes[last:start])
+			last = end
+			node1, node2, position = self.virtual_nodes[-nodes[start] - 1]
+			street = [self.base.node_id(node1), self.base.node_id(node2)]
+
+			if start > 0 and end < len(nodes):
+				continue
+			elif start > 0 or end < len(nodes):
+				#the route ends on the street after leaving the base graph at one end of it, or starts on the
+				#street and joins the base graph at one end of it, so add the other end
+				joined = nodes[start - 1] if start > 0 else nodes[end]
+				path.append(street[1] if street[0] == joined else street[0])
+			else:
+				#the whole route is on the street, in the direction from its first to its last virtual node
+				last_node1, _, last_position = self.virtual_nodes[-nodes[end - 1] - 1]
+				if last_node1 != node1:
+					last_position = 1 - last_position
+				path.extend(street if last_position >= position else street[::-1])
+		path.extend(nodes[last:])
+		return path
+
+	def adjacency(self):
+		return self._adjacency
+
+	def reverse_adjacency(self):
+		if self._reverse_adjacency is None:
+			reversed_edges = {}
+			for node, edges in self._added_edges.items():
+				for next_node, length, elevation_gain in edges:
+					reversed_edges.setdefault(next_node, []).append((node, length, elevation_gain))
+
+			base_count = self.base.node_count
+			base_reverse_adjacency = self.base.reverse_adjacency()
+			overrides = {node: (base_reverse_adjacency[node] if node < base_count else []) + edges for node, edges in reversed_edges.items()}
+			for i in range(len(self.virtual_nodes)):
+				overrides.setdefault(base_count + i, [])
+			self._reverse_adjacency = _OverlayAdjacency(base_reverse_adjacency, overrides, len(self.virtual_nodes))
+		return self._reverse_adjacency
+
+	def edge_geometry(self, node1, node2):
+		if node1 < self.base.node_count and node2 < self.base.node_count:
+			return self.base.edge_geometry(node1, node2)
+		return [(float(self.x[node1]), float(self.y[node1])), (float(self.x[node2]), float(self.y[node2]))]
+
+	def virtual_distances(self, node, reverse=False):
+		"""
+		Finds the shortest routes from `node` (or to it, if `reverse`) that only pass through virtual nodes, which
+		is how a route from or to a virtual node gets onto the base graph.
+
+		params:
+			node: int - node index
+			reverse: bool - if True, follow the edges backwards
+
+		return: dict of node index to (distance, list of node indices in the direction of travel), with the base
+			nodes where these routes end and the virtual nodes they pass
+		"""
+		adjacency = self.reverse_adjacency() if reverse else self.adjacency()
+		base_count = self.base.node_count
+
+		routes = {node: (0, [node])}
+		queue = [(0, node)]
+		settled = set()
+		while queue:
+			distance, current_node = heapq.heappop(queue)
+			if current_node in settled or current_node < base_count:
+				continue
+			settled.add(current_node)
+
+			for next_node, length, _ in adjacency[current_node]:
+				if distance + length < routes.get(next_node, (float("inf"),))[0]:
+					path = routes[current_node][1]
+					routes[next_node] = (distance + length, [next_node] + path if reverse else path + [next_node])
+					heapq.heappush(queue, (distance + length, next_node))
+		return routes
+
+	def extend_lower_bounds(self, target, get_base_bounds):
+		"""
+		Turns lower bounds on the remaining distance in the base graph into lower bounds in the view. A route to a
+		virtual target reaches it through one of the base nodes at the ends of its street, so the bound of a base
+		node is the smallest bound to one of those nodes plus the rest of the way; the bound of a virtual node
+		comes from its outgoing edges.
+
+		params:
+			target: int - node index of the end location
+			get_base_bounds: function - takes the node index of a base node and returns a numpy array of lower
+				bounds on the distance from every base node to it
+
+		return: list of floats, indexed by node index
+		"""
+		base_count = self.base.node_count
+		bounds = np.full(base_count, np.inf)
+		for node, (distance, _) in self.virtual_distances(target, reverse=True).items():
+			if node < base_count:
+				bounds = np.minimum(bounds, get_base_bounds(node) + distance)
+
+		bounds = bounds.tolist() + [float("inf")] * len(self.virtual_nodes)
+		bounds[target] = 0
+
+		#a chain of virtual nodes settles in at most one pass per virtual node
+		adjacency = self.adjacency()
+		for _ in range(len(self.virtual_nodes)):
+			for node in range(base_count, self.node_count):
+				if node != target:
+					bounds[node] = min([bounds[node]] + [length + bounds[next_node] for next_node, length, _ in adjacency[node]])
+		return bounds
+
+	def _get_elevation(self, node):
+		if node < self.base.node_count:
+			return float(self.base.elevations[node])
+		return self._virtual_elevations[node - self.base.node_count]
+
+	def _get_coordinates(self):
+		if self._x is None:
+			virtual_x, virtual_y = self._get_virtual_coordinates()
+			self._x = _OverlayArray(self.base.x, virtual_x)
+			self._y = _OverlayArray(self.base.y, virtual_y)
+		return self._x, self._y
+
+	def _get_virtual_coordinates(self):
+		#the point at the position of every virtual node along its edge's shape
+		virtual_x = np.zeros(len(self.virtual_nodes))
+		virtual_y = np.zeros(len(self.virtual_nodes))
+		for i, (node1, node2, position) in enumerate(self.virtual_nodes):
+			shape = np.array(self.base.edge_geometry(node1, node2), dtype=np.float64)
+			scale = np.cos(np.radians(np.nanmean(shape[:, 1])))
+			lengths = np.hypot(np.diff(shape[:, 0]) * scale, np.diff(shape[:, 1]))
+			distances = np.concatenate(([0], np.cumsum(lengths)))
+			distance = position * distances[-1]
+			virtual_x[i] = np.interp(distance, distances, shape[:, 0])
+			virtual_y[i] = np.interp(distance, distances, shape[:, 1])
+		return virtual_x, virtual_y
+
+class _OverlayAdjacency:
+	#adjacency lists of a SnappedGraph: the lists of the base graph, with the ones in `overrides` replaced
+	def __init__(self, base, overrides, extra_count):
+		self.base = base
+		self.overrides = overrides
+		self.extra_count = extra_count
+
+	def __len__(self):
+		return len(self.base) + self.extra_count
+
+	def __getitem__(self, node):
+		edges = self.overrides.get(node)
+		return self.base[node] if edges is None else edges
+
+class _OverlayArray:
+	#per-node array of a SnappedGraph: the array of the base graph followed by the values of the virtual nodes
+	def __init__(self, base, extra):
+		self.base = base
+		self.extra = np.asarray(extra, dtype=np.float64)
+
+	def __len__(self):
+		return len(self.base) + len(self.extra)
+
+	def __getitem__(self, index):
+		if isinstance(index, (int, np.integer)):
+			index = int(index) + (len(self) if index < 0 else 0)
+			if index >= len(self.base):
+				return self.extra[index - len(self.base)]
+			return self.base[index]
+
+		if isinstance(index, slice):
+			return np.asarray(self)[index]
+
+		#index arrays are gathered from both parts; boolean masks cover every node, so they copy anyway
+		indices = np.asarray(index)
+		if indices.dtype == bool:
+			return np.asarray(self)[indices]
+		indices = np.where(indices < 0, indices + len(self), indices)
+		in_base = indices < len(self.base)
+		values = np.empty(indices.shape, dtype=np.float64)
+		values[in_base] = self.base[indices[in_base]]
+		values[~in_base] = self.extra[indices[~in_base] - len(self.base)]
+		return values
+
+	def tolist(self):
+		return self.base.tolist() + self.extra.tolist()
+
+	def __array__(self, dtype=None, copy=None):
+		return np.concatenate((self.base, self.extra)).astype(dtype or np.float64, copy=False)
+
+_compiled_graphs = weakref.WeakKeyDictionary()
+
+def compile_graph(graph):
+	"""
+	Returns the compiled representation of `graph`, building it the first time the graph is seen. Compiled graphs
+	are cached for as long as `graph` is alive so every query on the same graph shares them.
+
+	params:
+		graph: networkx multidigraph or CompiledGraph
+
+	return: CompiledGraph
+	"""
+	if isinstance(graph, CompiledGraph):
+		return graph
+
+	compiled = _compiled_graphs.get(graph)
+	if compiled is None:
+		compiled = CompiledGraph.from_graph(graph)
+		_compiled_graphs[graph] = compiled
+	return compiled
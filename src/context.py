@@ -25,4 +25,12 @@ class Context:
         Execute routing algorithm of chosen strategy.
         """
         return self._routing_mode.routing_action(graph, start, end, x, elevation_setting)
-        
\ No newline at end of file
+
+    def execute_frontier_query(self, graph, start, end, max_x=100):
+        """
+        Find the Pareto frontier of (length, elevation gain) routes from start to end with the chosen strategy,
+        which can then answer any x <= max_x and elevation setting without searching again.
+        """
+        if not self._routing_mode.supports_frontier:
+            raise ValueError("{} does not support Pareto frontier queries.".format(type(self._routing_mode).__name__))
+        return self._routing_mode.frontier_action(graph, start, end, max_x)
@@ -0,0 +1,374 @@
+import heapq
+import numpy as np
+
+class ContractionHierarchy:
+	"""
+		ContractionHierarchy holds the contraction hierarchy (CH) preprocessing of a compiled graph. Nodes are
+		contracted one at a time in order of importance (`ranks`); contracting a node adds shortcut edges between
+		its neighbors wherever the only shortest route between them went through it. A shortest distance query then
+		only needs a bidirectional Dijkstra search that climbs to higher ranked nodes from both ends, which settles a
+		tiny fraction of the graph.
+
+		The upward edges (u, w) with rank[w] > rank[u] are stored by u; the downward edges (u, w) with
+		rank[u] > rank[w] are stored by w, so the backward search can climb them in reverse. Every edge also stores
+		the node it shortcuts (-1 for an original edge), which is used to unpack a route into the original edges.
+	"""
+
+	def __init__(self, node_ids, ranks, up_offsets, up_targets, up_lengths, up_middles, down_offsets, down_sources, down_lengths, down_middles):
+		self.node_ids = node_ids
+		self.ranks = ranks
+		self.up_offsets = up_offsets
+		self.up_targets = up_targets
+		self.up_lengths = up_lengths
+		self.up_middles = up_middles
+		self.down_offsets = down_offsets
+		self.down_sources = down_sources
+		self.down_lengths = down_lengths
+		self.down_middles = down_middles
+
+		self._up_adjacency = None
+		self._down_adjacency = None
+		self._middles = None
+
+	@property
+	def shortcut_count(self):
+		"""
+		Number of shortcut edges added by the contraction.
+		"""
+		return int((self.up_middles != -1).sum() + (self.down_middles != -1).sum())
+
+	def matches(self, compiled):
+		"""
+		Checks that the hierarchy was built for `compiled`.
+
+		params:
+			compiled: CompiledGraph
+
+		return: bool
+		"""
+		return len(self.node_ids) == compiled.node_count and np.array_equal(self.node_ids, compiled.node_ids)
+
+	def shortest_path(self, source, target):
+		"""
+		Finds the shortest path from `source` to `target` with a bidirectional upward search and unpacks its
+		shortcuts into the original edges.
+
+		params:
+			source: int - node index of the start location
+			target: int - node index of the end location
+
+		return: list of node indices, or None if there is no path
+		"""
+		if source == target:
+			return [source]
+
+		adjacencies = self._get_adjacencies()
+		distances = ({source: 0}, {target: 0})
+		previous_nodes = ({source: -1}, {target: -1})
+		settled = (set(), set())
+		queues = ([(0, source)], [(0, target)])
+
+		best_distance = float("inf")
+		meeting_node = -1
+
+		while True:
+			#a direction is finished once its smallest distance can no longer improve the best route
+			forward_open = queues[0] and queues[0][0][0] < best_distance
+			backward_open = queues[1] and queues[1][0][0] < best_distance
+			if not forward_open and not backward_open:
+				break
+			if forward_open and backward_open:
+				direction = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+			else:
+				direction = 0 if forward_open else 1
+
+			distance, current_node = heapq.heappop(queues[direction])
+			if current_node in settled[direction]:
+				continue
+			settled[direction].add(current_node)
+
+			other_distance = distances[1 - direction].get(current_node)
+			if other_distance is not None and distance + other_distance < best_distance:
+				best_distance = distance + other_distance
+				meeting_node = current_node
+
+			for next_node, length in adjacencies[direction][current_node]:
+				new_distance = distance + length
+				if new_distance < distances[direction].get(next_node, float("inf")):
+					distances[direction][next_node] = new_distance
+					previous_nodes[direction][next_node] = current_node
+					heapq.heappush(queues[direction], (new_distance, next_node))
+
+		if meeting_node == -1:
+			return None
+
+		packed_path = []
+		current_node = meeting_node
+		while current_node != -1:
+			packed_path.append(current_node)
+			current_node = previous_nodes[0][current_node]
+		packed_path.reverse()
+
+		current_node = previous_nodes[1][meeting_node]
+		while current_node != -1:
+			packed_path.append(current_node)
+			current_node = previous_nodes[1][current_node]
+
+		return self._unpack(packed_path)
+
+	def shortest_distance(self, source, target):
+		"""
+		Finds the length of the shortest path from `source` to `target`, summed over the original edges.
+
+		params:
+			source: int - node index of the start location
+			target: int - node index of the end location
+
+		return: float (inf if there is no path)
+		"""
+		path = self.shortest_path(source, target)
+		if path is None:
+			return float("inf")
+
+		middles = self._get_middles()
+		return sum(middles[(path[i], path[i + 1])][0] for i in range(len(path) - 1))
+
+	def upward_search(self, root, backward=False):
+		"""
+		Runs one half of a query on its own: a Dijkstra search from `root` that only climbs to higher ranked nodes,
+		over the upward edges or, if backward, the downward edges in reverse. Many-to-many queries combine the
+		searches from every source and target.
+
+		params:
+			root: int - node index
+			backward: bool - if True, the distances are from every settled node to root instead
+
+		return: (dict of settled node index to distance, dict of node index to previous node index, -1 for root)
+		"""
+		adjacency = self._get_adjacencies()[1 if backward else 0]
+		distances = {root: 0}
+		previous_nodes = {root: -1}
+		settled = {}
+		queue = [(0, root)]
+
+		while queue:
+			distance, current_node = heapq.heappop(queue)
+			if current_node in settled:
+				continue
+			settled[current_node] = distance
+
+			for next_node, length in adjacency[current_node]:
+				new_distance = distance + length
+				if new_distance < distances.get(next_node, float("inf")):
+					distances[next_node] = new_distance
+					previous_nodes[next_node] = current_node
+					heapq.heappush(queue, (new_distance, next_node))
+
+		return settled, previous_nodes
+
+	def unpack_edge(self, node1, node2):
+		"""
+		Unpacks an edge of the hierarchy, which may be a shortcut, into the original edges it stands for.
+
+		params:
+			node1: int - node index
+			node2: int - node index
+
+		return: list of node indices from node1 to node2
+		"""
+		return self._unpack([node1, node2])
+
+	def save(self, filename):
+		"""
+		Stores the hierarchy in a `.npz` file next to the cached map.
+
+		params:
+			filename: path of the file
+		"""
+		with open(filename, "wb") as file:
+			np.savez(file, node_ids=self.node_ids, ranks=self.ranks,
+				up_offsets=self.up_offsets, up_targets=self.up_targets, up_lengths=self.up_lengths, up_middles=self.up_middles,
+				down_offsets=self.down_offsets, down_sources=self.down_sources, down_lengths=self.down_lengths, down_middles=self.down_middles)
+
+	@classmethod
+	def load(cls, filename):
+		"""
+		Loads a hierarchy stored by `save`.
+
+		params:
+			filename: path of the file
+
+		return: ContractionHierarchy
+		"""
+		with np.load(filename) as data:
+			return cls(data["node_ids"], data["ranks"],
+				data["up_offsets"], data["up_targets"], data["up_lengths"], data["up_middles"],
+				data["down_offsets"], data["down_sources"], data["down_lengths"], data["down_middles"])
+
+	def _get_adjacencies(self):
+		if self._up_adjacency is None:
+			self._up_adjacency = _to_adjacency(self.up_offsets, self.up_targets, self.up_lengths)
+			self._down_adjacency = _to_adjacency(self.down_offsets, self.down_sources, self.down_lengths)
+		return self._up_adjacency, self._down_adjacency
+
+	def _get_middles(self):
+		#(u, w) -> (length, middle node) for every edge of the hierarchy
+		if self._middles is None:
+			middles = {}
+			up_sources = np.repeat(np.arange(len(self.ranks)), np.diff(self.up_offsets))
+			for u, w, length, middle in zip(up_sources.tolist(), self.up_targets.tolist(), self.up_lengths.tolist(), self.up_middles.tolist()):
+				middles[(u, w)] = (length, middle)
+			down_targets = np.repeat(np.arange(len(self.ranks)), np.diff(self.down_offsets))
+			for u, w, length, middle in zip(self.down_sources.tolist(), down_targets.tolist(), self.down_lengths.tolist(), self.down_middles.tolist()):
+				middles[(u, w)] = (length, middle)
+			self._middles = middles
+		return self._middles
+
+	def _unpack(self, packed_path):
+		middles = self._get_middles()
+		path = [packed_path[0]]
+
+		#replace every shortcut (u, w) through m by (u, m) and (m, w) until only original edges are left
+		stack = [(packed_path[i], packed_path[i + 1]) for i in range(len(packed_path) - 2, -1, -1)]
+		while stack:
+			u, w = stack.pop()
+			middle = middles[(u, w)][1]
+			if middle == -1:
+				path.append(w)
+			else:
+				stack.append((middle, w))
+				stack.append((u, middle))
+		return path
+
+def _to_adjacency(offsets, nodes, lengths):
+	offsets = offsets.tolist()
+	edges = list(zip(nodes.tolist(), lengths.tolist()))
+	return [edges[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+def build_contraction_hierarchy(compiled, settle_limit=500):
+	"""
+	Builds the contraction hierarchy of `compiled`. Nodes are contracted in order of a lazily updated priority
+	(the number of shortcuts contracting the node would add minus the number of edges it removes, plus the number
+	of its neighbors already contracted, which spreads contraction evenly over the map). A shortcut u -> w through v
+	is only added if a limited local Dijkstra search from u that avoids v finds no route to w at least as short.
+	This is slow for a whole city, so it is done offline.
+
+	params:
+		compiled: CompiledGraph
+		settle_limit: int - maximum number of nodes settled by each witness search (a smaller limit builds faster
+			but may add unnecessary shortcuts)
+
+	return: ContractionHierarchy
+	"""
+	node_count = compiled.node_count
+
+	#the remaining (not yet contracted) graph: node -> {neighbor: (length, middle node)}
+	out_edges = [{} for _ in range(node_count)]
+	in_edges = [{} for _ in range(node_count)]
+	for u, edges in enumerate(compiled.adjacency()):
+		for w, length, _ in edges:
+			out_edges[u][w] = (length, -1)
+			in_edges[w][u] = (length, -1)
+
+	#every edge of the hierarchy, original or shortcut
+	hierarchy_edges = {}
+	for u in range(node_count):
+		for w, edge in out_edges[u].items():
+			hierarchy_edges[(u, w)] = edge
+
+	contracted_neighbors = [0] * node_count
+	ranks = np.zeros(node_count, dtype=np.int64)
+
+	def find_shortcuts(node):
+		shortcuts = []
+		for u, (length_in, _) in in_edges[node].items():
+			targets = {w: length_in + length_out for w, (length_out, _) in out_edges[node].items() if w != u}
+			if not targets:
+				continue
+
+			witness_distances = _witness_search(out_edges, u, node, max(targets.values()), settle_limit)
+			for w, distance in targets.items():
+				if witness_distances.get(w, float("inf")) > distance:
+					shortcuts.append((u, w, distance))
+		return shortcuts
+
+	def get_priority(node):
+		return len(find_shortcuts(node)) - len(in_edges[node]) - len(out_edges[node]) + contracted_neighbors[node]
+
+	queue = [(get_priority(node), node) for node in range(node_count)]
+	heapq.heapify(queue)
+
+	rank = 0
+	while queue:
+		_, node = heapq.heappop(queue)
+
+		#priorities change as the graph is contracted, so recompute and requeue if the node is no longer the best
+		priority = get_priority(node)
+		if queue and priority > queue[0][0]:
+			heapq.heappush(queue, (priority, node))
+			continue
+
+		for u, w, distance in find_shortcuts(node):
+			if distance < out_edges[u].get(w, (float("inf"), -1))[0]:
+				out_edges[u][w] = (distance, node)
+				in_edges[w][u] = (distance, node)
+				hierarchy_edges[(u, w)] = (distance, node)
+
+		for u in in_edges[node]:
+			del out_edges[u][node]
+			contracted_neighbors[u] += 1
+		for w in out_edges[node]:
+			del in_edges[w][node]
+			contracted_neighbors[w] += 1
+		in_edges[node] = {}
+		out_edges[node] = {}
+
+		ranks[node] = rank
+		rank += 1
+
+	up_edges = []
+	down_edges = []
+	for (u, w), (length, middle) in hierarchy_edges.items():
+		if ranks[w] > ranks[u]:
+			up_edges.append((u, w, length, middle))
+		else:
+			down_edges.append((w, u, length, middle))
+
+	up_offsets, up_targets, up_lengths, up_middles = _to_csr(up_edges, node_count)
+	down_offsets, down_sources, down_lengths, down_middles = _to_csr(down_edges, node_count)
+
+	return ContractionHierarchy(compiled.node_ids, ranks, up_offsets, up_targets, up_lengths, up_middles, down_offsets, down_sources, down_lengths, down_middles)
+
+def _witness_search(out_edges, source, avoided_node, max_distance, settle_limit):
+	distances = {source: 0}
+	settled = 0
+	queue = [(0, source)]
+
+	while queue and settled < settle_limit:
+		distance, current_node = heapq.heappop(queue)
+		if distance > max_distance:
+			break
+		if distance > distances[current_node]:
+			continue
+		settled += 1
+
+		for next_node, (length, _) in out_edges[current_node].items():
+			if next_node == avoided_node:
+				continue
+			new_distance = distance + length
+			if new_distance < distances.get(next_node, float("inf")):
+				distances[next_node] = new_distance
+				heapq.heappush(queue, (new_distance, next_node))
+
+	return distances
+
+def _to_csr(edges, node_count):
+	#edges are (node the edge is stored by, other node, length, middle node)
+	edges.sort(key=lambda edge: (edge[0], edge[1]))
+	offsets = np.zeros(node_count + 1, dtype=np.int64)
+	np.cumsum(np.bincount(np.array([edge[0] for edge in edges], dtype=np.int64), minlength=node_count), out=offsets[1:])
+
+	nodes = np.array([edge[1] for edge in edges], dtype=np.int64)
+	lengths = np.array([edge[2] for edge in edges], dtype=np.float64)
+	middles = np.array([edge[3] for edge in edges], dtype=np.int64)
+	return offsets, nodes, lengths, middles
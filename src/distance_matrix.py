@@ -0,0 +1,178 @@
+import sys
+import heapq
+import numpy as np
+
+sys.path.insert(0, '.')
+from src.compiled_graph import compile_graph
+from src.query_executor import QueryExecutor
+
+def get_distance_matrix(graph, sources, targets, use_hierarchy=None):
+	"""
+	Computes the length of the shortest path from every source to every target, and the elevation gain along it.
+	Without a contraction hierarchy, one Dijkstra search per source (stopped once every target is settled) gives
+	its whole row. With one, the rows come from bucket-based many-to-many queries: an upward search from every
+	target leaves its distances in buckets at the nodes it settles, and an upward search from every source finds
+	its distance to every target by scanning the buckets of the nodes it settles.
+
+	params:
+		graph: networkx multidigraph or CompiledGraph
+		sources: list of node IDs
+		targets: list of node IDs
+		use_hierarchy: bool - if True, use the graph's contraction hierarchy (None to use it when the graph has one)
+
+	return: (lengths, elevation_gains), two numpy arrays of shape (len(sources), len(targets)), with inf lengths
+		and nan elevation gains for the pairs without a path
+	"""
+	compiled = compile_graph(graph)
+	source_indices = [compiled.index_of(node) for node in sources]
+	target_indices = [compiled.index_of(node) for node in targets]
+
+	if use_hierarchy is None:
+		use_hierarchy = compiled.contraction_hierarchy is not None
+	if use_hierarchy:
+		if compiled.contraction_hierarchy is None:
+			raise ValueError("The graph has no contraction hierarchy.")
+		return _get_hierarchy_matrix(compiled, source_indices, target_indices)
+
+	lengths = np.empty((len(sources), len(targets)))
+	elevation_gains = np.empty((len(sources), len(targets)))
+	for i, source in enumerate(source_indices):
+		lengths[i], elevation_gains[i] = get_one_to_many(compiled, source, target_indices)
+	return lengths, elevation_gains
+
+def get_one_to_many(compiled, source, targets):
+	"""
+	Runs Dijkstra's algorithm from `source` until every target is settled, summing the elevation gain along the
+	shortest path tree as it grows.
+
+	params:
+		compiled: CompiledGraph
+		source: int - node index
+		targets: list of node indices
+
+	return: (lengths, elevation_gains), two numpy arrays with an entry per target
+	"""
+	adjacency = compiled.adjacency()
+	distances = {source: 0}
+	gains = {source: 0}
+	settled = set()
+	remaining = set(targets)
+	queue = [(0, source)]
+
+	while queue and remaining:
+		distance, current_node = heapq.heappop(queue)
+		if current_node in settled:
+			continue
+		settled.add(current_node)
+		remaining.discard(current_node)
+
+		for next_node, length, elevation_gain in adjacency[current_node]:
+			new_distance = distance + length
+			if new_distance < distances.get(next_node, float("inf")):
+				distances[next_node] = new_distance
+				gains[next_node] = gains[current_node] + elevation_gain
+				heapq.heappush(queue, (new_distance, next_node))
+
+	lengths = np.array([distances[target] if target in settled else np.inf for target in targets], dtype=np.float64)
+	elevation_gains = np.array([gains[target] if target in settled else np.nan for target in targets], dtype=np.float64)
+	return lengths, elevation_gains
+
+def get_parallel_distance_matrix(filename, sources, targets, workers=None, use_hierarchy=None):
+	"""
+	Computes the matrix of `get_distance_matrix` for a cached map, splitting the sources between the worker
+	processes of a QueryExecutor, which attach to the compiled copy of the map.
+
+	params:
+		filename: path of the pickle file of a cached map with a compiled copy
+		sources: list of node IDs
+		targets: list of node IDs
+		workers: int - number of worker processes (None for one per core)
+		use_hierarchy: bool - if True, use the map's contraction hierarchy (None to use it when the map has one)
+
+	return: (lengths, elevation_gains), two numpy arrays of shape (len(sources), len(targets))
+	"""
+	lengths = np.empty((len(sources), len(targets)))
+	elevation_gains = np.empty((len(sources), len(targets)))
+
+	with QueryExecutor(filename, workers) as executor:
+		#a few chunks per worker balance the load, while every chunk of a hierarchy query searches up from every target once
+		chunk_size = max(1, -(-len(sources) // (2 * executor.workers)))
+		futures = [(start, executor.submit_function(get_distance_matrix, sources[start:start + chunk_size], targets, use_hierarchy))
+			for start in range(0, len(sources), chunk_size)]
+
+		for start, future in futures:
+			chunk_lengths, chunk_elevation_gains = future.result()
+			lengths[start:start + len(chunk_lengths)] = chunk_lengths
+			elevation_gains[start:start + len(chunk_lengths)] = chunk_elevation_gains
+
+	return lengths, elevation_gains
+
+def _get_hierarchy_matrix(compiled, sources, targets):
+	hierarchy = compiled.contraction_hierarchy
+
+	#buckets[v] holds (target column, distance from v to the target) for every target whose upward search settled v
+	buckets = {}
+	backward_trees = []
+	for j, target in enumerate(targets):
+		distances, previous_nodes = hierarchy.upward_search(target, backward=True)
+		backward_trees.append(previous_nodes)
+		for node, distance in distances.items():
+			buckets.setdefault(node, []).append((j, distance))
+
+	lengths = np.full((len(sources), len(targets)), np.inf)
+	elevation_gains = np.full((len(sources), len(targets)), np.nan)
+	edge_costs = {}
+	for i, source in enumerate(sources):
+		distances, previous_nodes = hierarchy.upward_search(source)
+
+		best_distances = [float("inf")] * len(targets)
+		meeting_nodes = [-1] * len(targets)
+		for node, distance in distances.items():
+			for j, target_distance in buckets.get(node, ()):
+				if distance + target_distance < best_distances[j]:
+					best_distances[j] = distance + target_distance
+					meeting_nodes[j] = node
+
+		#the length and elevation gain are summed over the original edges of the shortest path
+		for j, meeting_node in enumerate(meeting_nodes):
+			if meeting_node == -1:
+				continue
+			length, elevation_gain = 0, 0
+			for u, w in _get_packed_edges(previous_nodes, backward_trees[j], meeting_node):
+				if (u, w) not in edge_costs:
+					edge_costs[(u, w)] = _get_edge_costs(compiled, hierarchy, u, w)
+				length += edge_costs[(u, w)][0]
+				elevation_gain += edge_costs[(u, w)][1]
+			lengths[i, j] = length
+			elevation_gains[i, j] = elevation_gain
+
+	return lengths, elevation_gains
+
+def _get_packed_edges(forward_previous_nodes, backward_previous_nodes, meeting_node):
+	#the hierarchy edges of the route through meeting_node, in the direction of travel
+	forward = []
+	current_node = meeting_node
+	while forward_previous_nodes[current_node] != -1:
+		forward.append((forward_previous_nodes[current_node], current_node))
+		current_node = forward_previous_nodes[current_node]
+	forward.reverse()
+
+	current_node = meeting_node
+	while backward_previous_nodes[current_node] != -1:
+		forward.append((current_node, backward_previous_nodes[current_node]))
+		current_node = backward_previous_nodes[current_node]
+	return forward
+
+def _get_edge_costs(compiled, hierarchy, u, w):
+	#(length, elevation gain) of a hierarchy edge, summed over the original edges it shortcuts
+	adjacency = compiled.adjacency()
+	path = hierarchy.unpack_edge(u, w)
+
+	length, elevation_gain = 0, 0
+	for i in range(len(path) - 1):
+		for next_node, edge_length, edge_elevation_gain in adjacency[path[i]]:
+			if next_node == path[i + 1]:
+				length += edge_length
+				elevation_gain += edge_elevation_gain
+				break
+	return length, elevation_gain
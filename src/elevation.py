@@ -0,0 +1,376 @@
+import os
+import json
+import math
+import sqlite3
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+OPEN_ELEVATION_API = "https://api.open-elevation.com/api/v1/lookup"
+
+#SRTM tiles mark samples without data with this value
+SRTM_VOID = -32768
+
+#the elevation cache groups coordinates into tiles of this many degrees, so looking up a city reads a few hundred
+#small tiles instead of one row at a time
+CACHE_TILE_SIZE = 0.01
+
+#coordinates are cached rounded to 1e-7 degrees (about 1cm), the precision OSM stores them with
+CACHE_PRECISION = 10 ** 7
+
+#responses worth retrying: the request was too large, the server is rate limiting us or is temporarily failing
+RETRY_STATUS_CODES = {408, 413, 429, 500, 502, 503, 504}
+
+class ElevationError(Exception):
+	"""
+		Raised when elevations cannot be looked up, e.g. because a batch still fails after all its retries.
+	"""
+	pass
+
+class OpenElevationProvider:
+	"""
+		OpenElevationProvider looks up elevations with the Open Elevation API (or any server with the same
+		`/lookup` interface). Batches of locations are posted by a pool of worker threads sharing one pooled HTTP
+		session. Failed batches are retried with exponential backoff, and the batch size adapts: it grows after
+		every successful batch and is halved after every failure, so the fetcher settles on the largest batch the
+		server accepts. With a checkpoint file, every finished batch is saved to disk, so an interrupted lookup
+		resumes where it stopped.
+	"""
+
+	source = "open-elevation"
+
+	def __init__(self, api=OPEN_ELEVATION_API, workers=4, batch_size=100, min_batch_size=10, max_batch_size=1000, max_retries=5, backoff=1.0, timeout=30, checkpoint_filename=None):
+		"""
+		params:
+			api: string - URL of the lookup endpoint
+			workers: int - number of batches posted concurrently
+			batch_size: int - number of locations in the first batches
+			min_batch_size: int - the batch size is never halved below this
+			max_batch_size: int - the batch size never grows above this
+			max_retries: int - number of times a failing batch is retried before giving up
+			backoff: float - seconds waited before the first retry, doubled for every retry after it
+			timeout: float - seconds to wait for a response
+			checkpoint_filename: path of the file progress is saved to (None to not save progress)
+		"""
+		self.api = api
+		self.workers = workers
+		self.batch_size = batch_size
+		self.min_batch_size = min_batch_size
+		self.max_batch_size = max_batch_size
+		self.max_retries = max_retries
+		self.backoff = backoff
+		self.timeout = timeout
+		self.checkpoint_filename = checkpoint_filename
+
+		self._lock = threading.Lock()
+		self._session = None
+
+	def get_elevations(self, latitudes, longitudes):
+		"""
+		Looks up the elevation of every location.
+
+		params:
+			latitudes: list of floats
+			longitudes: list of floats
+
+		return: list of floats, elevations in meters
+		"""
+		locations = list(zip(latitudes, longitudes))
+		results = self._load_checkpoint()
+
+		pending = deque(location for location in dict.fromkeys(locations) if location not in results)
+		if pending:
+			self._fetch(pending, results)
+
+		return [results[location] for location in locations]
+
+	def _fetch(self, pending, results):
+		errors = []
+
+		def work():
+			while True:
+				with self._lock:
+					if errors or not pending:
+						return
+					batch = [pending.popleft() for _ in range(min(self.batch_size, len(pending)))]
+
+				try:
+					elevations = self._fetch_batch(batch, pending)
+				except Exception as error:
+					with self._lock:
+						errors.append(error)
+					return
+
+				with self._lock:
+					for location, elevation in zip(batch, elevations):
+						results[location] = elevation
+					self._save_checkpoint(batch, elevations)
+
+		self._session = _get_session(self.workers)
+		try:
+			with ThreadPoolExecutor(max_workers=self.workers) as executor:
+				for _ in range(self.workers):
+					executor.submit(work)
+		finally:
+			self._session.close()
+			self._session = None
+
+		if errors:
+			raise errors[0]
+
+	def _fetch_batch(self, batch, pending):
+		attempt = 0
+		while True:
+			response = None
+			try:
+				response = self._session.post(self.api, json={"locations": [{"latitude": latitude, "longitude": longitude} for latitude, longitude in batch]}, timeout=self.timeout)
+			except (requests.ConnectionError, requests.Timeout):
+				pass
+			else:
+				if response.status_code == 200:
+					elevations = [result["elevation"] for result in response.json()["results"]]
+					if len(elevations) != len(batch):
+						raise ElevationError("Expected {} elevations but got {}.".format(len(batch), len(elevations)))
+					self._grow_batch_size(len(batch))
+					return elevations
+				if response.status_code not in RETRY_STATUS_CODES:
+					raise ElevationError("Elevation lookup failed with status {}.".format(response.status_code))
+
+			attempt += 1
+			if attempt > self.max_retries:
+				raise ElevationError("Elevation lookup still failed after {} retries.".format(self.max_retries))
+
+			#retry with a smaller batch and hand the rest back to the other workers
+			with self._lock:
+				self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+				if len(batch) > self.batch_size:
+					pending.extendleft(reversed(batch[self.batch_size:]))
+					del batch[self.batch_size:]
+
+			time.sleep(self._get_backoff(attempt, response))
+
+	def _grow_batch_size(self, size):
+		with self._lock:
+			#only grow once batches of the current size succeed
+			if size >= self.batch_size:
+				self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 2))
+
+	def _get_backoff(self, attempt, response):
+		backoff = self.backoff * 2 ** (attempt - 1)
+		retry_after = response.headers.get("Retry-After") if response is not None else None
+		if retry_after is not None:
+			try:
+				backoff = max(backoff, float(retry_after))
+			except ValueError:
+				pass
+		return backoff
+
+	def _load_checkpoint(self):
+		results = {}
+		if self.checkpoint_filename is None or not os.path.exists(self.checkpoint_filename):
+			return results
+
+		with open(self.checkpoint_filename) as file:
+			lines = file.read().split("\n")
+
+		saved_lines = []
+		for line in lines:
+			try:
+				batch = json.loads(line)
+			except ValueError:
+				#the last line is incomplete if the lookup was interrupted while saving it
+				continue
+			for latitude, longitude, elevation in batch:
+				results[(latitude, longitude)] = elevation
+			saved_lines.append(line)
+
+		#drop incomplete lines so the batches saved after them start on a line of their own
+		if len(saved_lines) != len([line for line in lines if line]):
+			with open(self.checkpoint_filename, "w") as file:
+				file.write("".join(line + "\n" for line in saved_lines))
+
+		return results
+
+	def _save_checkpoint(self, batch, elevations):
+		if self.checkpoint_filename is None:
+			return
+
+		with open(self.checkpoint_filename, "a") as file:
+			file.write(json.dumps([[latitude, longitude, elevation] for (latitude, longitude), elevation in zip(batch, elevations)]) + "\n")
+
+class SRTMElevationProvider:
+	"""
+		SRTMElevationProvider looks up elevations offline in SRTM height tiles (`.hgt` files, e.g. N40W106.hgt for
+		the 1 x 1 degree tile whose south west corner is at 40N 106W) stored in a local directory. A tile is a square
+		grid of big-endian 16-bit elevations in meters (1201 x 1201 samples for SRTM3, 3601 x 3601 for SRTM1) that
+		starts at the north west corner, so it is memory mapped instead of read, and all the locations in a tile are
+		sampled with one vectorized bilinear interpolation.
+	"""
+
+	source = "srtm"
+
+	def __init__(self, directory):
+		"""
+		params:
+			directory: path of the directory containing the `.hgt` tiles
+		"""
+		self.directory = directory
+		self._tiles = {}
+
+	def get_elevations(self, latitudes, longitudes):
+		"""
+		Looks up the elevation of every location.
+
+		params:
+			latitudes: list of floats
+			longitudes: list of floats
+
+		return: list of floats, elevations in meters
+		"""
+		latitudes = np.asarray(latitudes, dtype=np.float64)
+		longitudes = np.asarray(longitudes, dtype=np.float64)
+		elevations = np.empty(len(latitudes), dtype=np.float64)
+
+		tile_latitudes = np.floor(latitudes).astype(np.int64)
+		tile_longitudes = np.floor(longitudes).astype(np.int64)
+		tiles, tile_indices = np.unique(np.stack((tile_latitudes, tile_longitudes), axis=1), axis=0, return_inverse=True)
+		tile_indices = tile_indices.reshape(-1)
+
+		for i, (tile_latitude, tile_longitude) in enumerate(tiles.tolist()):
+			in_tile = tile_indices == i
+			elevations[in_tile] = self._sample_tile(tile_latitude, tile_longitude, latitudes[in_tile], longitudes[in_tile])
+
+		return elevations.tolist()
+
+	def _sample_tile(self, tile_latitude, tile_longitude, latitudes, longitudes):
+		tile = self._get_tile(tile_latitude, tile_longitude)
+		last_sample = tile.shape[0] - 1
+
+		#rows go from north to south, columns from west to east
+		rows = np.clip((tile_latitude + 1 - latitudes) * last_sample, 0, last_sample)
+		columns = np.clip((longitudes - tile_longitude) * last_sample, 0, last_sample)
+		top = np.minimum(np.floor(rows).astype(np.int64), last_sample - 1)
+		left = np.minimum(np.floor(columns).astype(np.int64), last_sample - 1)
+		row_fractions = rows - top
+		column_fractions = columns - left
+
+		corners = [(top, left, (1 - row_fractions) * (1 - column_fractions)), (top, left + 1, (1 - row_fractions) * column_fractions),
+			(top + 1, left, row_fractions * (1 - column_fractions)), (top + 1, left + 1, row_fractions * column_fractions)]
+
+		#interpolate between the corners that have data only
+		total = np.zeros(len(latitudes), dtype=np.float64)
+		total_weight = np.zeros(len(latitudes), dtype=np.float64)
+		for corner_rows, corner_columns, weights in corners:
+			values = tile[corner_rows, corner_columns].astype(np.float64)
+			valid = values != SRTM_VOID
+			total += np.where(valid, values * weights, 0)
+			total_weight += np.where(valid, weights, 0)
+
+		#every sample around these locations is void
+		missing = total_weight == 0
+		if missing.any():
+			raise ElevationError("No elevation data near ({}, {}) in {}.".format(latitudes[missing][0], longitudes[missing][0], self._get_tile_filename(tile_latitude, tile_longitude)))
+
+		return total / total_weight
+
+	def _get_tile(self, tile_latitude, tile_longitude):
+		key = (tile_latitude, tile_longitude)
+		if key not in self._tiles:
+			filename = self._get_tile_filename(tile_latitude, tile_longitude)
+			if not os.path.exists(filename):
+				raise ElevationError("Missing SRTM tile {}.".format(filename))
+
+			samples = math.isqrt(os.path.getsize(filename) // 2)
+			if samples * samples * 2 != os.path.getsize(filename):
+				raise ElevationError("{} is not a square SRTM tile.".format(filename))
+
+			self._tiles[key] = np.memmap(filename, dtype=">i2", mode="r", shape=(samples, samples))
+		return self._tiles[key]
+
+	def _get_tile_filename(self, tile_latitude, tile_longitude):
+		name = "{}{:02d}{}{:03d}.hgt".format("N" if tile_latitude >= 0 else "S", abs(tile_latitude), "E" if tile_longitude >= 0 else "W", abs(tile_longitude))
+		return os.path.join(self.directory, name)
+
+class ElevationCache:
+	"""
+		ElevationCache stores looked up elevations in an SQLite database, so rebuilding a city (or building its
+		drive, bike and walk maps, or an overlapping neighbor city) only looks up coordinates it has not seen before.
+		Elevations are stored per provider source, keyed by coordinate tile and rounded coordinates. Reads fetch
+		whole tiles and writes are done in one transaction.
+	"""
+
+	def __init__(self, filename):
+		"""
+		params:
+			filename: path of the SQLite database, created if needed
+		"""
+		self.filename = filename
+
+		with self._connect() as connection:
+			connection.execute("CREATE TABLE IF NOT EXISTS elevations (source TEXT, tile_latitude INTEGER, tile_longitude INTEGER, latitude INTEGER, longitude INTEGER, elevation REAL, "
+				"PRIMARY KEY (source, tile_latitude, tile_longitude, latitude, longitude)) WITHOUT ROWID")
+
+	def get_elevations(self, source, latitudes, longitudes):
+		"""
+		Looks up cached elevations.
+
+		params:
+			source: string - the provider the elevations came from
+			latitudes: list of floats
+			longitudes: list of floats
+
+		return: list of floats, with None for every location that is not cached
+		"""
+		keys = [_get_cache_key(latitude, longitude) for latitude, longitude in zip(latitudes, longitudes)]
+
+		cached = {}
+		with self._connect() as connection:
+			for tile in set((tile_latitude, tile_longitude) for tile_latitude, tile_longitude, _, _ in keys):
+				rows = connection.execute("SELECT latitude, longitude, elevation FROM elevations WHERE source = ? AND tile_latitude = ? AND tile_longitude = ?", (source,) + tile)
+				for latitude, longitude, elevation in rows:
+					cached[(latitude, longitude)] = elevation
+
+		return [cached.get((latitude, longitude)) for _, _, latitude, longitude in keys]
+
+	def add_elevations(self, source, latitudes, longitudes, elevations):
+		"""
+		Stores looked up elevations.
+
+		params:
+			source: string - the provider the elevations came from
+			latitudes: list of floats
+			longitudes: list of floats
+			elevations: list of floats
+		"""
+		rows = [(source,) + _get_cache_key(latitude, longitude) + (elevation,) for latitude, longitude, elevation in zip(latitudes, longitudes, elevations)]
+
+		with self._connect() as connection:
+			connection.executemany("INSERT OR REPLACE INTO elevations VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+	@contextmanager
+	def _connect(self):
+		connection = sqlite3.connect(self.filename)
+		try:
+			#commits on success and rolls back on errors
+			with connection:
+				yield connection
+		finally:
+			connection.close()
+
+def _get_cache_key(latitude, longitude):
+	latitude = round(latitude * CACHE_PRECISION)
+	longitude = round(longitude * CACHE_PRECISION)
+	tile_size = round(CACHE_TILE_SIZE * CACHE_PRECISION)
+	return (latitude // tile_size, longitude // tile_size, latitude, longitude)
+
+def _get_session(workers):
+	session = requests.Session()
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
@@ -0,0 +1,274 @@
+import re
+import sys
+import time
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+import osmnx
+
+sys.path.insert(0, '.')
+from src.osm_extract import iterate_elements
+
+#number of geocoded addresses kept in memory
+GEOCODE_CACHE_SIZE = 1024
+
+#Nominatim allows at most one request per second
+NOMINATIM_INTERVAL = 1.0
+
+#gazetteer names that point to places further apart than this (in degrees) are ambiguous and left out
+GAZETTEER_TOLERANCE = 0.001
+
+#the spelling every common street word is normalized to
+ABBREVIATIONS = {
+	"street": "st", "avenue": "ave", "av": "ave", "road": "rd", "boulevard": "blvd", "drive": "dr", "lane": "ln",
+	"court": "ct", "place": "pl", "parkway": "pkwy", "highway": "hwy", "circle": "cir", "terrace": "ter",
+	"square": "sq", "trail": "trl", "north": "n", "south": "s", "east": "e", "west": "w",
+	"northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+}
+
+def normalize_address(address):
+	"""
+	Normalizes an address so different spellings of it share a cache entry: lower case, no punctuation other
+	than the commas between its parts, single spaces and abbreviated street words ("Main Street" and "main st."
+	are the same).
+
+	params:
+		address: string
+
+	return: string
+	"""
+	address = unicodedata.normalize("NFKC", address).lower()
+	address = re.sub(r"[^\w\s,#-]", " ", address)
+
+	parts = []
+	for part in address.split(","):
+		words = [ABBREVIATIONS.get(word, word) for word in part.split()]
+		if words:
+			parts.append(" ".join(words))
+	return ", ".join(parts)
+
+class Geocoder:
+	"""
+		Geocoder turns addresses into coordinates, trying the fastest source first: an in-memory LRU cache, then
+		an SQLite database with the gazetteer (addresses and named places read from a local OSM extract) and every
+		address looked up online before (including the ones that were not found), and only then Nominatim.
+		Addresses are normalized before they are looked up, and an address that is not in the gazetteer matches
+		its longest leading part that is (so "12 First St, Town, CO, USA" matches "12 first st, town").
+	"""
+
+	def __init__(self, filename=None, geocode=osmnx.geocoder.geocode, cache_size=GEOCODE_CACHE_SIZE, min_interval=NOMINATIM_INTERVAL):
+		"""
+		params:
+			filename: path of the SQLite database, created if needed (None to only cache in memory)
+			geocode: function - looks up one address online and returns (latitude, longitude), raising a
+				ValueError if it is not found
+			cache_size: int - number of addresses kept in memory
+			min_interval: float - minimum number of seconds between two online lookups
+		"""
+		self.filename = filename
+		self.geocode_online = geocode
+		self.cache_size = cache_size
+		self.min_interval = min_interval
+
+		self._cache = OrderedDict()
+		self._lock = threading.Lock()
+		self._last_request = 0.0
+
+		if filename is not None:
+			with self._connect() as connection:
+				connection.execute("CREATE TABLE IF NOT EXISTS geocodes (query TEXT PRIMARY KEY, latitude REAL, longitude REAL) WITHOUT ROWID")
+				connection.execute("CREATE TABLE IF NOT EXISTS gazetteer (name TEXT PRIMARY KEY, latitude REAL, longitude REAL) WITHOUT ROWID")
+
+	def geocode(self, address):
+		"""
+		Finds the coordinates of an address.
+
+		params:
+			address: string
+
+		return: (latitude, longitude)
+		"""
+		location = self.geocode_many([address])[0]
+		if location is None:
+			raise ValueError("Could not geocode {}.".format(address))
+		return location
+
+	def geocode_many(self, addresses):
+		"""
+		Finds the coordinates of many addresses. Each distinct address is looked up once, the cached ones in a
+		single database query, and only the rest online.
+
+		params:
+			addresses: list of strings
+
+		return: list of (latitude, longitude), with None for every address that was not found
+		"""
+		queries = [normalize_address(address) for address in addresses]
+
+		locations = {}
+		with self._lock:
+			for query in queries:
+				if query in self._cache:
+					self._cache.move_to_end(query)
+					locations[query] = self._cache[query]
+
+		missing = [query for query in dict.fromkeys(queries) if query not in locations]
+		if missing and self.filename is not None:
+			locations.update(self._get_stored_locations(missing))
+
+		for query in missing:
+			if query not in locations:
+				locations[query] = self._geocode_online(query, addresses[queries.index(query)])
+
+		with self._lock:
+			for query in missing:
+				self._cache[query] = locations[query]
+				self._cache.move_to_end(query)
+			while len(self._cache) > self.cache_size:
+				self._cache.popitem(last=False)
+
+		return [locations[query] for query in queries]
+
+	def add_gazetteer(self, entries):
+		"""
+		Stores gazetteer entries, replacing any with the same name.
+
+		params:
+			entries: dict of normalized name to (latitude, longitude)
+
+		return: int, the number of entries stored
+		"""
+		with self._connect() as connection:
+			connection.executemany("INSERT OR REPLACE INTO gazetteer VALUES (?, ?, ?)", [(name, latitude, longitude) for name, (latitude, longitude) in entries.items()])
+		return len(entries)
+
+	def _get_stored_locations(self, queries):
+		#the stored online lookup of every query, or else its longest leading part that is in the gazetteer
+		candidates = {query: _get_gazetteer_candidates(query) for query in queries}
+		names = list(dict.fromkeys(name for query in queries for name in candidates[query]))
+
+		gazetteer = {}
+		geocodes = {}
+		with self._connect() as connection:
+			for start in range(0, len(queries), 500):
+				chunk = queries[start:start + 500]
+				parameters = ", ".join("?" * len(chunk))
+				for query, latitude, longitude in connection.execute("SELECT query, latitude, longitude FROM geocodes WHERE query IN ({})".format(parameters), chunk):
+					geocodes[query] = None if latitude is None else (latitude, longitude)
+			for start in range(0, len(names), 500):
+				chunk = names[start:start + 500]
+				parameters = ", ".join("?" * len(chunk))
+				for name, latitude, longitude in connection.execute("SELECT name, latitude, longitude FROM gazetteer WHERE name IN ({})".format(parameters), chunk):
+					gazetteer[name] = (latitude, longitude)
+
+		locations = {}
+		for query in queries:
+			if query in geocodes:
+				locations[query] = geocodes[query]
+				continue
+			name = next((name for name in candidates[query] if name in gazetteer), None)
+			if name is not None:
+				locations[query] = gazetteer[name]
+		return locations
+
+	def _geocode_online(self, query, address):
+		with self._lock:
+			wait = self._last_request + self.min_interval - time.monotonic()
+			if wait > 0:
+				time.sleep(wait)
+			self._last_request = time.monotonic()
+
+		try:
+			latitude, longitude = self.geocode_online(address)
+			location = (float(latitude), float(longitude))
+		except ValueError:
+			#addresses that were not found are stored too, so they are not looked up again
+			location = None
+
+		if self.filename is not None:
+			with self._connect() as connection:
+				connection.execute("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?)", (query,) + (location or (None, None)))
+		return location
+
+	@contextmanager
+	def _connect(self):
+		connection = sqlite3.connect(self.filename)
+		try:
+			#commits on success and rolls back on errors
+			with connection:
+				yield connection
+		finally:
+			connection.close()
+
+def read_gazetteer(osm_filename):
+	"""
+	Reads the gazetteer of a local OSM XML extract with a streaming parser: every node or way with an address
+	(`addr:housenumber` and `addr:street`) or a name, other than streets, by its normalized address or name,
+	followed by its `addr:city` if it has one. Ways are located at the mean of their nodes. Names shared by places far apart
+	are left out, since they cannot be told apart.
+
+	params:
+		osm_filename: path of the OSM XML file (`.osm` or `.osm.bz2`)
+
+	return: dict of normalized name to (latitude, longitude)
+	"""
+	way_names = []
+	way_offsets = array("q", [0])
+	refs = array("q")
+	for element in iterate_elements(osm_filename, "way"):
+		names = _get_gazetteer_names({tag.get("k"): tag.get("v") for tag in element.iter("tag")}, is_way=True)
+		if names:
+			way_names.append(names)
+			refs.extend(int(nd.get("ref")) for nd in element.iter("nd"))
+			way_offsets.append(len(refs))
+
+	referenced_nodes = set(refs)
+	coordinates = {}
+	locations = {}
+	for element in iterate_elements(osm_filename, "node"):
+		node = int(element.get("id"))
+		latitude, longitude = float(element.get("lat")), float(element.get("lon"))
+		if node in referenced_nodes:
+			coordinates[node] = (latitude, longitude)
+
+		for name in _get_gazetteer_names({tag.get("k"): tag.get("v") for tag in element.iter("tag")}, is_way=False):
+			locations.setdefault(name, []).append((latitude, longitude))
+
+	for i, names in enumerate(way_names):
+		points = [coordinates[node] for node in refs[way_offsets[i]:way_offsets[i + 1]] if node in coordinates]
+		if not points:
+			continue
+		location = (sum(point[0] for point in points) / len(points), sum(point[1] for point in points) / len(points))
+		for name in names:
+			locations.setdefault(name, []).append(location)
+
+	gazetteer = {}
+	for name, points in locations.items():
+		latitudes = [point[0] for point in points]
+		longitudes = [point[1] for point in points]
+		if max(latitudes) - min(latitudes) <= GAZETTEER_TOLERANCE and max(longitudes) - min(longitudes) <= GAZETTEER_TOLERANCE:
+			gazetteer[name] = points[0]
+	return gazetteer
+
+def _get_gazetteer_names(tags, is_way):
+	names = []
+	if "addr:housenumber" in tags and "addr:street" in tags:
+		names.append(normalize_address("{} {}".format(tags["addr:housenumber"], tags["addr:street"])))
+	if "name" in tags and not (is_way and "highway" in tags):
+		names.append(normalize_address(tags["name"]))
+
+	names = [name for name in names if name]
+	#places with a city are only stored with it, so they never match an address in another city
+	city = normalize_address(tags.get("addr:city", ""))
+	if city:
+		names = [name + ", " + city for name in names]
+	return names
+
+def _get_gazetteer_candidates(query):
+	#the leading parts of a query that can match a gazetteer name, longest first: if the query names a city (its
+	#second part), every candidate keeps it, otherwise the query itself is the only candidate
+	parts = query.split(", ")
+	return [", ".join(parts[:count]) for count in range(len(parts), min(len(parts), 2) - 1, -1)]
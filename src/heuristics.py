@@ -0,0 +1,112 @@
+import sys
+import weakref
+import numpy as np
+
+sys.path.insert(0, '.')
+from src.compiled_graph import SnappedGraph
+from src.shortest_distance import get_reverse_tree
+
+#mean earth radius in meters, the same value osmnx uses for edge lengths
+EARTH_RADIUS = 6371009
+
+def haversine_distances(x, y, target_x, target_y):
+	"""
+	Computes the great-circle distance between many points and one target point in a single vectorized call.
+
+	params:
+		x: numpy array of floats - longitudes of the points
+		y: numpy array of floats - latitudes of the points
+		target_x: float - longitude of the target
+		target_y: float - latitude of the target
+
+	return: numpy array of floats, distances in meters
+	"""
+	y_radians = np.radians(y)
+	target_y_radians = np.radians(target_y)
+	half_delta_y = (target_y_radians - y_radians) / 2
+	half_delta_x = np.radians(target_x - x) / 2
+
+	a = np.sin(half_delta_y) ** 2 + np.cos(y_radians) * np.cos(target_y_radians) * np.sin(half_delta_x) ** 2
+	return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+_distance_scales = weakref.WeakKeyDictionary()
+
+def get_distance_scale(compiled):
+	"""
+	Finds the largest factor s <= 1 such that s * (great-circle distance) never exceeds the length of any edge in
+	`compiled`. Scaling the great-circle distance by s keeps it an admissible and consistent lower bound even when
+	edge lengths were rounded or the node coordinates are not real longitudes and latitudes. Computed once per graph.
+
+	params:
+		compiled: CompiledGraph
+
+	return: float
+	"""
+	scale = _distance_scales.get(compiled)
+	if scale is None:
+		sources = np.repeat(np.arange(compiled.node_count), np.diff(compiled.offsets))
+		targets = compiled.targets
+
+		straight_distances = np.empty(len(targets), dtype=np.float64)
+		for start in range(0, len(targets), 1 << 16):
+			end = start + (1 << 16)
+			edge_sources = sources[start:end]
+			edge_targets = targets[start:end]
+			y_radians = np.radians(compiled.y[edge_sources])
+			target_y_radians = np.radians(compiled.y[edge_targets])
+			a = np.sin((target_y_radians - y_radians) / 2) ** 2 + np.cos(y_radians) * np.cos(target_y_radians) * np.sin(np.radians(compiled.x[edge_targets] - compiled.x[edge_sources]) / 2) ** 2
+			straight_distances[start:end] = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+		with np.errstate(divide="ignore", invalid="ignore"):
+			ratios = compiled.lengths / straight_distances
+		ratios = ratios[straight_distances > 0]
+
+		scale = 1.0
+		if len(ratios) > 0 and not np.isnan(ratios).all():
+			scale = float(min(1.0, np.nanmin(ratios)))
+		_distance_scales[compiled] = scale
+	return scale
+
+def geometric_lower_bounds(compiled, target):
+	"""
+	Computes a lower bound on the remaining distance from every node to `target` from the node coordinates: the
+	great-circle distance, scaled by `get_distance_scale`. Nodes without coordinates get a bound of 0.
+
+	params:
+		compiled: CompiledGraph
+		target: int - node index of the end location
+
+	return: numpy array of floats, indexed by node index
+	"""
+	bounds = get_distance_scale(compiled) * haversine_distances(compiled.x, compiled.y, compiled.x[target], compiled.y[target])
+	bounds[np.isnan(bounds)] = 0
+	return bounds
+
+def get_lower_bounds(compiled, target, method):
+	"""
+	Computes a lower bound on the remaining distance from every node to `target`.
+
+	params:
+		compiled: CompiledGraph
+		target: int - node index of the end location
+		method: string - "exact" for the exact remaining distance (one reverse Dijkstra run, cached), "haversine"
+			for the scaled great-circle distance, or "landmarks" for the best of the landmark (ALT) bound and the
+			great-circle distance (requires landmarks attached to `compiled`, or a ValueError is raised)
+
+	return: list of floats, indexed by node index
+	"""
+	if method == "exact":
+		return get_reverse_tree(compiled, target).distance_list()
+	if method == "landmarks" and compiled.landmarks is None:
+		raise ValueError("Landmark lower bounds need landmarks attached to the map; build them with `python src/map.py --landmarks <cached map>`.")
+
+	#the bounds of a snapped view come from the bounds of its base graph
+	if isinstance(compiled, SnappedGraph):
+		return compiled.extend_lower_bounds(target, lambda base_target: _get_estimated_lower_bounds(compiled.base, base_target, method))
+	return _get_estimated_lower_bounds(compiled, target, method).tolist()
+
+def _get_estimated_lower_bounds(compiled, target, method):
+	bounds = geometric_lower_bounds(compiled, target)
+	if method == "landmarks":
+		bounds = np.maximum(bounds, compiled.landmarks.lower_bounds_to(target))
+	return bounds
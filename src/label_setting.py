@@ -0,0 +1,144 @@
+import heapq
+from array import array
+
+#memory a label-setting search can use for its labels, and the most a label takes: its node, parent and signature
+#(8 bytes each in flat arrays) and, while it is queued, its heap entry (a tuple of two floats and an int, 148 bytes)
+LABEL_MEMORY_BUDGET = 512 << 20
+LABEL_SIZE = 172
+
+#default limit on the number of labels of a search
+MAX_LABELS = LABEL_MEMORY_BUDGET // LABEL_SIZE
+
+class LabelLimitError(RuntimeError):
+	"""
+		LabelLimitError is raised when a label-setting search reaches its label limit before it is done, so its
+		result may not be optimal. `result` holds the best result found before the limit was reached.
+	"""
+
+	def __init__(self, message, result=None):
+		super().__init__(message)
+		self.result = result
+
+	def __reduce__(self):
+		#raised in the worker processes of a QueryExecutor too, so it has to survive pickling
+		return (LabelLimitError, (str(self), self.result))
+
+def label_setting_search(compiled, source, target, max_length, remaining_distances, objective, max_labels=None):
+	"""
+	Solves the resource constrained shortest path problem from source to target: optimize the elevation gain of the
+	route (the objective) while keeping its length (the resource) within max_length.
+
+	Each label is a partial route, stored as (node, previous label). Labels are settled in order of increasing
+	length, so a label is dominated as soon as an earlier settled label at the same node has an objective at
+	least as good; only the labels on each node's Pareto front of (length, elevation gain) are ever extended.
+	Labels that cannot reach the target within max_length (using the exact remaining distance of every node) are
+	never created.
+
+	Elevation gain never decreases along a route, so for "minimize" revisiting a node can never help and the
+	result is exact. For "maximize" labels are kept elementary (a route never revisits a node), which makes
+	dominance a heuristic: a dominated label may have visited a different set of nodes, so a better route can be
+	missed. Whether a label visits a node is first checked against a 64-bit signature of the nodes on its route,
+	so the route itself is only walked when the node may be on it.
+
+	params:
+		compiled: CompiledGraph - the area we are searching in
+		source: int - node index of the start location
+		target: int - node index of the end location
+		max_length: float - the longest route allowed
+		remaining_distances: list of floats - shortest distance from every node to target
+		objective: string - "minimize", "maximize" or "both" (keep the Pareto fronts of both)
+		max_labels: int - stop creating labels once this many exist (None for no limit)
+
+	return: (routes, truncated) - routes is a list of (length, elevation gain, list of node indices), the routes
+		reaching target in order of increasing length, each with a better objective than all shorter ones;
+		truncated is True if labels were left out because of max_labels, so better routes may have been missed
+	"""
+	adjacency = compiled.adjacency()
+	node_elevations = compiled.elevations.tolist()
+	target_elevation = node_elevations[target]
+	node_count = compiled.node_count
+	budget = max_length
+
+	minimize = objective in ("minimize", "both")
+	maximize = objective in ("maximize", "both")
+
+	#best elevation gain of a settled label at each node, for each objective
+	min_gains = [float("inf")] * node_count
+	max_gains = [float("-inf")] * node_count
+
+	#labels are stored in flat arrays to keep memory bounded on large graphs
+	label_nodes = array("q", [source])
+	label_parents = array("q", [-1])
+	label_signatures = array("Q", [1 << (source & 63)])
+	truncated = False
+
+	#queue element stores (length of the route, elevation gain of the route, label)
+	queue = [(0, 0, 0)]
+
+	routes = []
+	best_min_gain = float("inf")
+
+	while queue:
+		distance, gain, label = heapq.heappop(queue)
+		current_node = label_nodes[label]
+
+		improves_min = minimize and gain < min_gains[current_node]
+		improves_max = maximize and gain > max_gains[current_node]
+		if not improves_min and not improves_max:
+			continue
+		if improves_min:
+			min_gains[current_node] = gain
+		if improves_max:
+			max_gains[current_node] = gain
+
+		if current_node == target:
+			routes.append((distance, gain, _get_label_path(label_nodes, label_parents, label)))
+			if improves_min:
+				best_min_gain = gain
+			continue
+
+		if max_labels is not None and len(label_nodes) >= max_labels:
+			truncated = True
+			continue
+
+		for next_node, distance_to_next_node, elevation_to_next_node in adjacency[current_node]:
+			total_new_distance = distance + distance_to_next_node
+
+			#the route can no longer reach the end within max length
+			if total_new_distance + remaining_distances[next_node] > budget:
+				continue
+
+			total_elevation = gain + elevation_to_next_node
+
+			#the route is dominated by a label already settled at the next node, or (for "minimize") can no longer
+			#beat the best route found, since the climb left to the end is at least the elevation difference
+			keep_for_min = minimize and total_elevation < min_gains[next_node] and total_elevation + max(0, target_elevation - node_elevations[next_node]) < best_min_gain
+			keep_for_max = maximize and total_elevation > max_gains[next_node]
+			if not keep_for_min and not keep_for_max:
+				continue
+
+			signature = label_signatures[label] | (1 << (next_node & 63))
+			if maximize and signature == label_signatures[label] and _label_visits(label_nodes, label_parents, label, next_node):
+				continue
+
+			label_nodes.append(next_node)
+			label_parents.append(label)
+			label_signatures.append(signature)
+			heapq.heappush(queue, (total_new_distance, total_elevation, len(label_nodes) - 1))
+
+	return routes, truncated
+
+def _label_visits(label_nodes, label_parents, label, node):
+	while label != -1:
+		if label_nodes[label] == node:
+			return True
+		label = label_parents[label]
+	return False
+
+def _get_label_path(label_nodes, label_parents, label):
+	path = []
+	while label != -1:
+		path.append(label_nodes[label])
+		label = label_parents[label]
+	path.reverse()
+	return path
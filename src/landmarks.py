@@ -0,0 +1,137 @@
+import sys
+import numpy as np
+
+sys.path.insert(0, '.')
+from src.shortest_distance import shortest_distance_tree
+
+class Landmarks:
+	"""
+		Landmarks holds the ALT (A*, landmarks, triangle inequality) preprocessing of a compiled graph: for a few
+		landmark nodes L, the shortest distance from L to every node and from every node to L. By the triangle
+		inequality, dist(v, t) >= dist(L, t) - dist(L, v) and dist(v, t) >= dist(v, L) - dist(t, L), so the
+		largest of these over all landmarks is a lower bound on the remaining distance from v to t.
+	"""
+
+	def __init__(self, node_ids, landmark_nodes, from_distances, to_distances):
+		"""
+		params:
+			node_ids: numpy array - node IDs of the compiled graph the landmarks were built for, in index order
+			landmark_nodes: numpy array of ints - node indices of the landmarks
+			from_distances: numpy array of floats (landmarks x nodes) - distance from each landmark to each node
+			to_distances: numpy array of floats (landmarks x nodes) - distance from each node to each landmark
+		"""
+		self.node_ids = node_ids
+		self.landmark_nodes = landmark_nodes
+		self.from_distances = from_distances
+		self.to_distances = to_distances
+
+	@property
+	def count(self):
+		"""
+		Number of landmarks.
+		"""
+		return len(self.landmark_nodes)
+
+	def lower_bound(self, node, target):
+		"""
+		Returns a lower bound on the shortest distance from `node` to `target` in O(number of landmarks).
+
+		params:
+			node: int - node index
+			target: int - node index
+
+		return: float (inf if `target` is provably unreachable from `node`)
+		"""
+		with np.errstate(invalid="ignore"):
+			forward = self.from_distances[:, target] - self.from_distances[:, node]
+			backward = self.to_distances[:, node] - self.to_distances[:, target]
+		bound = np.nanmax(np.concatenate((forward, backward, [0.0])))
+		return float(bound)
+
+	def lower_bounds_to(self, target):
+		"""
+		Returns a lower bound on the shortest distance from every node to `target`.
+
+		params:
+			target: int - node index
+
+		return: numpy array of floats, indexed by node index
+		"""
+		if self.count == 0:
+			return np.zeros(len(self.node_ids), dtype=np.float64)
+
+		with np.errstate(invalid="ignore"):
+			forward = self.from_distances[:, target][:, np.newaxis] - self.from_distances
+			backward = self.to_distances - self.to_distances[:, target][:, np.newaxis]
+		#inf - inf (a landmark that reaches neither node) says nothing about the distance
+		bounds = np.nan_to_num(np.fmax(forward, backward), nan=0.0, posinf=np.inf, neginf=0.0)
+		return np.maximum(bounds.max(axis=0), 0)
+
+	def matches(self, compiled):
+		"""
+		Checks that the landmarks were built for `compiled`.
+
+		params:
+			compiled: CompiledGraph
+
+		return: bool
+		"""
+		return len(self.node_ids) == compiled.node_count and np.array_equal(self.node_ids, compiled.node_ids)
+
+	def save(self, filename):
+		"""
+		Stores the landmarks in a `.npz` file next to the cached map.
+
+		params:
+			filename: path of the file
+		"""
+		with open(filename, "wb") as file:
+			np.savez(file, node_ids=self.node_ids, landmark_nodes=self.landmark_nodes, from_distances=self.from_distances, to_distances=self.to_distances)
+
+	@classmethod
+	def load(cls, filename):
+		"""
+		Loads landmarks stored by `save`.
+
+		params:
+			filename: path of the file
+
+		return: Landmarks
+		"""
+		with np.load(filename) as data:
+			return cls(data["node_ids"], data["landmark_nodes"], data["from_distances"], data["to_distances"])
+
+def build_landmarks(compiled, count=16, seed=0):
+	"""
+	Selects `count` landmarks with farthest-point selection (each new landmark is the node farthest from the ones
+	already chosen, which spreads them around the edge of the map where they give the tightest bounds) and computes
+	their forward and backward distance arrays. This runs 2 * count Dijkstra searches, so it is done offline.
+
+	params:
+		compiled: CompiledGraph
+		count: int - number of landmarks
+		seed: int - seed for picking the node the selection starts from
+
+	return: Landmarks
+	"""
+	count = min(count, compiled.node_count)
+	node_count = compiled.node_count
+
+	from_distances = np.empty((count, node_count), dtype=np.float64)
+	to_distances = np.empty((count, node_count), dtype=np.float64)
+	landmark_nodes = np.empty(count, dtype=np.int64)
+
+	#start from the node farthest from a random node; unreachable nodes are never picked
+	first_distances = shortest_distance_tree(compiled, int(np.random.default_rng(seed).integers(node_count))).distances
+	scores = np.where(np.isfinite(first_distances), first_distances, -1)
+
+	for i in range(count):
+		landmark = int(np.argmax(scores))
+		landmark_nodes[i] = landmark
+		from_distances[i] = shortest_distance_tree(compiled, landmark).distances
+		to_distances[i] = shortest_distance_tree(compiled, landmark, reverse=True).distances
+
+		scores = np.minimum(scores, np.where(np.isfinite(from_distances[i]), from_distances[i], -1))
+		scores[landmark_nodes[:i + 1]] = -1
+
+	return Landmarks(compiled.node_ids, landmark_nodes, from_distances, to_distances)
@@ -1,72 +1,669 @@
-import osmnx
+import os
 import pickle as pkl
 import networkx as nx
-import requests
+import numpy as np
 import sys
+import json
+import hashlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
-def download_map(place_query):
+sys.path.insert(0, '.')
+from src.compiled_graph import CompiledGraph, compile_graph, save_edge_geometry, GRAPH_ARRAYS
+from src.landmarks import Landmarks, build_landmarks
+from src.contraction_hierarchy import ContractionHierarchy, build_contraction_hierarchy
+from src.elevation import OpenElevationProvider, SRTMElevationProvider, ElevationCache
+from src.spatial_index import SpatialIndex, build_spatial_index
+
+#version of the compiled map format; maps registered with an older version have to be converted again
+SCHEMA_VERSION = 1
+
+MANIFEST_FILENAME = "manifest.json"
+
+#elevations looked up for every map in the cached maps directory, shared by all of them so no coordinate is looked up twice
+ELEVATION_CACHE_FILENAME = "elevations.sqlite"
+
+#geocoded addresses and the gazetteers of the OSM extracts maps were built from, shared by all maps in the cached maps directory
+GEOCODER_FILENAME = "geocodes.sqlite"
+
+def download_map(place_query, srtm_directory=None, osm_filename=None, directory="cached_maps"):
 	"""
-	Downloads a map for the specified location from the OSM API. Elevation data for each node in the map (networkx.MultiDiGraph)
-	is added from the Open Elevation API. Each edge has stores length (in meters) from node1 to node2.
-	This graph is stored in a pickle file in `/cached_maps`. 
+	Downloads a map for the specified location from the OSM API. The network of every way is downloaded once and the
+	drive, bike and walk maps (networkx.MultiDiGraph) are derived from it in parallel worker processes. Elevation data
+	for each node is added from the Open Elevation API, or offline from local SRTM tiles, looking up nodes shared by
+	several maps only once. Each edge has stores length (in meters) from node1 to node2.
+	Each graph is stored in a pickle file in `/cached_maps`, along with its compiled (memory mapped) copy and its landmark and
+	contraction hierarchy preprocessing, and is registered in the cache manifest. Maps built from a local OSM extract also
+	add its addresses and named places to the geocoder's gazetteer, so they can be geocoded offline.
 
 	params: 
 		place_query: dict of city, state, country
+		srtm_directory: path of a directory of SRTM `.hgt` tiles covering the location (None to use the Open Elevation API)
+		osm_filename: path of a local OSM XML extract (`.osm` or `.osm.bz2`) to build the maps from instead of downloading
+			them, streamed with bounded memory (None to download); needs `srtm_directory`, so the maps are built offline
+		directory: path of the cached maps directory
 	"""
-	transport_methods = ["drive", "bike", "walk"]
+	if osm_filename is not None and srtm_directory is None:
+		raise ValueError("Maps built from a local OSM extract need local elevations; pass a directory of SRTM tiles (--srtm).")
+
+	#building maps needs osmnx, which loading them (e.g. in the routing service) does not
+	from src.transport_networks import TRANSPORT_METHODS, download_superset_network, derive_networks
+	from src.osm_extract import build_networks
+
+	city = place_query["city"].lower()
+
 	try:
-		for transport_method in transport_methods:
-			graph = osmnx.graph_from_place(place_query, network_type=transport_method)
-			add_elevation_data(graph)
-			filename = "cached_maps/{}-{}.pkl".format(place_query["city"].lower(), transport_method)
-			pkl.dump(graph, open(filename, "wb"))
+		if osm_filename is not None:
+			graphs = build_networks(osm_filename, TRANSPORT_METHODS)
+		else:
+			graphs = derive_networks(download_superset_network(place_query), TRANSPORT_METHODS)
 	except ValueError:
 		print("No results for the specified location.")
+		return
+
+	#look up the elevation of every node once, even if it is in several maps
+	nodes = nx.MultiDiGraph()
+	for graph in graphs.values():
+		nodes.add_nodes_from(graph.nodes(data=True))
+
+	#save the lookup progress so an interrupted download does not fetch the same elevations again
+	checkpoint_filename = os.path.join(directory, "{}.elevation-checkpoint".format(city))
+	if srtm_directory is not None:
+		provider = SRTMElevationProvider(srtm_directory)
+	else:
+		provider = OpenElevationProvider(checkpoint_filename=checkpoint_filename)
+
+	#elevations are cached per provider, so rebuilding a city only looks up new coordinates whichever provider is used
+	add_elevation_data(nodes, provider, ElevationCache(os.path.join(directory, ELEVATION_CACHE_FILENAME)))
+
+	filenames = {}
+	for transport_method, graph in graphs.items():
+		nx.set_node_attributes(graph, name="elevation", values={node: nodes.nodes[node]["elevation"] for node in graph.nodes})
+		add_edge_elevation_data(graph)
+
+		filenames[transport_method] = os.path.join(directory, "{}-{}.pkl".format(city, transport_method))
+		with open(filenames[transport_method], "wb") as file:
+			pkl.dump(graph, file)
 
-def add_elevation_data(graph):
+	if os.path.exists(checkpoint_filename):
+		os.remove(checkpoint_filename)
+
+	#the preprocessing of every map is independent, so the maps are preprocessed in parallel
+	with ProcessPoolExecutor(max_workers=len(filenames)) as executor:
+		list(executor.map(build_preprocessing_files, filenames.values()))
+
+	for transport_method, filename in filenames.items():
+		register_map(filename, city, transport_method, provider.source)
+
+	if osm_filename is not None:
+		build_gazetteer(osm_filename, directory)
+
+def add_elevation_data(graph, provider=None, cache=None):
 	"""
-	Adds elevation data for each node in `graph` using the Open Elevation API. 
+	Adds elevation data for each node in `graph` using an elevation provider (the Open Elevation API by default). 
+	If a cache is given, only the nodes whose elevation is not cached are looked up, and their elevations are
+	added to the cache.
 
 	Inspired by OSMNX's add_node_elevations_google API: https://github.com/gboeing/osmnx/blob/6f9236f20a81416bf34186a811a8ebb76afa0dc8/osmnx/elevation.py#L111
 	
 	params:
 		graph: networkx.MultiDiGraph where each node contains latitude and longitude data
+		provider: elevation provider with a `get_elevations(latitudes, longitudes)` method, e.g. an
+			SRTMElevationProvider (None for an OpenElevationProvider with its default settings)
+		cache: ElevationCache (None to look up every node)
 
 	return: graph where nodes contain latitude, longitude, and elevation data
 	"""
-	max_batch_size = 100
+	if provider is None:
+		provider = OpenElevationProvider()
 
 	nodes_data = list(graph.nodes(data=True))
 
-	results = {}
-
-	api = "https://api.open-elevation.com/api/v1/lookup"
-	elevation_results = []
-	#call open elevation api for a batch of nodes
-	for i in range(0, len(nodes_data), max_batch_size):
-		locations = []
-		node_ids = []
-		for j in range(i, i + max_batch_size):
-			if j >= len(nodes_data):
-				break
-			locations.append({"latitude": nodes_data[j][1]["y"], "longitude": nodes_data[j][1]["x"]})
-			node_ids.append(nodes_data[j][0])
+	latitudes = [data["y"] for _, data in nodes_data]
+	longitudes = [data["x"] for _, data in nodes_data]
 
-		node_elevation_data = requests.post(api, json={"locations": locations}).json()["results"]
+	if cache is None:
+		elevations = provider.get_elevations(latitudes, longitudes)
+	else:
+		elevations = cache.get_elevations(provider.source, latitudes, longitudes)
+		missing = [i for i, elevation in enumerate(elevations) if elevation is None]
+		if missing:
+			missing_latitudes = [latitudes[i] for i in missing]
+			missing_longitudes = [longitudes[i] for i in missing]
+			missing_elevations = provider.get_elevations(missing_latitudes, missing_longitudes)
+			cache.add_elevations(provider.source, missing_latitudes, missing_longitudes, missing_elevations)
 
-		for j in range(len(node_elevation_data)):
-			node = node_elevation_data[j]
-			results[node_ids[j]] = node["elevation"]
+			for i, elevation in zip(missing, missing_elevations):
+				elevations[i] = elevation
 
+	results = {node: elevation for (node, _), elevation in zip(nodes_data, elevations)}
 	nx.set_node_attributes(graph, name="elevation", values=results)
 
 	return graph
 
+def add_edge_elevation_data(graph):
+	"""
+	Adds precomputed elevation data to each edge in `graph` so routing does not have to look up both end nodes
+	on every edge it relaxes. Each edge stores `elevation_gain` (the elevation climbed from node1 to node2, never
+	negative) and `grade` (the signed elevation difference divided by the edge length).
+
+	params:
+		graph: networkx.MultiDiGraph where each node contains elevation data and each edge contains length
+
+	return: graph where edges contain elevation_gain and grade data
+	"""
+	for node1, node2, data in graph.edges(data=True):
+		elevation_diff = graph.nodes[node2]["elevation"] - graph.nodes[node1]["elevation"]
+		data["elevation_gain"] = max(0, elevation_diff)
+		data["grade"] = elevation_diff / data["length"] if data["length"] > 0 else 0
+
+	return graph
+
+def upgrade_graph(graph):
+	"""
+	Upgrades a graph cached by an older version of `download_map` by adding any missing edge elevation data.
+
+	params:
+		graph: networkx.MultiDiGraph where each node contains elevation data and each edge contains length
+
+	return: graph where edges contain elevation_gain and grade data
+	"""
+	for _, _, data in graph.edges(data=True):
+		if "elevation_gain" not in data or "grade" not in data:
+			return add_edge_elevation_data(graph)
+
+	return graph
+
+def get_compiled_map_filename(filename):
+	"""
+	Returns the path of the compiled map directory stored next to the cached map `filename`.
+	"""
+	return os.path.splitext(filename)[0] + ".graph"
+
+def build_compiled_map_file(filename, graph=None):
+	"""
+	Stores the compiled copy of a cached map (node, coordinate, elevation and CSR edge arrays, plus the edge
+	geometry in a side file) next to it, so `load_compiled_map` can memory map it instead of unpickling the map.
+
+	params:
+		filename: path of the pickle file in `/cached_maps`
+		graph: networkx.MultiDiGraph - the map, if it is already loaded (None to load it)
+
+	return: CompiledGraph, the compiled map
+	"""
+	if graph is None:
+		graph = load_map(filename, preprocessing=False)
+	compiled = compile_graph(graph)
+	directory = get_compiled_map_filename(filename)
+	compiled.save(directory)
+	save_edge_geometry(compiled, graph, directory)
+
+	#the stored copy now has the edge geometry
+	compiled.directory = directory
+	return compiled
+
+def build_preprocessing_files(filename):
+	"""
+	Stores the compiled copy, the landmarks, the contraction hierarchy and the spatial index of a cached map next to it.
+	The map is loaded and compiled once for all of them.
+
+	params:
+		filename: path of the pickle file in `/cached_maps`
+	"""
+	compiled = build_compiled_map_file(filename, load_map(filename, preprocessing=False))
+	build_landmarks_file(filename, compiled=compiled)
+	build_contraction_hierarchy_file(filename, compiled)
+	build_spatial_index_file(filename, compiled)
+
+def get_landmarks_filename(filename):
+	"""
+	Returns the path of the landmark file stored next to the cached map `filename`.
+	"""
+	return os.path.splitext(filename)[0] + ".landmarks.npz"
+
+def build_landmarks_file(filename, count=16, compiled=None):
+	"""
+	Runs the landmark (ALT) preprocessing for a cached map and stores the landmark distances next to it.
+
+	params:
+		filename: path of the pickle file in `/cached_maps`
+		count: int - number of landmarks
+		compiled: CompiledGraph - the compiled map, if it is already loaded (None to load it)
+	"""
+	if compiled is None:
+		compiled = compile_graph(load_map(filename, preprocessing=False))
+	landmarks = build_landmarks(compiled, count)
+	landmarks.save(get_landmarks_filename(filename))
+
+def get_contraction_hierarchy_filename(filename):
+	"""
+	Returns the path of the contraction hierarchy file stored next to the cached map `filename`.
+	"""
+	return os.path.splitext(filename)[0] + ".ch.npz"
+
+def build_contraction_hierarchy_file(filename, compiled=None):
+	"""
+	Runs the contraction hierarchy preprocessing for a cached map and stores the hierarchy next to it.
+
+	params:
+		filename: path of the pickle file in `/cached_maps`
+		compiled: CompiledGraph - the compiled map, if it is already loaded (None to load it)
+	"""
+	if compiled is None:
+		compiled = compile_graph(load_map(filename, preprocessing=False))
+	hierarchy = build_contraction_hierarchy(compiled)
+	hierarchy.save(get_contraction_hierarchy_filename(filename))
+
+def get_spatial_index_filename(filename):
+	"""
+	Returns the path of the spatial index file stored next to the cached map `filename`.
+	"""
+	return os.path.splitext(filename)[0] + ".spatial.npz"
+
+def build_spatial_index_file(filename, compiled=None):
+	"""
+	Builds the spatial index of a cached map (over its edge shapes, if its compiled copy was stored) and stores it
+	next to the map.
+
+	params:
+		filename: path of the pickle file in `/cached_maps`
+		compiled: CompiledGraph - the compiled map, if it is already loaded (None to load it)
+	"""
+	if compiled is None:
+		compiled_directory = get_compiled_map_filename(filename)
+		if os.path.exists(compiled_directory):
+			compiled = CompiledGraph.load(compiled_directory)
+		else:
+			compiled = compile_graph(load_map(filename, preprocessing=False))
+	build_spatial_index(compiled).save(get_spatial_index_filename(filename))
+
+def build_gazetteer(osm_filename, directory="cached_maps"):
+	"""
+	Adds the addresses and named places of a local OSM extract to the gazetteer of the geocoder shared by the cached maps.
+
+	params:
+		osm_filename: path of the OSM XML file (`.osm` or `.osm.bz2`)
+		directory: path of the cached maps directory
+
+	return: int, the number of gazetteer entries added
+	"""
+	from src.geocoder import Geocoder, read_gazetteer
+
+	return Geocoder(os.path.join(directory, GEOCODER_FILENAME)).add_gazetteer(read_gazetteer(osm_filename))
+
+def load_map(filename, preprocessing=True):
+	"""
+	Loads a cached map from a pickle file, upgrading it to the current format if needed. If the map has landmark,
+	contraction hierarchy or spatial index preprocessing stored next to it, it is attached to the compiled graph
+	used for routing.
+
+	params:
+		filename: path of the pickle file in `/cached_maps`
+		preprocessing: bool - if False, leave out the stored preprocessing (when it is about to be rebuilt)
+
+	return: networkx.MultiDiGraph
+	"""
+	with open(filename, "rb") as file:
+		graph = pkl.load(file)
+
+	graph = upgrade_graph(graph)
+
+	if preprocessing and has_preprocessing(filename):
+		attach_preprocessing(compile_graph(graph), filename)
+
+	return graph
+
+def load_compiled_map(filename):
+	"""
+	Loads the compiled copy of a cached map stored by `build_compiled_map_file`, memory mapping its arrays, and
+	attaches any landmark, contraction hierarchy or spatial index preprocessing stored next to the map. The routing strategies
+	accept the result in place of the networkx graph.
+
+	params:
+		filename: path of the pickle file in `/cached_maps`
+
+	return: CompiledGraph
+	"""
+	compiled = CompiledGraph.load(get_compiled_map_filename(filename))
+	attach_preprocessing(compiled, filename)
+	return compiled
+
+def has_preprocessing(filename):
+	"""
+	Checks whether any landmark, contraction hierarchy or spatial index preprocessing is stored next to the cached
+	map `filename`.
+	"""
+	return any(os.path.exists(preprocessing_filename) for preprocessing_filename in
+		(get_landmarks_filename(filename), get_contraction_hierarchy_filename(filename), get_spatial_index_filename(filename)))
+
+def attach_preprocessing(compiled, filename):
+	"""
+	Attaches the landmark, contraction hierarchy and spatial index preprocessing stored next to the cached map
+	`filename` to `compiled`. Preprocessing built for a different version of the map is ignored.
+
+	params:
+		compiled: CompiledGraph - compiled copy of the map
+		filename: path of the pickle file in `/cached_maps`
+	"""
+	landmarks_filename = get_landmarks_filename(filename)
+	if os.path.exists(landmarks_filename):
+		landmarks = Landmarks.load(landmarks_filename)
+		if landmarks.matches(compiled):
+			compiled.landmarks = landmarks
+		else:
+			print("Warning: {} was built for a different map and will be ignored.".format(landmarks_filename))
+
+	hierarchy_filename = get_contraction_hierarchy_filename(filename)
+	if os.path.exists(hierarchy_filename):
+		hierarchy = ContractionHierarchy.load(hierarchy_filename)
+		if hierarchy.matches(compiled):
+			compiled.contraction_hierarchy = hierarchy
+		else:
+			print("Warning: {} was built for a different map and will be ignored.".format(hierarchy_filename))
+
+	spatial_index_filename = get_spatial_index_filename(filename)
+	if os.path.exists(spatial_index_filename):
+		spatial_index = SpatialIndex.load(spatial_index_filename)
+		if spatial_index.matches(compiled):
+			compiled.spatial_index = spatial_index
+		else:
+			print("Warning: {} was built for a different map and will be ignored.".format(spatial_index_filename))
+
+def get_manifest_filename(directory="cached_maps"):
+	"""
+	Returns the path of the manifest of the cached maps in `directory`.
+	"""
+	return os.path.join(directory, MANIFEST_FILENAME)
+
+def load_manifest(directory="cached_maps"):
+	"""
+	Loads the manifest of the cached maps in `directory`. The manifest maps the name of every converted map
+	(`<city>-<mode>`) to its files and metadata: checksum, file sizes and modification times, schema version, node
+	and edge counts, bounding box, city, network type, elevation source and build date.
+
+	params:
+		directory: path of the cached maps directory
+
+	return: dict
+	"""
+	filename = get_manifest_filename(directory)
+	if not os.path.exists(filename):
+		return {"schema_version": SCHEMA_VERSION, "maps": {}}
+
+	with open(filename) as file:
+		return json.load(file)
+
+def save_manifest(manifest, directory="cached_maps"):
+	"""
+	Stores the manifest of the cached maps in `directory`. The file is replaced in one step so a reader never
+	sees a partially written manifest.
+
+	params:
+		manifest: dict
+		directory: path of the cached maps directory
+	"""
+	filename = get_manifest_filename(directory)
+	with open(filename + ".tmp", "w") as file:
+		json.dump(manifest, file, indent=4, sort_keys=True)
+	os.replace(filename + ".tmp", filename)
+
+def get_checksum(compiled_directory):
+	"""
+	Computes the SHA-256 checksum of the arrays of a compiled map.
+
+	params:
+		compiled_directory: path of the directory the compiled map is stored in
+
+	return: string
+	"""
+	checksum = hashlib.sha256()
+	for name in GRAPH_ARRAYS:
+		with open(os.path.join(compiled_directory, name + ".npy"), "rb") as file:
+			for block in iter(lambda: file.read(1 << 20), b""):
+				checksum.update(block)
+	return "sha256:" + checksum.hexdigest()
+
+def get_file_stats(compiled_directory):
+	"""
+	Returns the size and modification time of the arrays of a compiled map, which tell much faster than the
+	checksum whether they changed.
+
+	params:
+		compiled_directory: path of the directory the compiled map is stored in
+
+	return: dict of array name to [size in bytes, modification time in nanoseconds]
+	"""
+	stats = {}
+	for name in GRAPH_ARRAYS:
+		stat = os.stat(os.path.join(compiled_directory, name + ".npy"))
+		stats[name] = [stat.st_size, stat.st_mtime_ns]
+	return stats
+
+def validate_compiled_graph(compiled):
+	"""
+	Checks that the arrays of a compiled map form a valid graph. Raises ValueError describing the first problem
+	found.
+
+	params:
+		compiled: CompiledGraph
+	"""
+	node_count = compiled.node_count
+	offsets = compiled.offsets
+
+	for name in ["elevations", "x", "y"]:
+		if len(getattr(compiled, name)) != node_count:
+			raise ValueError("Invalid map: {} has {} values for {} nodes.".format(name, len(getattr(compiled, name)), node_count))
+	if len(offsets) != node_count + 1 or offsets[0] != 0 or offsets[-1] != compiled.edge_count or (np.diff(offsets) < 0).any():
+		raise ValueError("Invalid map: edge offsets are not a valid CSR index.")
+	for name in ["lengths", "elevation_gains"]:
+		values = getattr(compiled, name)
+		if len(values) != compiled.edge_count or not np.isfinite(values).all() or (values < 0).any():
+			raise ValueError("Invalid map: {} must be finite and not negative for every edge.".format(name))
+	if compiled.edge_count > 0 and (compiled.targets.min() < 0 or compiled.targets.max() >= node_count):
+		raise ValueError("Invalid map: edge targets must be node indices.")
+	if node_count > 1 and (np.diff(compiled.node_ids) <= 0).any():
+		raise ValueError("Invalid map: node IDs must be unique and sorted.")
+
+def get_map_entry(filename, compiled, city, network_type, elevation_source, build_date):
+	"""
+	Describes a compiled map for the manifest.
+
+	params:
+		filename: path of the pickle file of the map
+		compiled: CompiledGraph - the compiled map, stored next to `filename`
+		city: string
+		network_type: string - "drive", "bike" or "walk"
+		elevation_source: string - where the node elevations came from ("none" if the map has none)
+		build_date: datetime - when the map was downloaded
+
+	return: dict
+	"""
+	compiled_directory = get_compiled_map_filename(filename)
+	return {
+		"filename": os.path.basename(filename),
+		"compiled": os.path.basename(compiled_directory),
+		"schema_version": SCHEMA_VERSION,
+		"checksum": get_checksum(compiled_directory),
+		"file_stats": get_file_stats(compiled_directory),
+		"node_count": compiled.node_count,
+		"edge_count": compiled.edge_count,
+		"bbox": [float(np.nanmin(compiled.x)), float(np.nanmin(compiled.y)), float(np.nanmax(compiled.x)), float(np.nanmax(compiled.y))],
+		"city": city,
+		"network_type": network_type,
+		"elevation_source": elevation_source,
+		"build_date": build_date.isoformat(timespec="seconds"),
+	}
+
+def register_map(filename, city, network_type, elevation_source, build_date=None):
+	"""
+	Adds (or replaces) the entry of a compiled cached map in the manifest of its directory.
+
+	params:
+		filename: path of the pickle file of the map, with its compiled copy stored next to it
+		city: string
+		network_type: string - "drive", "bike" or "walk"
+		elevation_source: string - where the node elevations came from
+		build_date: datetime - when the map was downloaded (None for now)
+	"""
+	directory = os.path.dirname(filename)
+	compiled = CompiledGraph.load(get_compiled_map_filename(filename))
+	validate_compiled_graph(compiled)
+
+	manifest = load_manifest(directory)
+	name = os.path.splitext(os.path.basename(filename))[0]
+	manifest["maps"][name] = get_map_entry(filename, compiled, city, network_type, elevation_source, build_date or datetime.now())
+	manifest["schema_version"] = SCHEMA_VERSION
+	save_manifest(manifest, directory)
+
+def convert_cached_maps(directory="cached_maps"):
+	"""
+	Upgrades every map `download_map` stored in `directory` (named `<city>-<mode>.pkl`) to the indexed cache: the
+	map is upgraded, compiled and registered in the manifest. The build date is taken from the pickle file, and
+	since `download_map` only ever used the Open Elevation API, that is recorded as the elevation source.
+
+	params:
+		directory: path of the cached maps directory
+
+	return: list of strings, the names of the converted maps
+	"""
+	from src.transport_networks import TRANSPORT_METHODS
+
+	converted = []
+	for filename in sorted(os.listdir(directory)):
+		name, extension = os.path.splitext(filename)
+		city, _, network_type = name.rpartition("-")
+		if extension != ".pkl" or not city or network_type not in TRANSPORT_METHODS:
+			continue
+
+		path = os.path.join(directory, filename)
+		graph = load_map(path)
+		has_elevation = all("elevation" in data for _, data in graph.nodes(data=True))
+
+		build_compiled_map_file(path, graph)
+		register_map(path, city, network_type, "open-elevation" if has_elevation else "none", datetime.fromtimestamp(os.path.getmtime(path)))
+		converted.append(name)
+
+	return converted
+
+def load_cached_map(name, directory="cached_maps", verify=False):
+	"""
+	Loads a map registered in the manifest as a memory mapped compiled graph, with its preprocessing attached.
+	The sizes and modification times of its arrays are checked against the manifest, and only if they differ is
+	the checksum computed, so an unchanged map loads without reading it. A map whose checksum no longer matches
+	has to be converted again.
+
+	params:
+		name: string - name of the map in the manifest (`<city>-<mode>`)
+		directory: path of the cached maps directory
+		verify: bool - if True, always check the checksum of the arrays
+
+	return: CompiledGraph
+	"""
+	manifest = load_manifest(directory)
+	if name not in manifest["maps"]:
+		raise ValueError("{} is not in the manifest of {}.".format(name, directory))
+
+	entry = manifest["maps"][name]
+	if entry["schema_version"] != SCHEMA_VERSION:
+		raise ValueError("{} was stored with schema version {}; convert it again with `python src/map.py --convert`.".format(name, entry["schema_version"]))
+
+	compiled_directory = os.path.join(directory, entry["compiled"])
+	file_stats = get_file_stats(compiled_directory)
+	if verify or file_stats != entry.get("file_stats"):
+		if get_checksum(compiled_directory) != entry["checksum"]:
+			raise ValueError("{} has changed since it was registered; convert it again with `python src/map.py --convert`.".format(name))
+
+		#the arrays are unchanged (e.g. they were copied), so later loads can skip the checksum again
+		if file_stats != entry.get("file_stats"):
+			entry["file_stats"] = file_stats
+			save_manifest(manifest, directory)
+
+	return load_compiled_map(os.path.join(directory, entry["filename"]))
+
+def find_map(locations, network_type, directory="cached_maps"):
+	"""
+	Finds the registered map of `network_type` whose bounding box contains every location, preferring the
+	smallest such map.
+
+	params:
+		locations: list of (longitude, latitude) tuples
+		network_type: string - "drive", "bike" or "walk"
+		directory: path of the cached maps directory
+
+	return: string, the name of the map, or None if no map covers the locations
+	"""
+	best_name = None
+	best_area = float("inf")
+
+	for name, entry in load_manifest(directory)["maps"].items():
+		if entry["network_type"] != network_type:
+			continue
+
+		west, south, east, north = entry["bbox"]
+		if not all(west <= longitude <= east and south <= latitude <= north for longitude, latitude in locations):
+			continue
+
+		area = (east - west) * (north - south)
+		if area < best_area:
+			best_name = name
+			best_area = area
+
+	return best_name
+
+def get_map_filename(name, directory="cached_maps"):
+	"""
+	Returns the path of the pickle file of a map registered in the manifest.
+	"""
+	return os.path.join(directory, load_manifest(directory)["maps"][name]["filename"])
+
 if __name__ == '__main__':
-	if len(sys.argv) != 4:
-		print("Expected: python src/map.py <city> <state> <country>")
+	if len(sys.argv) in (3, 4) and sys.argv[1] == "--landmarks":
+		build_landmarks_file(sys.argv[2], *[int(arg) for arg in sys.argv[3:]])
+		exit()
+
+	if len(sys.argv) in (2, 3) and sys.argv[1] == "--convert":
+		converted = convert_cached_maps(*sys.argv[2:])
+		print("Converted {} maps: {}".format(len(converted), ", ".join(converted)))
+		exit()
+
+	if len(sys.argv) in (3, 4) and sys.argv[1] == "--verify":
+		load_cached_map(sys.argv[2], *sys.argv[3:], verify=True)
+		print("{} matches its checksum.".format(sys.argv[2]))
+		exit()
+
+	if len(sys.argv) == 3 and sys.argv[1] == "--compile":
+		build_compiled_map_file(sys.argv[2])
+		exit()
+
+	if len(sys.argv) == 3 and sys.argv[1] == "--contraction-hierarchy":
+		build_contraction_hierarchy_file(sys.argv[2])
+		exit()
+
+	if len(sys.argv) == 3 and sys.argv[1] == "--spatial-index":
+		build_spatial_index_file(sys.argv[2])
+		exit()
+
+	if len(sys.argv) in (3, 4) and sys.argv[1] == "--gazetteer":
+		count = build_gazetteer(*sys.argv[2:])
+		print("Added {} gazetteer entries.".format(count))
+		exit()
+
+	options = dict(zip(sys.argv[4::2], sys.argv[5::2]))
+	if len(sys.argv) < 4 or len(sys.argv) % 2 != 0 or any(option not in ("--srtm", "--osm") for option in options):
+		print("Expected: python src/map.py <city> <state> <country> [--osm <OSM XML file>] [--srtm <SRTM tiles directory>]")
+		print("      or: python src/map.py --convert [cached maps directory]")
+		print("      or: python src/map.py --verify <map name> [cached maps directory]")
+		print("      or: python src/map.py --compile <cached map>")
+		print("      or: python src/map.py --landmarks <cached map> [number of landmarks]")
+		print("      or: python src/map.py --contraction-hierarchy <cached map>")
+		print("      or: python src/map.py --spatial-index <cached map>")
+		print("      or: python src/map.py --gazetteer <OSM XML file> [cached maps directory]")
+		exit()
+
+	if "--osm" in options and "--srtm" not in options:
+		print("--osm builds the maps offline, so it needs --srtm <SRTM tiles directory> for their elevations.")
 		exit()
 
 	location = {"city": sys.argv[1], "state": sys.argv[2], "country": sys.argv[3]}
 
-	download_map(location)
+	download_map(location, options.get("--srtm"), options.get("--osm"))
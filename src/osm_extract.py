@@ -0,0 +1,260 @@
+import bz2
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+import numpy as np
+import networkx as nx
+import osmnx
+from shapely.geometry import LineString
+
+sys.path.insert(0, '.')
+from src.heuristics import haversine_distances
+from src.transport_networks import TRANSPORT_METHODS, get_tag_filter, matches_tag_filter, get_filter_keys
+
+#values of the OSM `oneway` tag that osmnx treats as one way, and the ones meaning travel against the node order
+ONEWAY_VALUES = {"yes", "true", "1", "-1", "reverse", "T", "F"}
+REVERSED_VALUES = {"-1", "reverse", "T"}
+
+class OSMExtract:
+	"""
+		OSMExtract holds the street ways of a local OSM extract in compact arrays: the node references of way i are
+		refs[way_offsets[i]:way_offsets[i+1]], and the coordinates of the referenced nodes are stored in node ID order.
+		Only ways that can be part of a street network (the osmnx "all" network) are kept, with just the tags osmnx
+		keeps plus the ones its network filters check.
+	"""
+
+	def __init__(self, way_ids, way_offsets, refs, way_tags, node_ids, latitudes, longitudes):
+		self.way_ids = way_ids
+		self.way_offsets = way_offsets
+		self.refs = refs
+		self.way_tags = way_tags
+		self.node_ids = node_ids
+		self.latitudes = latitudes
+		self.longitudes = longitudes
+
+	@property
+	def way_count(self):
+		"""
+		Number of street ways in the extract.
+		"""
+		return len(self.way_ids)
+
+def read_extract(osm_filename):
+	"""
+	Reads the street ways of a local OSM XML extract (`.osm`, or `.osm.bz2`) with a streaming parser in two passes:
+	the first keeps the street ways and the second the coordinates of the nodes they reference. Every element is
+	discarded as soon as it is parsed, so memory use depends on the size of the street network, not of the file.
+
+	params:
+		osm_filename: path of the OSM XML file
+
+	return: OSMExtract
+	"""
+	if osm_filename.endswith(".pbf"):
+		raise ValueError("OSM PBF extracts are not supported, convert them to OSM XML first (e.g. with osmium cat).")
+
+	all_filter = get_tag_filter("all")
+	kept_keys = set(osmnx.settings.useful_tags_way) | set(get_filter_keys())
+
+	way_ids = array("q")
+	way_offsets = array("q", [0])
+	refs = array("q")
+	way_tags = []
+
+	for element in iterate_elements(osm_filename, "way"):
+		tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+		if not matches_tag_filter(tags, all_filter):
+			continue
+
+		way_refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+		if len(way_refs) < 2:
+			continue
+
+		way_ids.append(int(element.get("id")))
+		refs.extend(way_refs)
+		way_offsets.append(len(refs))
+		way_tags.append({key: value for key, value in tags.items() if key in kept_keys})
+
+	refs = np.frombuffer(refs, dtype=np.int64)
+	referenced_nodes = set(refs.tolist())
+
+	node_ids = array("q")
+	latitudes = array("d")
+	longitudes = array("d")
+	for element in iterate_elements(osm_filename, "node"):
+		node = int(element.get("id"))
+		if node in referenced_nodes:
+			node_ids.append(node)
+			latitudes.append(float(element.get("lat")))
+			longitudes.append(float(element.get("lon")))
+
+	node_ids = np.frombuffer(node_ids, dtype=np.int64)
+	order = np.argsort(node_ids)
+
+	extract = OSMExtract(np.frombuffer(way_ids, dtype=np.int64), np.frombuffer(way_offsets, dtype=np.int64), refs, way_tags,
+		node_ids[order], np.frombuffer(latitudes, dtype=np.float64)[order], np.frombuffer(longitudes, dtype=np.float64)[order])
+
+	#ways referencing nodes outside of the extract are cut off at its edge
+	return _drop_missing_nodes(extract)
+
+def build_network(extract, network_type, retain_all=False):
+	"""
+	Builds the simplified network of a transport method from an extract without building the unsimplified graph
+	first. The ways passing the osmnx filter of the transport method are split into edges at every node where
+	they end or meet another way of the network; each edge gets the way's tags, its length (the sum of the
+	great-circle distances between consecutive nodes) and, if it has nodes in between, its geometry. One way
+	streets are handled like osmnx does, and every edge is two-way for walking. Unlike osmnx, two ways that
+	continue each other are not merged into one edge.
+
+	params:
+		extract: OSMExtract
+		network_type: string - "drive", "bike" or "walk"
+		retain_all: bool - if True, keep every component instead of only the largest weakly connected one
+
+	return: networkx.MultiDiGraph
+	"""
+	tag_filter = get_tag_filter(network_type)
+	bidirectional = network_type in osmnx.settings.bidirectional_network_types
+	filter_keys = set(get_filter_keys()) - set(osmnx.settings.useful_tags_way)
+
+	ways = [way for way in range(extract.way_count) if matches_tag_filter(extract.way_tags[way], tag_filter)]
+	if not ways:
+		raise ValueError("No {} network in the extract.".format(network_type))
+
+	starts = extract.way_offsets[ways]
+	ends = extract.way_offsets[np.array(ways) + 1]
+	way_refs = np.concatenate([extract.refs[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+
+	#edges end at the nodes where a way ends or that are used more than once
+	node_ids, counts = np.unique(way_refs, return_counts=True)
+	split_nodes = set(node_ids[counts > 1].tolist())
+	split_nodes.update(extract.refs[starts].tolist())
+	split_nodes.update(extract.refs[ends - 1].tolist())
+
+	indices = np.searchsorted(extract.node_ids, extract.refs)
+	latitudes = extract.latitudes[indices]
+	longitudes = extract.longitudes[indices]
+	segment_lengths = np.round(haversine_distances(longitudes[:-1], latitudes[:-1], longitudes[1:], latitudes[1:]), 3)
+
+	network = nx.MultiDiGraph(crs=osmnx.settings.default_crs)
+	for way, start, end in zip(ways, starts.tolist(), ends.tolist()):
+		refs = extract.refs[start:end].tolist()
+		way_latitudes = latitudes[start:end].tolist()
+		way_longitudes = longitudes[start:end].tolist()
+		way_lengths = segment_lengths[start:end - 1].tolist()
+
+		tags = {key: value for key, value in extract.way_tags[way].items() if key not in filter_keys}
+		oneway = not bidirectional and (tags.get("oneway") in ONEWAY_VALUES or tags.get("junction") == "roundabout")
+		reverse = oneway and tags.get("oneway") in REVERSED_VALUES
+		tags["oneway"] = oneway
+		tags["osmid"] = int(extract.way_ids[way])
+
+		edge_start = 0
+		for position in range(1, len(refs)):
+			if position != len(refs) - 1 and refs[position] not in split_nodes:
+				continue
+
+			edge = dict(tags)
+			edge["length"] = sum(way_lengths[edge_start:position])
+			if position - edge_start > 1:
+				edge["geometry"] = LineString(zip(way_longitudes[edge_start:position + 1], way_latitudes[edge_start:position + 1]))
+
+			node1 = refs[edge_start]
+			node2 = refs[position]
+			for node, i in ((node1, edge_start), (node2, position)):
+				if node not in network:
+					network.add_node(node, y=way_latitudes[i], x=way_longitudes[i])
+
+			#one way streets only allow travel against the node order when they are reversed
+			if reverse:
+				network.add_edge(node2, node1, **_reversed_edge(edge))
+			else:
+				network.add_edge(node1, node2, **edge)
+				if not oneway:
+					network.add_edge(node2, node1, **_reversed_edge(edge))
+
+			edge_start = position
+
+	if not retain_all:
+		network = osmnx.utils_graph.get_largest_component(network)
+
+	nx.set_node_attributes(network, values=osmnx.stats.count_streets_per_node(network), name="street_count")
+	return network
+
+def build_networks(osm_filename, network_types=TRANSPORT_METHODS, workers=None):
+	"""
+	Reads a local OSM XML extract once and builds the network of every transport method from it, each in its own
+	worker process.
+
+	params:
+		osm_filename: path of the OSM XML file
+		network_types: list of strings
+		workers: int - number of worker processes (None for one per network)
+
+	return: dict of network type to networkx.MultiDiGraph
+	"""
+	extract = read_extract(osm_filename)
+	with ProcessPoolExecutor(max_workers=workers or len(network_types)) as executor:
+		networks = executor.map(build_network, [extract] * len(network_types), network_types)
+		return dict(zip(network_types, networks))
+
+def iterate_elements(osm_filename, tag):
+	"""
+	Yields the top level elements of an OSM XML file (`.osm`, or `.osm.bz2`) with a tag name such as "way" or
+	"node". Every element is cleared once it is parsed, so memory use stays bounded on large files.
+
+	params:
+		osm_filename: path of the OSM XML file
+		tag: string - tag name of the elements
+
+	return: generator of xml.etree.ElementTree.Element
+	"""
+	with (bz2.open(osm_filename) if osm_filename.endswith(".bz2") else open(osm_filename, "rb")) as file:
+		context = ET.iterparse(file, events=("start", "end"))
+		_, root = next(context)
+		depth = 0
+		for event, element in context:
+			if event == "start":
+				depth += 1
+				continue
+
+			depth -= 1
+			if depth == 0:
+				if element.tag == tag:
+					yield element
+				root.clear()
+
+def _reversed_edge(edge):
+	edge = dict(edge)
+	if "geometry" in edge:
+		edge["geometry"] = LineString(list(edge["geometry"].coords)[::-1])
+	return edge
+
+def _drop_missing_nodes(extract):
+	present = np.isin(extract.refs, extract.node_ids)
+	if present.all():
+		return extract
+
+	way_ids = array("q")
+	way_offsets = array("q", [0])
+	refs = array("q")
+	way_tags = []
+
+	#split every way into the runs of nodes that are in the extract
+	for way in range(extract.way_count):
+		start, end = int(extract.way_offsets[way]), int(extract.way_offsets[way + 1])
+		run = []
+		for position in range(start, end + 1):
+			if position < end and present[position]:
+				run.append(int(extract.refs[position]))
+				continue
+			if len(run) >= 2:
+				way_ids.append(int(extract.way_ids[way]))
+				refs.extend(run)
+				way_offsets.append(len(refs))
+				way_tags.append(extract.way_tags[way])
+			run = []
+
+	return OSMExtract(np.frombuffer(way_ids, dtype=np.int64), np.frombuffer(way_offsets, dtype=np.int64), np.frombuffer(refs, dtype=np.int64), way_tags,
+		extract.node_ids, extract.latitudes, extract.longitudes)
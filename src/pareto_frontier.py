@@ -0,0 +1,78 @@
+import sys
+
+sys.path.insert(0, '.')
+from src.shortest_distance import BOUND_TOLERANCE
+
+class ParetoFrontier:
+	"""
+		ParetoFrontier holds every non-dominated (length, elevation gain) route between a start and end location up
+		to a maximum x, so that a route for any x <= max_x and any elevation setting can be looked up without
+		running a new search.
+	"""
+
+	def __init__(self, start, end, shortest_length, max_x, routes):
+		"""
+		params:
+			start: int - the starting location of the routes
+			end: int - the end location of the routes
+			shortest_length: float - length of the shortest route from start to end
+			max_x: float - the largest percentage the frontier was searched for
+			routes: list of (length, elevation gain, list of node IDs), in order of increasing length
+		"""
+		self.start = start
+		self.end = end
+		self.shortest_length = shortest_length
+		self.max_x = max_x
+		self.routes = routes
+
+	def route_for(self, x=0, elevation_setting=None):
+		"""
+		Looks up the route that either maximizes or minimizes elevation gain within x% of the shortest path.
+		If elevation_setting is None, it returns the shortest path.
+
+		params:
+			x: float - the percentage we can deviate from the shortest path length, at most max_x
+			elevation_setting: string - either "maximize", "minimize", or None
+
+		return: list - a route from start to end or None if a route does not exist
+		"""
+		if float(x) > self.max_x:
+			raise ValueError("x = {} is larger than the {} the frontier was searched for.".format(x, self.max_x))
+
+		if not self.routes:
+			return None
+
+		max_length = (1 + (float(x)/100)) * self.shortest_length * (1 + BOUND_TOLERANCE)
+		routes = [route for route in self.routes if route[0] <= max_length]
+
+		if elevation_setting == "minimize":
+			return min(routes, key=lambda route: route[1])[2]
+		elif elevation_setting == "maximize":
+			return max(routes, key=lambda route: route[1])[2]
+		return routes[0][2]
+
+	def get_minimum_elevation_routes(self):
+		"""
+		Returns the routes on the (length, minimum elevation gain) front: each is longer than the one before it and
+		climbs strictly less.
+
+		return: list of (length, elevation gain, list of node IDs)
+		"""
+		front = []
+		for route in self.routes:
+			if not front or route[1] < front[-1][1]:
+				front.append(route)
+		return front
+
+	def get_maximum_elevation_routes(self):
+		"""
+		Returns the routes on the (length, maximum elevation gain) front: each is longer than the one before it and
+		climbs strictly more.
+
+		return: list of (length, elevation gain, list of node IDs)
+		"""
+		front = []
+		for route in self.routes:
+			if not front or route[1] > front[-1][1]:
+				front.append(route)
+		return front
@@ -0,0 +1,296 @@
+import os
+import sys
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future, CancelledError
+
+sys.path.insert(0, '.')
+from src.context import Context
+from src.routing_actions import ROUTING_MODES, RoutingDijkstra
+from src.map import load_compiled_map, get_compiled_map_filename
+
+#how often a worker's query is checked for a timeout or cancellation, in seconds
+POLL_INTERVAL = 0.05
+
+class QueryTimeoutError(TimeoutError):
+	"""
+		QueryTimeoutError is the exception of a query that did not finish within its timeout.
+	"""
+
+class QueryExecutor:
+	"""
+		QueryExecutor runs routing queries in a pool of worker processes, so queries are routed on every core instead
+		of one at a time under the GIL. Every worker attaches to the compiled copy of the same map, which is memory
+		mapped read only, so the operating system shares its pages between the workers and no worker unpickles the
+		networkx graph. The searches still run on Python adjacency lists and a node ID index that every worker
+		builds from the arrays on its first query, so each worker holds its own copy of those: about 350 bytes per
+		edge once both directions are used and 110 bytes per node (see `CompiledGraph`), which bounds how many
+		workers fit in memory for a large map.
+
+		Queries wait in a bounded queue (`submit` blocks while it is full) and each worker process is driven by a
+		thread of this process, which hands it one query at a time. A query that runs past its timeout, or that is
+		cancelled while running, is stopped by terminating its worker, which is replaced by a fresh one.
+
+		Use it as a context manager, or call `shutdown` once done, to stop the workers.
+	"""
+
+	def __init__(self, filename, workers=None, max_pending=None, timeout=None):
+		"""
+		params:
+			filename: path of the pickle file of a cached map with a compiled copy (see `build_compiled_map_file`)
+			workers: int - number of worker processes (None for one per core)
+			max_pending: int - number of queries that can wait for a worker before `submit` blocks (None for four
+				per worker)
+			timeout: float - default number of seconds a query can run (None for no limit)
+		"""
+		if not os.path.exists(get_compiled_map_filename(filename)):
+			raise ValueError("{} has no compiled copy; build it with `python src/map.py --compile {}`.".format(filename, filename))
+
+		self.filename = filename
+		self.workers = workers or os.cpu_count() or 1
+		self.timeout = timeout
+
+		#spawned workers do not inherit the locks held by the threads of this process
+		self._context = multiprocessing.get_context("spawn")
+		self._queries = queue.Queue(max_pending or 4 * self.workers)
+		self._running = set()
+		self._cancelled = set()
+		self._lock = threading.Lock()
+		self._shutdown = False
+		self._stopping = threading.Event()
+
+		self._threads = [threading.Thread(target=self._drive_worker, daemon=True) for _ in range(self.workers)]
+		for thread in self._threads:
+			thread.start()
+
+	def submit(self, start, end, x=0, elevation_setting=None, routing_mode=None, timeout=None):
+		"""
+		Queues a routing query, like `Context.execute_routing_mode` on the map, blocking while the queue is full.
+
+		params:
+			start: int - the starting location of the route
+			end: int - the end location of the route
+			x: float - the percentage we can deviate from the shortest path length
+			elevation_setting: string - either "maximize", "minimize", or None
+			routing_mode: RoutingMode or the name of one in ROUTING_MODES (None for Dijkstra)
+			timeout: float - number of seconds the query can run (None for the executor's timeout)
+
+		return: Future of the route (list of node IDs, or None if a route does not exist)
+		"""
+		if routing_mode is None:
+			routing_mode = RoutingDijkstra()
+		elif isinstance(routing_mode, str):
+			routing_mode = ROUTING_MODES[routing_mode]()
+
+		return self.submit_function(_execute_routing_mode, routing_mode, start, end, x, elevation_setting, timeout=timeout)
+
+	def submit_function(self, function, *args, timeout=None):
+		"""
+		Queues a call of `function(compiled, *args)` in a worker, where compiled is the worker's CompiledGraph of the
+		map, blocking while the queue is full. The function, its arguments and its result are pickled, so the
+		function has to be defined at the top level of a module.
+
+		params:
+			function: function
+			args: arguments of the function after the graph
+			timeout: float - number of seconds the call can run (None for the executor's timeout)
+
+		return: Future of the result
+		"""
+		if self._shutdown:
+			raise RuntimeError("Cannot submit queries after shutdown.")
+
+		future = Future()
+		self._queries.put((future, function, args, self.timeout if timeout is None else timeout))
+		return future
+
+	def cancel(self, future):
+		"""
+		Cancels a query: a query that is still queued is dropped, and a running one is stopped by terminating its
+		worker, after which its result raises a CancelledError.
+
+		params:
+			future: Future returned by `submit`
+
+		return: bool, False if the query already finished (or is finishing)
+		"""
+		if future.cancel():
+			return True
+
+		with self._lock:
+			if future not in self._running:
+				return False
+			self._cancelled.add(future)
+		return True
+
+	def shutdown(self, wait=True):
+		"""
+		Stops the workers once the queued queries are done. This never blocks on the queue, so with wait=False it
+		returns right away even while the queue is full.
+
+		params:
+			wait: bool - if True, wait for the workers to stop
+		"""
+		self._shutdown = True
+		self._stopping.set()
+
+		if wait:
+			for thread in self._threads:
+				thread.join()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.shutdown()
+
+	def _start_worker(self):
+		#returns (process, connection) once the worker has attached to the map
+		connection, worker_connection = self._context.Pipe()
+		process = self._context.Process(target=_worker_main, args=(self.filename, worker_connection), daemon=True)
+		process.start()
+		worker_connection.close()
+
+		try:
+			succeeded, error = connection.recv()
+		except EOFError:
+			succeeded, error = False, RuntimeError("The worker process exited with code {}.".format(process.exitcode))
+		if not succeeded:
+			process.join()
+			connection.close()
+			raise error
+		return process, connection
+
+	def _stop_worker(self, worker, terminate):
+		process, connection = worker
+		if not terminate:
+			try:
+				connection.send(None)
+			except OSError:
+				pass
+			process.join(1)
+		if process.is_alive():
+			process.terminate()
+		process.join()
+		connection.close()
+
+	def _drive_worker(self):
+		#hands the queued queries to one worker process, replacing it whenever it has to be stopped
+		try:
+			worker = self._start_worker()
+		except Exception:
+			#the error is reported to the first query, when starting the worker is tried again
+			worker = None
+
+		try:
+			while True:
+				try:
+					item = self._queries.get(timeout=POLL_INTERVAL)
+				except queue.Empty:
+					#the queued queries are done
+					if self._stopping.is_set():
+						break
+					continue
+
+				future, function, args, timeout = item
+				with self._lock:
+					if not future.set_running_or_notify_cancel():
+						continue
+					self._running.add(future)
+
+				if worker is None:
+					try:
+						worker = self._start_worker()
+					except Exception as error:
+						self._set_outcome(future, False, error)
+						continue
+
+				outcome = self._run(worker, future, function, args, timeout)
+				if outcome is None:
+					self._stop_worker(worker, terminate=True)
+					worker = None
+					continue
+
+				self._set_outcome(future, *outcome)
+		finally:
+			if worker is not None:
+				self._stop_worker(worker, terminate=False)
+
+	def _run(self, worker, future, function, args, timeout):
+		#returns (succeeded, result or exception), or None once the future was failed because the worker has to be stopped
+		process, connection = worker
+		try:
+			connection.send((function, args))
+		except OSError as error:
+			self._set_outcome(future, False, RuntimeError("Could not send the query to the worker process: {}".format(error)))
+			return None
+		except Exception as error:
+			#the call could not be pickled, so nothing was sent
+			return False, error
+
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while not connection.poll(POLL_INTERVAL):
+			with self._lock:
+				cancelled = future in self._cancelled
+
+			if cancelled:
+				self._set_outcome(future, False, CancelledError())
+			elif deadline is not None and time.monotonic() > deadline:
+				self._set_outcome(future, False, QueryTimeoutError("The query did not finish within {} seconds.".format(timeout)))
+			elif not process.is_alive():
+				self._set_outcome(future, False, RuntimeError("The worker process exited with code {}.".format(process.exitcode)))
+			else:
+				continue
+			return None
+
+		try:
+			return connection.recv()
+		except EOFError:
+			self._set_outcome(future, False, RuntimeError("The worker process exited with code {}.".format(process.exitcode)))
+			return None
+
+	def _set_outcome(self, future, succeeded, value):
+		#once the query stops running, cancelling it returns False, even before its result is delivered
+		with self._lock:
+			self._running.discard(future)
+			self._cancelled.discard(future)
+
+		if succeeded:
+			future.set_result(value)
+		else:
+			future.set_exception(value)
+
+def _worker_main(filename, connection):
+	#attaches to the memory mapped map once and answers calls until it receives None
+	try:
+		compiled = load_compiled_map(filename)
+	except Exception as error:
+		connection.send((False, error))
+		return
+	connection.send((True, None))
+
+	while True:
+		try:
+			call = connection.recv()
+		except EOFError:
+			break
+		if call is None:
+			break
+
+		function, args = call
+		try:
+			outcome = (True, function(compiled, *args))
+		except Exception as error:
+			outcome = (False, error)
+
+		try:
+			connection.send(outcome)
+		except Exception as error:
+			#results or exceptions that cannot be pickled
+			connection.send((False, RuntimeError("Could not send the result of the query: {!r}".format(error))))
+	connection.close()
+
+def _execute_routing_mode(compiled, routing_mode, start, end, x, elevation_setting):
+	return Context(routing_mode).execute_routing_mode(compiled, start, end, x, elevation_setting)
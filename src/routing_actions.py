@@ -1,18 +1,36 @@
-import osmnx
 import heapq
 import sys
+import time
 
 sys.path.insert(0, '.')
 from src.routing_mode import RoutingMode
 from src.routing_helper import RoutingHelper
+from src.compiled_graph import compile_graph
+from src.shortest_distance import get_reverse_tree, bidirectional_shortest_path, BOUND_TOLERANCE
+from src.label_setting import label_setting_search, LabelLimitError, MAX_LABELS
+from src.heuristics import get_lower_bounds
+from src.pareto_frontier import ParetoFrontier
+
+#default search budget of RoutingDFS, since the number of routes within max length grows exponentially with the graph
+DFS_MAX_EXPANSIONS = 1000000
+DFS_TIME_LIMIT = 5.0
 
 class RoutingDijkstra(RoutingMode):
 	"""
 	Represents Dikstra routing for path finding solution
 
 	"""
-	def __init__(self):
+	def __init__(self, target_pruning=True, lower_bounds="exact"):
+		"""
+		params:
+			target_pruning: bool - if True, discard any partial route that cannot reach the end location within the
+				length budget, using a lower bound on the remaining distance from every node to the end
+			lower_bounds: string - "exact" for the exact remaining distance (one reverse Dijkstra run per query) or
+				"landmarks" for the landmark (ALT) bound, which needs no extra search but prunes less
+		"""
 		super().__init__()
+		self.target_pruning = target_pruning
+		self.lower_bounds = lower_bounds
 
 	def routing_action(self, graph, start, end, x=0, elevation_setting=None):
 		"""
@@ -20,8 +38,11 @@ class RoutingDijkstra(RoutingMode):
 		from start to end location within x% of the shortest path. 
 		If elevation_setting is None, it finds the shortest path from start to end.
 
+		The search runs on the compiled (array-backed) version of `graph` using integer node indices, which are
+		mapped back to node IDs once a route is found.
+
 		params:
-			graph: networkx multidigraph - the area we are searching in
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
 			start: int - the starting location of the route
 			end: int - the end location of the route
 			x: float - the percentage we can deviate from the shortest path length
@@ -29,55 +50,59 @@ class RoutingDijkstra(RoutingMode):
 
 		return: list - a route from start to end or None if a route does not exist
 		"""
-		distances = {}
-		elevations = {}
-		previous_nodes = {}
+		compiled = compile_graph(graph)
+
+		max_length = RoutingHelper().find_max_length(graph, x, start, end, point_to_point=self.lower_bounds != "exact")
+		if max_length == -1:
+			return None
+
+		source = compiled.index_of(start)
+		target = compiled.index_of(end)
+		adjacency = compiled.adjacency()
+		node_count = compiled.node_count
+
+		#with target pruning, a route is only extended to a node if it can still reach the end within max_length
+		if self.target_pruning:
+			remaining_distances = get_lower_bounds(compiled, target, self.lower_bounds)
+			budget = max_length * (1 + BOUND_TOLERANCE)
+		else:
+			remaining_distances = [0] * node_count
+			budget = max_length
+
+		distances = [float("inf")] * node_count
+		elevations = [0] * node_count
+		previous_nodes = [-1] * node_count
+		visited = bytearray(node_count)
 
 		#priority = elevation
 		queue = [] 
 
 		#queue element stores (total elevation from start node to current node, total distance from start to current node, current node, previous node)
-		heapq.heappush(queue, (0, 0, start, None))
-		distances[start] = 0
-		elevations[start] = 0
-		previous_nodes[start] = None
-
-		visited = set()
-
-		max_length = RoutingHelper().find_max_length(graph, x, start, end)
-		if max_length == -1:
-			return None
+		heapq.heappush(queue, (0, 0, source, -1))
+		distances[source] = 0
 
 		while queue:
 			current = heapq.heappop(queue)
 			current_node = current[2]
 
-		#either we have not seen this node before or we have found a shorter path to this node
-			if current_node not in distances or (distances[current_node] > current[1]):
+			#either we have not seen this node before or we have found a shorter path to this node
+			if distances[current_node] > current[1]:
 				elevations[current_node] = current[0] if elevation_setting == "minimize" else -current[0]
 				distances[current_node] = current[1]
 				previous_nodes[current_node] = current[3]
 
 			#we've found a complete path, stop searching this path
-			if current_node == end:
+			if current_node == target:
 				break
 
-			visited.add(current_node)
+			visited[current_node] = 1
 
-			for edge in graph.edges(current_node, data=True):
-				next_node = edge[1]
-				#avoid self loops
-				if next_node == current_node:
-					continue
-				distance_to_next_node = graph[current_node][next_node][0]["length"]
+			for next_node, distance_to_next_node, elevation_to_next_node in adjacency[current_node]:
 				total_new_distance = current[1] + distance_to_next_node
-				total_old_distance = float("inf") if next_node not in distances else distances[next_node]	 
-
-				elevation_to_next_node = RoutingHelper().get_elevation_diff(graph, current_node, next_node) 
 				total_elevation = elevations[current_node] + elevation_to_next_node
 
 				#if the total distance is greater than max length, this is an invalid path
-				if total_new_distance <= max_length and (next_node not in visited or total_new_distance < total_old_distance):
+				if total_new_distance <= max_length and total_new_distance + remaining_distances[next_node] <= budget and (not visited[next_node] or total_new_distance < distances[next_node]):
 					if elevation_setting == "maximize":
 						heapq.heappush(queue, (-total_elevation, total_new_distance, next_node, current_node))
 					elif elevation_setting == "minimize":
@@ -85,179 +110,387 @@ class RoutingDijkstra(RoutingMode):
 					else:
 						heapq.heappush(queue, (0, total_new_distance, next_node, current_node))
 
-		return RoutingHelper().get_path_from_previous_nodes(previous_nodes, start, end)
+		return RoutingHelper().get_path_from_previous_indices(compiled, previous_nodes, source, target)
 
 class RoutingAStar(RoutingMode):
 	"""
 	Represents A* routing for path finding solution
 
 	"""
-	def __init__(self):
+	def __init__(self, target_pruning=True, heuristic=None):
+		"""
+		params:
+			target_pruning: bool - if True, discard any partial route that cannot reach the end location within the
+				length budget, using the heuristic's lower bound on the remaining distance from every node to the end
+			heuristic: string - "haversine" to bound the remaining distance by the great-circle distance to the end,
+				"landmarks" to also use the landmark (ALT) bound, or "exact" to use the exact remaining distance (one
+				extra reverse Dijkstra run per query); None uses the landmarks when the graph has them and the
+				great-circle distance otherwise
+		"""
 		super().__init__()
+		self.target_pruning = target_pruning
+		self.heuristic = heuristic
 
 	def routing_action(self, graph, start, end, x=0, elevation_setting=None):
 		"""
 		Runs A* shortest path algorithm to find a route that either maximizes or minimizes elevation gain
 		from start to end location within x% of the shortest path. 
 		If elevation_setting is None, it finds the shortest path from start to end.
+
+		The search runs on the compiled (array-backed) version of `graph` using integer node indices, which are
+		mapped back to node IDs once a route is found. The distance heuristic (a lower bound on the remaining
+		distance to the end) orders the search when finding the shortest path and prunes routes that cannot reach
+		the end within the length budget.
+
 		params:
-			graph: networkx multidigraph - the area we are searching in
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
 			start: int - the starting location of the route
 			end: int - the end location of the route
 			x: int - the percentage we can deviate from the shortest path length
 			elevation_setting: string - either "maximize", "minimize", or None
 		return: list - a route from start to end or None if a route does not exist
 		"""
+		compiled = compile_graph(graph)
+		heuristic_method = self.heuristic or ("landmarks" if compiled.landmarks is not None else "haversine")
 
-		g_elevations = {} #for each node, stores elevation from start node to next node
-		f_elevations = {} #for each node, stores elevation from start node to next node + elevation from current node to end node
-		distances = {} #
-		previous_nodes = {}
+		#only the exact heuristic needs the reverse distance tree, otherwise get the bound with a point-to-point search
+		max_length = RoutingHelper().find_max_length(graph, x, start, end, point_to_point=heuristic_method != "exact")
+		if max_length == -1:
+			return None
 
-		queue = []
+		source = compiled.index_of(start)
+		target = compiled.index_of(end)
+		adjacency = compiled.adjacency()
+		node_elevations = compiled.elevations.tolist()
+		end_elevation = node_elevations[target]
+		node_count = compiled.node_count
 
-		#queue element stores (f_elevation, g_elevation, total distance from start to current node, current node, previous node)
-		heapq.heappush(queue, (RoutingHelper().get_elevation_diff(graph, start, end), 0, 0, start, None))
+		lower_bounds = get_lower_bounds(compiled, target, heuristic_method)
 
-		visited = set()
-		max_length = RoutingHelper().find_max_length(graph, x, start, end)
-	
-		if max_length == -1:
-			return None
+		#with target pruning, a route is only extended to a node if it can still reach the end within max_length
+		if self.target_pruning:
+			remaining_distances = lower_bounds
+			budget = max_length * (1 + BOUND_TOLERANCE)
+		else:
+			remaining_distances = [0] * node_count
+			budget = max_length
+
+		g_elevations = [0] * node_count #for each node, stores elevation from start node to next node
+		distances = [float("inf")] * node_count
+		previous_nodes = [-1] * node_count
+		visited = bytearray(node_count)
+
+		queue = []
+
+		#queue element stores (f_elevation (or f_distance when finding the shortest path), g_elevation, total distance from start to current node, current node, previous node)
+		heapq.heappush(queue, (max(0, end_elevation - node_elevations[source]), 0, 0, source, -1))
 
 		while queue:
 			current = heapq.heappop(queue)
 			current_node = current[3]
 			
 			#either we have not seen this node before or we have found a shorter path to this node
-			if current_node not in distances or (distances[current_node] > current[2]):
-				f_elevations[current_node] = current[0] if elevation_setting == "minimize" else -current[0]
+			if distances[current_node] > current[2]:
 				g_elevations[current_node] = current[1]
 				distances[current_node] = current[2]
 				previous_nodes[current_node] = current[4]
+			elif visited[current_node]:
+				#edges are relaxed from the stored distance and elevation, which have not changed since this node
+				#was last expanded, so expanding it again would only push duplicates of earlier queue elements
+				continue
 
 			#we've found the best path, stop searching
-			if current_node == end:
+			if current_node == target:
 				break
 
-			visited.add(current_node)
+			visited[current_node] = 1
 	
-			for edge in graph.edges(current_node, data=True):
-				next_node = edge[1]
-
-				#avoid self loops
-				if next_node == current_node:
-					continue
-
-				g_elevation_to_next_node = RoutingHelper().get_elevation_diff(graph, current_node, next_node)
+			for next_node, distance_to_next_node, g_elevation_to_next_node in adjacency[current_node]:
 				g_total_new_elevation = g_elevations[current_node] + g_elevation_to_next_node
-
-				distance_to_next_node = graph[current_node][next_node][0]["length"]
 				total_new_distance = distances[current_node] + distance_to_next_node
-				total_old_distance = float("inf") if next_node not in distances else distances[next_node]
 
-				heuristic = RoutingHelper().get_elevation_diff(graph, next_node, end)
+				heuristic = end_elevation - node_elevations[next_node]
+				if heuristic < 0:
+					heuristic = 0
 
 				#if the total distance is greater than max length, this is an invalid path
-				if total_new_distance <= max_length and (next_node not in visited or total_new_distance < total_old_distance):
+				if total_new_distance <= max_length and total_new_distance + remaining_distances[next_node] <= budget and (not visited[next_node] or total_new_distance < distances[next_node]):
 					if elevation_setting == "maximize":
 						heapq.heappush(queue, (-g_total_new_elevation - heuristic, g_total_new_elevation, total_new_distance, next_node, current_node))
 					elif elevation_setting == "minimize":
 						heapq.heappush(queue, (g_total_new_elevation + heuristic, g_total_new_elevation, total_new_distance, next_node, current_node))
 					else:
-						heapq.heappush(queue, (0, 0, total_new_distance, next_node, current_node))
+						heapq.heappush(queue, (total_new_distance + lower_bounds[next_node], 0, total_new_distance, next_node, current_node))
 
-		return RoutingHelper().get_path_from_previous_nodes(previous_nodes, start, end)
+		return RoutingHelper().get_path_from_previous_indices(compiled, previous_nodes, source, target)
 
 class RoutingDFS(RoutingMode):
 	"""
 	Represents DFS routing for path finding solution
 
 	"""
-	def __init__(self):
+	def __init__(self, max_expansions=DFS_MAX_EXPANSIONS, time_limit=DFS_TIME_LIMIT):
+		"""
+		params:
+			max_expansions: int - stop searching after extending this many partial routes (None for no limit)
+			time_limit: float - stop searching after this many seconds (None for no limit)
+		"""
 		super().__init__()
+		self.max_expansions = max_expansions
+		self.time_limit = time_limit
 
 	def routing_action(self, graph, start, end, x=0, elevation_setting=None):
 		"""
-		Runs DFS path algorithm from start to end location and finds the path that has a length <= max length 
-		and then finds a route that either maximizes or minimizes elevation gain from start to end location 
+		Runs a branch-and-bound DFS from start to end location over routes with a length <= max length and keeps
+		the route that either maximizes or minimizes elevation gain from start to end location.
 		If elevation_setting is None, it finds the shortest path from start to end.
 
+		The length and elevation gain of the current route are carried along incrementally and a branch is cut as
+		soon as it cannot reach the end within max length (using the remaining distance from each node to the end)
+		or cannot beat the best route found so far. If the expansion or time budget runs out, the best route found
+		so far is returned (or the shortest path if none was found yet).
+
 			params:
-				graph: networkx multidigraph - the area we are searching in
+				graph: networkx multidigraph or CompiledGraph - the area we are searching in
 				start: int - the starting location of the route
 				end: int - the end location of the route
+				x: float - the percentage we can deviate from the shortest path length
+				elevation_setting: string - either "maximize", "minimize", or None
 			return: list - a route from start to end or None if a route does not exist
 		"""
-		
-		visited = {}
-		for node in graph.nodes:
-			visited[node] = 0
-
-		path = []
+		compiled = compile_graph(graph)
 
 		max_length = RoutingHelper().find_max_length(graph, x, start, end)
 		if max_length == -1:
 			return None
 
+		source = compiled.index_of(start)
+		target = compiled.index_of(end)
+		adjacency = compiled.adjacency()
+		node_elevations = compiled.elevations.tolist()
+		end_elevation = node_elevations[target]
+		remaining_distances = get_reverse_tree(compiled, target).distance_list()
+		budget = max_length * (1 + BOUND_TOLERANCE)
+
+		def ordered_edges(node):
+			#try the edges that head most directly to the end first, so good routes (and tight bounds) are found early
+			return sorted(adjacency[node], key=lambda edge: edge[1] + remaining_distances[edge[0]])
+
+		on_path = bytearray(compiled.node_count)
+		on_path[source] = 1
+
+		#the current route, along with its length and elevation gain up to each node and the edges left to try
+		path = [source]
+		path_lengths = [0]
+		path_elevations = [0]
+		edges_to_try = [ordered_edges(source)]
+		edge_positions = [0]
+
+		best_path = None
+		best_length = float("inf")
+		best_elevation = None
+
+		expansions = 0
+		deadline = None if self.time_limit is None else time.monotonic() + self.time_limit
+
+		while path:
+			current_node = path[-1]
+
+			if current_node == target:
+				length = path_lengths[-1]
+				elevation = path_elevations[-1]
+				if elevation_setting == "maximize":
+					is_better = best_elevation is None or elevation > best_elevation
+				elif elevation_setting == "minimize":
+					is_better = best_elevation is None or elevation < best_elevation
+				else:
+					is_better = length < best_length
+
+				if is_better:
+					best_path = path[:]
+					best_length = length
+					best_elevation = elevation
+
+			position = edge_positions[-1]
+			if current_node == target or position == len(edges_to_try[-1]):
+				on_path[current_node] = 0
+				path.pop()
+				path_lengths.pop()
+				path_elevations.pop()
+				edges_to_try.pop()
+				edge_positions.pop()
+				continue
 
-		all_paths = []
+			edge_positions[-1] = position + 1
+			next_node, distance_to_next_node, elevation_to_next_node = edges_to_try[-1][position]
 
-		def dfs_get_all_paths(graph, current, visited, path, depth):
-			if current == end:
-				if RoutingHelper().get_total_path_length(path, graph) <= max_length:
-					all_paths.append(path[:])
-				return
+			if on_path[next_node]:
+				continue
 
-			if depth == 0:
-				return
+			total_new_distance = path_lengths[-1] + distance_to_next_node
+			total_elevation = path_elevations[-1] + elevation_to_next_node
 
-			for edge in graph.edges(current, data=True):
+			#the route can no longer reach the end within max length
+			if total_new_distance + remaining_distances[next_node] > budget:
+				continue
 
-				next_node = edge[1]
+			#the route can no longer beat the best route found so far (elevation gain never decreases along a route
+			#and the climb left to the end is at least the elevation difference)
+			if elevation_setting == "minimize":
+				if best_elevation is not None and total_elevation + max(0, end_elevation - node_elevations[next_node]) >= best_elevation:
+					continue
+			elif elevation_setting != "maximize":
+				if total_new_distance + remaining_distances[next_node] >= best_length:
+					continue
 
-				if visited[next_node] == 0:
-					visited[next_node] = 1
-					path.append(next_node)
-					dfs_get_all_paths(graph, next_node, visited, path, depth - 1)
-					path.remove(next_node)
-					visited[next_node] = 0
-
-
-		path.append(start)
-		visited[start] = 1
-		depth = 50
-		dfs_get_all_paths(graph,start,visited,path, depth)
-
-		# finds the maximum/minimum/shortest path
-		elevation = []
-		shortest = sys.maxsize
-		shortest_path = 0
-
-		# find the shortest path by finding the path length of each path in all paths
-		# find the elevation of each path and add it to elevation list
-		for p in all_paths:
-			elevation.append((p, RoutingHelper().get_path_elevation(p, graph)))
-			path_len = RoutingHelper().get_total_path_length(p,graph)
-			if path_len<shortest:
-				shortest = path_len
-				shortest_path = p
-
-		finalPath = []
-
-		# sort elevation list based on elevation 
-		elevation.sort(key=lambda x: x[1])
-
-		if elevation_setting == "maximize":
-			max_elevation = elevation[-1][0]
-			finalPath = max_elevation
-		elif elevation_setting == "minimize":
-			min_elevation = elevation[0][0]
-			finalPath = min_elevation
+			expansions += 1
+			if self.max_expansions is not None and expansions > self.max_expansions:
+				break
+			if deadline is not None and expansions % 1024 == 0 and time.monotonic() > deadline:
+				break
+
+			on_path[next_node] = 1
+			path.append(next_node)
+			path_lengths.append(total_new_distance)
+			path_elevations.append(total_elevation)
+			edges_to_try.append(ordered_edges(next_node))
+			edge_positions.append(0)
+
+		if best_path is None:
+			return RoutingHelper().get_shortest_path(graph, start, end)
+
+		return compiled.path_to_ids(best_path)
+
+class RoutingLabelSetting(RoutingMode):
+	"""
+	Represents exact label-setting routing (resource constrained shortest path) for path finding solution
+
+	"""
+	supports_frontier = True
+
+	def __init__(self, max_labels=MAX_LABELS):
+		"""
+		params:
+			max_labels: int - stop creating new partial routes once this many exist, to bound memory (None for no
+				limit); the default keeps the labels within LABEL_MEMORY_BUDGET
+		"""
+		super().__init__()
+		self.max_labels = max_labels
+
+	def routing_action(self, graph, start, end, x=0, elevation_setting=None):
+		"""
+		Finds the route that either minimizes or maximizes elevation gain from start to end location within x% of
+		the shortest path, keeping a Pareto front of (length, elevation gain) routes at every node instead of a
+		single route per node. Minimizing is exact. Maximizing only considers routes that never revisit a node and
+		is not exact (see `label_setting_search`), so the Dijkstra route is used as an incumbent: the result is
+		never worse than RoutingDijkstra's. If elevation_setting is None, it finds the shortest path from start to end.
+
+		If the search reaches max_labels before it is done, a LabelLimitError is raised, whose `result` is the best
+		route found before the limit.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			start: int - the starting location of the route
+			end: int - the end location of the route
+			x: float - the percentage we can deviate from the shortest path length
+			elevation_setting: string - either "maximize", "minimize", or None
+
+		return: list - a route from start to end or None if a route does not exist
+		"""
+		if elevation_setting not in ("maximize", "minimize"):
+			return RoutingHelper().get_shortest_path(graph, start, end)
+
+		max_length = RoutingHelper().find_max_length(graph, x, start, end)
+		if max_length == -1:
+			return None
+
+		compiled = compile_graph(graph)
+		target = compiled.index_of(end)
+		remaining_distances = get_reverse_tree(compiled, target).distance_list()
+
+		routes, truncated = label_setting_search(compiled, compiled.index_of(start), target, max_length * (1 + BOUND_TOLERANCE), remaining_distances, elevation_setting, self.max_labels)
+
+		#every route found improves on the ones before it, so the last one is the best
+		if not routes:
+			path = RoutingHelper().get_shortest_path(graph, start, end)
 		else:
-			finalPath = shortest_path
+			path = compiled.path_to_ids(routes[-1][2])
+			if elevation_setting == "maximize":
+				incumbent = RoutingDijkstra().routing_action(compiled, start, end, x, elevation_setting)
+				if incumbent is not None and RoutingHelper().get_path_elevation(incumbent, compiled) > routes[-1][1]:
+					path = incumbent
 
-		return finalPath
+		if truncated:
+			raise LabelLimitError("The search reached its limit of {} partial routes, so the route may not be optimal.".format(self.max_labels), path)
+		return path
+
+	def frontier_action(self, graph, start, end, max_x=100):
+		"""
+		Finds the Pareto frontier of (length, elevation gain) routes from start to end location within max_x% of
+		the shortest path in a single search, keeping the routes that minimize and the routes that maximize
+		elevation gain for every length.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			start: int - the starting location of the route
+			end: int - the end location of the route
+			max_x: float - the largest percentage we can deviate from the shortest path length
+
+		return: ParetoFrontier
+
+		If the search reaches max_labels before it is done, a LabelLimitError is raised, whose `result` is the
+		frontier of the routes found before the limit.
+		"""
+		shortest_length = RoutingHelper().get_shortest_length(graph, start, end)
+		if shortest_length is None:
+			return ParetoFrontier(start, end, None, float(max_x), [])
+
+		compiled = compile_graph(graph)
+		target = compiled.index_of(end)
+		remaining_distances = get_reverse_tree(compiled, target).distance_list()
+		max_length = (1 + (float(max_x)/100)) * shortest_length
+
+		routes, truncated = label_setting_search(compiled, compiled.index_of(start), target, max_length * (1 + BOUND_TOLERANCE), remaining_distances, "both", self.max_labels)
+
+		routes = [(length, elevation, compiled.path_to_ids(path)) for length, elevation, path in routes]
+		frontier = ParetoFrontier(start, end, shortest_length, float(max_x), routes)
+		if truncated:
+			raise LabelLimitError("The search reached its limit of {} partial routes, so the frontier may be incomplete.".format(self.max_labels), frontier)
+		return frontier
+
+class RoutingBidirectional(RoutingMode):
+	"""
+	Represents bidirectional Dijkstra routing for path finding solution
+
+	"""
+	def __init__(self):
+		super().__init__()
+
+	def routing_action(self, graph, start, end, x=0, elevation_setting=None):
+		"""
+		Runs a bidirectional Dijkstra search (forward from start and backward from end) to find the shortest path
+		from start to end location. This is always plain bidirectional Dijkstra, even on maps with a contraction
+		hierarchy or landmarks attached (RoutingHelper().get_shortest_path with point_to_point=True uses those).
+		If elevation_setting is "maximize" or "minimize", the route is found with Dijkstra routing within x% of
+		the shortest path instead.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			start: int - the starting location of the route
+			end: int - the end location of the route
+			x: float - the percentage we can deviate from the shortest path length
+			elevation_setting: string - either "maximize", "minimize", or None
+
+		return: list - a route from start to end or None if a route does not exist
+		"""
+		if elevation_setting in ("maximize", "minimize"):
+			return RoutingDijkstra().routing_action(graph, start, end, x, elevation_setting)
+
+		compiled = compile_graph(graph)
+		path = bidirectional_shortest_path(compiled, compiled.index_of(start), compiled.index_of(end))
+		if path is None:
+			return None
+		return compiled.path_to_ids(path)
 
 class RoutingBFS(RoutingMode):
 	"""
@@ -354,4 +587,13 @@ class RoutingOldDFS(RoutingMode):
 					if next_node == end:
 						return RoutingHelper().get_path_from_previous_nodes(previous_nodes, start, end)
 	
-		return None
\ No newline at end of file
+		return None
+
+#the routing strategies selectable by name, for the app and the routing service
+ROUTING_MODES = {
+	"dijkstra": RoutingDijkstra,
+	"a*": RoutingAStar,
+	"dfs": RoutingDFS,
+	"label-setting": RoutingLabelSetting,
+	"bidirectional": RoutingBidirectional,
+}
@@ -1,4 +1,10 @@
-import osmnx
+import sys
+
+sys.path.insert(0, '.')
+from src.compiled_graph import CompiledGraph, SnappedGraph, compile_graph
+from src.shortest_distance import get_reverse_tree, has_reverse_tree, bidirectional_shortest_path, astar_shortest_path, path_length, path_elevation_gain
+from src.heuristics import get_lower_bounds
+from src.spatial_index import get_spatial_index, snap_locations
 
 class RoutingHelper():
 	"""
@@ -8,28 +14,167 @@ class RoutingHelper():
 	def __init__(self):
 		pass
 
-	def find_max_length(self, graph, x, start, end):
+	def find_max_length(self, graph, x, start, end, point_to_point=False):
 		"""
-		Uses the osmnx API to find the shortest possible route from start to end node and multiplies
-		this number by x to find the longest possible route we can create. Returns -1 if no possible
-		path exists. 
+		Finds the shortest possible route from start to end node and multiplies this number by x to find the
+		longest possible route we can create. Returns -1 if no possible path exists.
+
+		The shortest distance comes from the (cached) reverse shortest distance tree of `end`, which is shared with
+		the routing strategies and with `get_shortest_path`, so a query only runs Dijkstra once. Strategies that do
+		not need the remaining distance of every node can ask for a point-to-point search instead.
 
 		params:
-			graph: networkx multidigraph - the area we are searching in
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
 			x: float, the percentage we can deviate from the shortest path length
 			start: int - the starting location of the route
 			end: int - the end location of the route
+			point_to_point: bool - if True, use the fastest point-to-point search the graph supports (the
+				contraction hierarchy or A* on the landmark bounds when the graph has them, bidirectional Dijkstra
+				otherwise) unless the reverse tree is already cached
 
 		return: float, length of the longest possible route
 
 		"""
-		shortest_path = osmnx.distance.shortest_path(graph, start, end)
-		if shortest_path is None:
+		shortest_length = self.get_shortest_length(graph, start, end, point_to_point)
+		if shortest_length is None:
 			return -1
 
-		max_length = (1 + (float(x)/100)) * self.get_total_path_length(shortest_path, graph)
+		max_length = (1 + (float(x)/100)) * shortest_length
 		return max_length
 
+	def get_shortest_length(self, graph, start, end, point_to_point=False):
+		"""
+		Finds the length of the shortest route from start to end node.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			start: int - the starting location of the route
+			end: int - the end location of the route
+			point_to_point: bool - if True, use the fastest point-to-point search the graph supports (the
+				contraction hierarchy or A* on the landmark bounds when the graph has them, bidirectional Dijkstra
+				otherwise) unless the reverse tree is already cached
+
+		return: float, or None if no possible path exists
+		"""
+		path = self._get_shortest_index_path(graph, start, end, point_to_point)
+		if path is None:
+			return None
+
+		#sum along the direction of travel so the result matches the length the strategies compute for this path
+		return path_length(compile_graph(graph), path)
+
+	def get_shortest_path(self, graph, start, end, point_to_point=False):
+		"""
+		Finds the shortest route from start to end node.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			start: int - the starting location of the route
+			end: int - the end location of the route
+			point_to_point: bool - if True, use the fastest point-to-point search the graph supports (the
+				contraction hierarchy or A* on the landmark bounds when the graph has them, bidirectional Dijkstra
+				otherwise) unless the reverse tree is already cached
+
+		return: list of node IDs, or None if no possible path exists
+		"""
+		path = self._get_shortest_index_path(graph, start, end, point_to_point)
+		if path is None:
+			return None
+		return compile_graph(graph).path_to_ids(path)
+
+	def _get_shortest_index_path(self, graph, start, end, point_to_point):
+		compiled = compile_graph(graph)
+		source = compiled.index_of(start)
+		target = compiled.index_of(end)
+
+		if point_to_point and not has_reverse_tree(compiled, target):
+			if compiled.contraction_hierarchy is not None:
+				if isinstance(compiled, SnappedGraph):
+					return self._get_snapped_hierarchy_path(compiled, source, target)
+				return compiled.contraction_hierarchy.shortest_path(source, target)
+			if compiled.landmarks is not None:
+				return astar_shortest_path(compiled, source, target, get_lower_bounds(compiled, target, "landmarks"))
+			return bidirectional_shortest_path(compiled, source, target)
+		return get_reverse_tree(compiled, target).path(source)
+
+	def _get_snapped_hierarchy_path(self, compiled, source, target):
+		#the hierarchy only knows the base graph, so join it to the ends of the route through the virtual nodes
+		starts = compiled.virtual_distances(source)
+		ends = compiled.virtual_distances(target, reverse=True)
+
+		best_length, best_path = starts[target] if target in starts else (float("inf"), None)
+		for start, (start_length, start_path) in starts.items():
+			for end, (end_length, end_path) in ends.items():
+				if start >= compiled.base.node_count or end >= compiled.base.node_count or start_length + end_length >= best_length:
+					continue
+
+				path = compiled.contraction_hierarchy.shortest_path(start, end)
+				if path is not None:
+					length = start_length + path_length(compiled.base, path) + end_length
+					if length < best_length:
+						best_length, best_path = length, start_path[:-1] + path + end_path[1:]
+		return best_path
+
+	def get_nearest_node(self, graph, longitude, latitude):
+		"""
+		Finds the node closest to a location, using the spatial index of the graph (built the first time if the
+		map was not stored with one).
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			longitude: float
+			latitude: float
+
+		return: int, node ID
+		"""
+		compiled = compile_graph(graph)
+		node, _ = get_spatial_index(compiled).nearest_node(longitude, latitude)
+		return compiled.node_id(node)
+
+	def get_nearest_nodes(self, graph, longitudes, latitudes):
+		"""
+		Finds the node closest to each of many locations, searching for all of them at once.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			longitudes: list of floats
+			latitudes: list of floats
+
+		return: list of node IDs
+		"""
+		compiled = compile_graph(graph)
+		nodes, _ = get_spatial_index(compiled).nearest_nodes(longitudes, latitudes)
+		return compiled.path_to_ids(nodes.tolist())
+
+	def get_nearest_edge(self, graph, longitude, latitude):
+		"""
+		Finds the edge closest to a location.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			longitude: float
+			latitude: float
+
+		return: (node1 ID, node2 ID, position of the closest point along the edge from 0 at node1 to 1 at node2)
+		"""
+		compiled = compile_graph(graph)
+		node1, node2, position, _ = get_spatial_index(compiled).nearest_edge(longitude, latitude)
+		return compiled.node_id(node1), compiled.node_id(node2), position
+
+	def snap_locations(self, graph, longitudes, latitudes):
+		"""
+		Snaps locations to the closest point on the closest street, adding a virtual node there (unless the point
+		is a node of the graph) in a routing view of the graph. The graph itself is not modified.
+
+		params:
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in
+			longitudes: list of floats
+			latitudes: list of floats
+
+		return: (SnappedGraph, list of node IDs of the snapped locations in the view)
+		"""
+		return snap_locations(compile_graph(graph), longitudes, latitudes)
+
 	def get_elevation_diff(self, graph, node1, node2):
 		"""
 		Finds the elevation difference between two nodes.
@@ -45,18 +190,26 @@ class RoutingHelper():
 
 	def get_path_elevation(self, nodes, graph):
 		"""
-		Calculates the total elevation gain of the path containing `nodes`.
+		Calculates the total elevation gain of the path containing `nodes`, using the precomputed `elevation_gain`
+		of each edge when the graph has it.
 	
 		params:
 			nodes: list of ints (node IDs)
-			graph: networkx multidigraph - the area we are searching in, contains `nodes`
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in, contains `nodes`
 
 		return: int, the total elevation from start to end node in the path
 		"""
+		if isinstance(graph, CompiledGraph):
+			return path_elevation_gain(graph, [graph.index_of(node) for node in nodes])
+
 		elevation = 0
 
 		for i in range(len(nodes)-1):
-			elevation += max(0, graph.nodes[nodes[i+1]]["elevation"] - graph.nodes[nodes[i]]["elevation"])
+			edge = graph.get_edge_data(nodes[i], nodes[i+1], 0)
+			if edge is not None and "elevation_gain" in edge:
+				elevation += edge["elevation_gain"]
+			else:
+				elevation += max(0, graph.nodes[nodes[i+1]]["elevation"] - graph.nodes[nodes[i]]["elevation"])
 
 		return elevation
 
@@ -66,10 +219,13 @@ class RoutingHelper():
 
 		params:
 			nodes: list of ints (node IDs)
-			graph: networkx multidigraph - the area we are searching in, contains `nodes`
+			graph: networkx multidigraph or CompiledGraph - the area we are searching in, contains `nodes`
 
 		return: int, the total distance from start to end node in the path
 		"""
+		if isinstance(graph, CompiledGraph):
+			return path_length(graph, [graph.index_of(node) for node in nodes])
+
 		distance = 0
 
 		for i in range(len(nodes)-1):
@@ -95,3 +251,27 @@ class RoutingHelper():
 			path.append(current_node)
 		path.reverse()
 		return path
+
+	def get_path_from_previous_indices(self, compiled, previous_nodes, start, end):
+		"""
+		Returns a list of the path using `previous_nodes` on a compiled graph, mapped back to node IDs.
+
+		params:
+			compiled: CompiledGraph - the graph the search ran on
+			previous_nodes: list of ints, the value at a node index is the index of the node that points to it in this path (-1 if none)
+			start: int, node index
+			end: int, node index
+
+			return: list of node IDs, the complete path from start to end node or None if end was never reached
+		"""
+		if end != start and previous_nodes[end] == -1:
+			return None
+
+		path = [end]
+
+		current_node = end
+		while current_node != start:
+			current_node = previous_nodes[current_node]
+			path.append(current_node)
+		path.reverse()
+		return compiled.path_to_ids(path)
@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-import osmnx
 
 class RoutingMode(ABC):
 	"""
@@ -10,6 +9,10 @@ class RoutingMode(ABC):
 		Cite: https://www.tutorialspoint.com/design_pattern/strategy_pattern.html
 	"""
 
+	#whether the routing mode has a `frontier_action(graph, start, end, max_x)` finding every non-dominated
+	#(length, elevation gain) route, which only routing modes that keep more than one route per node can do
+	supports_frontier = False
+
 	def __init__(self):
 		pass
 
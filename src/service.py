@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, '.')
+from src.context import Context
+from src.routing_actions import ROUTING_MODES
+from src.routing_helper import RoutingHelper
+from src.compiled_graph import compile_graph
+from src.map import load_map, load_compiled_map, load_cached_map, load_manifest, find_map, get_compiled_map_filename, get_map_filename
+from src.query_executor import QueryExecutor, QueryTimeoutError
+
+#largest request body accepted, in bytes
+MAX_BODY_SIZE = 1 << 20
+
+#map used for coordinates outside of every registered map, like the app does
+DEFAULT_CITY = "boulder"
+
+#share of the timeout a search with a time budget (DFS) can run, so it returns its best route before the query times out
+SEARCH_TIME_FRACTION = 0.8
+
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error", 504: "Gateway Timeout"}
+
+class RequestError(Exception):
+	"""
+		RequestError is raised for a request the service cannot answer, with the HTTP status to answer it with.
+	"""
+
+	def __init__(self, status, message):
+		super().__init__(message)
+		self.status = status
+
+	def __reduce__(self):
+		#raised in the worker processes of a QueryExecutor too, so it has to survive pickling
+		return (RequestError, (self.status, str(self)))
+
+class RoutingService:
+	"""
+		RoutingService answers routing queries over HTTP/JSON without a GUI. Every map is loaded the first time it is
+		queried (as a memory mapped compiled graph when it has one) and kept, so later queries on it only route.
+		The event loop only parses requests; maps are loaded in one worker thread and queries are routed in another,
+		one query at a time (routing is CPU bound, so more threads would not route faster), which keeps the service
+		responsive while a query is routed and lets a map load while another map is being routed on. With
+		`processes`, queries are routed in parallel by a QueryExecutor per map instead, whose worker processes attach
+		to the compiled copy of the map.
+
+		Queries running past `timeout` are answered with a timeout error. Worker processes are stopped right away,
+		but the routing thread cannot be, so searches with a time budget (DFS) are given a share of the timeout to
+		return their best route in time, and the others run to completion before the next query is routed.
+
+		Endpoints:
+			GET /health - the maps loaded so far
+			GET /maps - the maps registered in the manifest of the cached maps directory
+			POST /route - routes a query (see `route`)
+	"""
+
+	def __init__(self, directory="cached_maps", processes=None, timeout=None):
+		"""
+		params:
+			directory: path of the cached maps directory
+			processes: int - number of worker processes per map (None to route in a thread of this process)
+			timeout: float - number of seconds a query can run (None for no limit)
+		"""
+		self.directory = directory
+		self.processes = processes
+		self.timeout = timeout
+		self.executor = ThreadPoolExecutor(max_workers=1)
+		self.loading_executor = ThreadPoolExecutor(max_workers=1)
+		self.maps = {}
+		self.query_executors = {}
+		self._loading = {}
+
+	async def get_map(self, name):
+		"""
+		Returns a map, loading it in the loading thread the first time it is asked for. Concurrent queries on a map
+		that is still loading wait for the same load.
+
+		params:
+			name: string - name of the map (`<city>-<mode>`), registered in the manifest or stored as `<name>.pkl`
+
+		return: CompiledGraph
+		"""
+		if name in self.maps:
+			return self.maps[name]
+
+		if name not in self._loading:
+			self._loading[name] = asyncio.get_running_loop().run_in_executor(self.loading_executor, self.load_map, name)
+		try:
+			compiled = await self._loading[name]
+		finally:
+			self._loading.pop(name, None)
+
+		self.maps[name] = compiled
+		return compiled
+
+	def load_map(self, name):
+		"""
+		Loads a map registered in the manifest, or else the cached map `<name>.pkl`, as a compiled graph.
+
+		params:
+			name: string
+
+		return: CompiledGraph
+		"""
+		if name in load_manifest(self.directory)["maps"]:
+			return load_cached_map(name, self.directory)
+
+		filename = os.path.join(self.directory, "{}.pkl".format(os.path.basename(name)))
+		if os.path.exists(get_compiled_map_filename(filename)):
+			return load_compiled_map(filename)
+		if os.path.exists(filename):
+			return compile_graph(load_map(filename))
+
+		raise RequestError(404, "Unknown map {}.".format(name))
+
+	def get_query_executor(self, name):
+		"""
+		Returns the QueryExecutor routing the queries of a map, starting it the first time it is asked for.
+
+		params:
+			name: string - name of the map (`<city>-<mode>`), registered in the manifest or stored as `<name>.pkl`
+				with a compiled copy
+
+		return: QueryExecutor
+		"""
+		if name not in self.query_executors:
+			if name in load_manifest(self.directory)["maps"]:
+				filename = get_map_filename(name, self.directory)
+			else:
+				filename = os.path.join(self.directory, "{}.pkl".format(os.path.basename(name)))
+				if not os.path.exists(filename):
+					raise RequestError(404, "Unknown map {}.".format(name))
+			self.query_executors[name] = QueryExecutor(filename, self.processes, timeout=self.timeout)
+		return self.query_executors[name]
+
+	async def route(self, query):
+		"""
+		Routes a query. The start and end are either node IDs or [longitude, latitude] locations, which are snapped to
+		the closest street. The map is the one named in the query, or else the smallest registered map of the
+		transport mode covering both locations.
+
+		params:
+			query: dict with
+				start, end: int or [longitude, latitude]
+				x: float - the percentage the route can deviate from the shortest path length (default 0)
+				elevation_setting: string - "maximize", "minimize" or None for the shortest path (default None)
+				method: string - the routing strategy, one of ROUTING_MODES (default "dijkstra")
+				map: string - name of the map (needed for node IDs)
+				mode: string - "drive", "bike" or "walk", used to find the map (default "drive")
+
+		return: dict with the map, the path (node IDs, negative for snapped locations, or None if there is no
+			route), the [longitude, latitude] of every node of the path, its length and elevation gain (in meters)
+			and the routing time (in seconds)
+		"""
+		if not isinstance(query, dict):
+			raise RequestError(400, "Expected a JSON object.")
+
+		start, end = (_parse_location(query.get(key), key) for key in ("start", "end"))
+
+		try:
+			x = float(query.get("x", 0))
+		except (TypeError, ValueError):
+			raise RequestError(400, "x must be a number.")
+
+		elevation_setting = query.get("elevation_setting") or None
+		if elevation_setting not in ("maximize", "minimize", None):
+			raise RequestError(400, "elevation_setting must be maximize, minimize or null.")
+
+		method = str(query.get("method", "dijkstra")).lower()
+		if method not in ROUTING_MODES:
+			raise RequestError(400, "method must be one of {}.".format(", ".join(ROUTING_MODES)))
+
+		name = query.get("map")
+		if name is None:
+			locations = [location for location in (start, end) if isinstance(location, tuple)]
+			if len(locations) != 2:
+				raise RequestError(400, "map is needed to route between node IDs.")
+			mode = query.get("mode", "drive")
+			name = find_map(locations, mode, self.directory) or "{}-{}".format(DEFAULT_CITY, mode)
+
+		loop = asyncio.get_running_loop()
+		time_limit = None if self.timeout is None else SEARCH_TIME_FRACTION * self.timeout
+		if self.processes:
+			#submitting blocks while the executor's queue is full, so it is done off the event loop
+			query_executor = self.get_query_executor(str(name))
+			future = await loop.run_in_executor(self.executor, partial(query_executor.submit_function, _route, start, end, x, elevation_setting, method, time_limit))
+			result = await asyncio.wrap_future(future)
+		else:
+			compiled = await self.get_map(str(name))
+			try:
+				result = await asyncio.wait_for(loop.run_in_executor(self.executor, _route, compiled, start, end, x, elevation_setting, method, time_limit), self.timeout)
+			except asyncio.TimeoutError:
+				raise QueryTimeoutError("The query did not finish within {} seconds.".format(self.timeout))
+		result["map"] = name
+		return result
+
+	async def handle_connection(self, reader, writer):
+		"""
+		Answers the HTTP/1.1 requests of a connection until the client closes it.
+		"""
+		try:
+			while True:
+				request = await _read_request(reader)
+				if request is None:
+					break
+				http_method, path, headers, body = request
+
+				status, response = await self.handle_request(http_method, path, body)
+				keep_alive = headers.get("connection", "").lower() != "close"
+				writer.write(_format_response(status, response, keep_alive))
+				await writer.drain()
+				if not keep_alive:
+					break
+		except RequestError as error:
+			writer.write(_format_response(error.status, {"error": str(error)}, False))
+		except (ConnectionError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			writer.close()
+
+	async def handle_request(self, http_method, path, body):
+		"""
+		Answers one request.
+
+		return: (int, dict), the HTTP status and JSON response
+		"""
+		try:
+			path = path.split("?")[0].rstrip("/")
+			if path == "/route":
+				if http_method != "POST":
+					raise RequestError(405, "Use POST for /route.")
+				try:
+					query = json.loads(body or b"{}")
+				except ValueError:
+					raise RequestError(400, "The request body is not valid JSON.")
+				return 200, await self.route(query)
+
+			if path in ("/health", "/maps") and http_method != "GET":
+				raise RequestError(405, "Use GET for {}.".format(path))
+			if path == "/health":
+				return 200, {"status": "ok", "maps": sorted(set(self.maps) | set(self.query_executors))}
+			if path == "/maps":
+				return 200, {"maps": load_manifest(self.directory)["maps"]}
+
+			raise RequestError(404, "Unknown path {}.".format(path))
+		except RequestError as error:
+			return error.status, {"error": str(error)}
+		except QueryTimeoutError as error:
+			return 504, {"error": str(error)}
+		except Exception as error:
+			return 500, {"error": "{}: {}".format(type(error).__name__, error)}
+
+	async def serve(self, host="127.0.0.1", port=8080, preload=()):
+		"""
+		Loads the `preload` maps and answers requests until cancelled.
+
+		params:
+			host: string
+			port: int
+			preload: list of map names to load before accepting requests
+		"""
+		for name in preload:
+			if self.processes:
+				self.get_query_executor(name)
+			else:
+				await self.get_map(name)
+
+		server = await asyncio.start_server(self.handle_connection, host, port)
+		print("Serving on {}".format(", ".join("http://{}:{}".format(*socket.getsockname()[:2]) for socket in server.sockets)))
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			for query_executor in self.query_executors.values():
+				query_executor.shutdown(wait=False)
+
+def _route(compiled, start, end, x, elevation_setting, method, time_limit=None):
+	#snap the locations given as coordinates to the closest street; node IDs are used as they are
+	graph = compiled
+	locations = [location for location in (start, end) if isinstance(location, tuple)]
+	if locations:
+		longitudes, latitudes = zip(*locations)
+		graph, nodes = RoutingHelper().snap_locations(compiled, longitudes, latitudes)
+		nodes = iter(nodes)
+		start, end = (next(nodes) if isinstance(location, tuple) else location for location in (start, end))
+
+	for node in (start, end):
+		if node not in graph:
+			raise RequestError(404, "Node {} is not in the map.".format(node))
+
+	routing_mode = ROUTING_MODES[method]()
+	if time_limit is not None and hasattr(routing_mode, "time_limit"):
+		routing_mode.time_limit = time_limit if routing_mode.time_limit is None else min(routing_mode.time_limit, time_limit)
+
+	started = time.perf_counter()
+	path = Context(routing_mode).execute_routing_mode(graph, start, end, x, elevation_setting)
+	elapsed = time.perf_counter() - started
+
+	result = {"start": start, "end": end, "path": path, "coordinates": None, "length": None, "elevation_gain": None, "time": elapsed}
+	if path is not None:
+		indices = [graph.index_of(node) for node in path]
+		result["coordinates"] = [[float(graph.x[index]), float(graph.y[index])] for index in indices]
+		result["length"] = float(RoutingHelper().get_total_path_length(path, graph))
+		result["elevation_gain"] = float(RoutingHelper().get_path_elevation(path, graph))
+	return result
+
+def _parse_location(location, key):
+	#a node ID, or a [longitude, latitude] location
+	if isinstance(location, int) and not isinstance(location, bool):
+		return location
+	if isinstance(location, list) and len(location) == 2 and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in location):
+		return (float(location[0]), float(location[1]))
+	raise RequestError(400, "{} must be a node ID or [longitude, latitude].".format(key))
+
+async def _read_request(reader):
+	#returns (method, path, headers, body), or None once the client closed the connection
+	request_line = await reader.readline()
+	if not request_line.strip():
+		return None
+
+	parts = request_line.decode("latin-1").split()
+	if len(parts) != 3:
+		raise RequestError(400, "Malformed request line.")
+
+	headers = {}
+	while True:
+		line = await reader.readline()
+		if line in (b"\r\n", b"\n", b""):
+			break
+		key, _, value = line.decode("latin-1").partition(":")
+		headers[key.strip().lower()] = value.strip()
+
+	try:
+		length = int(headers.get("content-length", 0))
+	except ValueError:
+		raise RequestError(400, "Malformed Content-Length.")
+	if length > MAX_BODY_SIZE:
+		raise RequestError(413, "The request body is larger than {} bytes.".format(MAX_BODY_SIZE))
+
+	body = await reader.readexactly(length) if length else b""
+	return parts[0].upper(), parts[1], headers, body
+
+def _format_response(status, response, keep_alive):
+	body = json.dumps(response).encode()
+	headers = [
+		"HTTP/1.1 {} {}".format(status, STATUS_REASONS[status]),
+		"Content-Type: application/json",
+		"Content-Length: {}".format(len(body)),
+		"Connection: {}".format("keep-alive" if keep_alive else "close"),
+	]
+	return ("\r\n".join(headers) + "\r\n\r\n").encode() + body
+
+if __name__ == '__main__':
+	options = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+	if len(sys.argv) % 2 != 1 or any(option not in ("--host", "--port", "--directory", "--preload", "--processes", "--timeout") for option in options):
+		print("Expected: python src/service.py [--host <host>] [--port <port>] [--directory <cached maps directory>] [--preload <map>,<map>,...] [--processes <worker processes per map>] [--timeout <seconds>]")
+		exit()
+
+	processes = int(options["--processes"]) if "--processes" in options else None
+	timeout = float(options["--timeout"]) if "--timeout" in options else None
+	service = RoutingService(options.get("--directory", "cached_maps"), processes, timeout)
+	preload = [name for name in options.get("--preload", "").split(",") if name]
+	try:
+		asyncio.run(service.serve(options.get("--host", "127.0.0.1"), int(options.get("--port", 8080)), preload))
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,293 @@
+import heapq
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+#relative slack used when comparing a sum of edge lengths against a length budget, so that a path whose length
+#was summed in a different order than the budget is not rejected because of floating point rounding
+BOUND_TOLERANCE = 1e-9
+
+#number of reverse distance trees kept per graph
+TREE_CACHE_SIZE = 8
+
+class ShortestDistanceTree:
+	"""
+		ShortestDistanceTree stores the result of a single Dijkstra run from `root` over a compiled graph: the
+		shortest distance between the root and every node, and the tree of previous nodes needed to rebuild the
+		shortest paths. A reverse tree is built on the reversed graph, so it stores the shortest distance from every
+		node to the root instead.
+	"""
+
+	def __init__(self, root, distances, previous_nodes, reverse=False):
+		self.root = root
+		self.distances = distances
+		self.previous_nodes = previous_nodes
+		self.reverse = reverse
+		self._distance_list = None
+
+	def distance(self, node):
+		"""
+		Returns the shortest distance between the root and `node` (inf if there is no path).
+
+		params:
+			node: int - node index
+
+		return: float
+		"""
+		return float(self.distances[node])
+
+	def distance_list(self):
+		"""
+		Returns the distances as a plain list, which is faster to index from the inner loop of a search.
+
+		return: list of floats
+		"""
+		if self._distance_list is None:
+			self._distance_list = self.distances.tolist()
+		return self._distance_list
+
+	def path(self, node):
+		"""
+		Returns the shortest path between the root and `node`, always ordered in the direction of travel
+		(root to node for a forward tree, node to root for a reverse tree).
+
+		params:
+			node: int - node index
+
+		return: list of node indices, or None if there is no path
+		"""
+		if self.distances[node] == float("inf"):
+			return None
+
+		path = [node]
+		current_node = node
+		while current_node != self.root:
+			current_node = int(self.previous_nodes[current_node])
+			path.append(current_node)
+
+		if not self.reverse:
+			path.reverse()
+		return path
+
+def shortest_distance_tree(compiled, root, reverse=False):
+	"""
+	Runs Dijkstra's algorithm from `root` over every reachable node of `compiled`.
+
+	params:
+		compiled: CompiledGraph - the area we are searching in
+		root: int - node index the tree is grown from
+		reverse: bool - if True, search the reversed graph so distances are from each node to `root`
+
+	return: ShortestDistanceTree
+	"""
+	adjacency = compiled.reverse_adjacency() if reverse else compiled.adjacency()
+	node_count = compiled.node_count
+
+	distances = [float("inf")] * node_count
+	previous_nodes = [-1] * node_count
+	settled = bytearray(node_count)
+
+	distances[root] = 0
+	queue = [(0, root)]
+
+	while queue:
+		distance, current_node = heapq.heappop(queue)
+		if settled[current_node]:
+			continue
+		settled[current_node] = 1
+
+		for next_node, length, _ in adjacency[current_node]:
+			new_distance = distance + length
+			if new_distance < distances[next_node]:
+				distances[next_node] = new_distance
+				previous_nodes[next_node] = current_node
+				heapq.heappush(queue, (new_distance, next_node))
+
+	return ShortestDistanceTree(root, np.array(distances, dtype=np.float64), np.array(previous_nodes, dtype=np.int64), reverse)
+
+def bidirectional_shortest_path(compiled, source, target):
+	"""
+	Runs a bidirectional Dijkstra search: forward from `source` and backward (on the reversed graph) from `target`,
+	always advancing the side whose queue has the smaller distance. The search stops once the two queue minimums
+	add up to at least the best route found through a node reached from both sides, so only about half the nodes
+	of a unidirectional search are settled.
+
+	params:
+		compiled: CompiledGraph - the area we are searching in
+		source: int - node index of the start location
+		target: int - node index of the end location
+
+	return: list of node indices - the shortest path from source to target, or None if there is no path
+	"""
+	if source == target:
+		return [source]
+
+	adjacencies = (compiled.adjacency(), compiled.reverse_adjacency())
+	distances = ({source: 0}, {target: 0})
+	previous_nodes = ({source: -1}, {target: -1})
+	settled = (set(), set())
+	queues = ([(0, source)], [(0, target)])
+
+	best_distance = float("inf")
+	meeting_node = -1
+
+	while queues[0] and queues[1]:
+		#no route through an unsettled node can be shorter than the best one found
+		if queues[0][0][0] + queues[1][0][0] >= best_distance:
+			break
+
+		direction = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+		other_direction = 1 - direction
+
+		distance, current_node = heapq.heappop(queues[direction])
+		if current_node in settled[direction]:
+			continue
+		settled[direction].add(current_node)
+
+		for next_node, length, _ in adjacencies[direction][current_node]:
+			new_distance = distance + length
+			if new_distance < distances[direction].get(next_node, float("inf")):
+				distances[direction][next_node] = new_distance
+				previous_nodes[direction][next_node] = current_node
+				heapq.heappush(queues[direction], (new_distance, next_node))
+
+			if next_node in distances[other_direction]:
+				route_distance = distances[direction][next_node] + distances[other_direction][next_node]
+				if route_distance < best_distance:
+					best_distance = route_distance
+					meeting_node = next_node
+
+	if meeting_node == -1:
+		return None
+
+	path = []
+	current_node = meeting_node
+	while current_node != -1:
+		path.append(current_node)
+		current_node = previous_nodes[0][current_node]
+	path.reverse()
+
+	current_node = previous_nodes[1][meeting_node]
+	while current_node != -1:
+		path.append(current_node)
+		current_node = previous_nodes[1][current_node]
+	return path
+
+def astar_shortest_path(compiled, source, target, lower_bounds):
+	"""
+	Runs A* from `source` to `target`, using `lower_bounds` (a consistent lower bound on the remaining distance of
+	every node, such as the landmark bounds) as the heuristic.
+
+	params:
+		compiled: CompiledGraph - the area we are searching in
+		source: int - node index of the start location
+		target: int - node index of the end location
+		lower_bounds: list of floats - lower bound on the distance from every node to target (inf if unreachable)
+
+	return: list of node indices - the shortest path from source to target, or None if there is no path
+	"""
+	adjacency = compiled.adjacency()
+
+	distances = {source: 0}
+	previous_nodes = {source: -1}
+	settled = set()
+	queue = [(lower_bounds[source], 0, source)]
+
+	while queue:
+		_, distance, current_node = heapq.heappop(queue)
+		if current_node in settled:
+			continue
+		settled.add(current_node)
+
+		if current_node == target:
+			path = []
+			while current_node != -1:
+				path.append(current_node)
+				current_node = previous_nodes[current_node]
+			path.reverse()
+			return path
+
+		for next_node, length, _ in adjacency[current_node]:
+			new_distance = distance + length
+			if new_distance < distances.get(next_node, float("inf")) and lower_bounds[next_node] != float("inf"):
+				distances[next_node] = new_distance
+				previous_nodes[next_node] = current_node
+				heapq.heappush(queue, (new_distance + lower_bounds[next_node], new_distance, next_node))
+
+	return None
+
+_reverse_trees = weakref.WeakKeyDictionary()
+
+def get_reverse_tree(compiled, end):
+	"""
+	Returns the reverse shortest distance tree rooted at `end`, i.e. the shortest distance from every node to `end`.
+	A handful of recent trees are cached per graph so the distance bound, the lower bounds used for pruning and the
+	shortest path shown to the user all come from one Dijkstra run per query.
+
+	params:
+		compiled: CompiledGraph - the area we are searching in
+		end: int - node index of the end location
+
+	return: ShortestDistanceTree
+	"""
+	trees = _reverse_trees.get(compiled)
+	if trees is None:
+		trees = OrderedDict()
+		_reverse_trees[compiled] = trees
+
+	tree = trees.get(end)
+	if tree is None:
+		tree = shortest_distance_tree(compiled, end, reverse=True)
+		trees[end] = tree
+		if len(trees) > TREE_CACHE_SIZE:
+			trees.popitem(last=False)
+	else:
+		trees.move_to_end(end)
+	return tree
+
+def has_reverse_tree(compiled, end):
+	"""
+	Checks whether the reverse shortest distance tree rooted at `end` is already cached.
+
+	params:
+		compiled: CompiledGraph
+		end: int - node index of the end location
+
+	return: bool
+	"""
+	trees = _reverse_trees.get(compiled)
+	return trees is not None and end in trees
+
+def path_length(compiled, path):
+	"""
+	Sums the edge lengths along a path of node indices, in the direction of travel.
+
+	params:
+		compiled: CompiledGraph
+		path: list of node indices
+
+	return: float
+	"""
+	length = 0
+	for i in range(len(path) - 1):
+		length += compiled.edge_length(path[i], path[i + 1])
+	return length
+
+def path_elevation_gain(compiled, path):
+	"""
+	Sums the elevation gains along a path of node indices, in the direction of travel.
+
+	params:
+		compiled: CompiledGraph
+		path: list of node indices
+
+	return: float
+	"""
+	adjacency = compiled.adjacency()
+	elevation = 0
+	for i in range(len(path) - 1):
+		for next_node, _, elevation_gain in adjacency[path[i]]:
+			if next_node == path[i + 1]:
+				elevation += elevation_gain
+				break
+	return elevation
@@ -0,0 +1,485 @@
+import sys
+import math
+import numpy as np
+
+sys.path.insert(0, '.')
+from src.heuristics import EARTH_RADIUS
+from src.compiled_graph import SnappedGraph
+
+#locations this close to a node (as a fraction of the edge) are snapped to the node itself
+SNAP_TOLERANCE = 1e-6
+
+class SpatialIndex:
+	"""
+		SpatialIndex is a uniform grid over the nodes and edges of a compiled graph, used to snap locations to the
+		map. Coordinates are projected to meters on a flat (equirectangular) projection centered on the map, which
+		is accurate to a fraction of a percent over a city. The grid cells are numbered row by row and the items in
+		each cell are stored in CSR form: the nodes in cell c are node_items[node_offsets[c]:node_offsets[c+1]], and
+		likewise for the edge segments (every straight piece of an edge's shape is stored in each cell its bounding
+		box overlaps).
+
+		A query searches rings of cells around the location, stopping once the closest item found is nearer than
+		any cell left to search, so it only looks at a handful of cells.
+	"""
+
+	def __init__(self, node_ids, grid, shape, node_x, node_y, node_offsets, node_items,
+			segment_sources, segment_targets, segment_x, segment_y, segment_fractions, segment_offsets, segment_items):
+		"""
+		params:
+			node_ids: numpy array - node IDs of the compiled graph the index was built for, in index order
+			grid: numpy array of floats - origin x, origin y, cell size (meters) and the x and y scales (meters
+				per degree of longitude and latitude)
+			shape: numpy array of ints - number of columns and rows of the grid
+			node_x, node_y: numpy arrays of floats - projected coordinates of every node
+			node_offsets, node_items: numpy arrays of ints - nodes in every cell
+			segment_sources, segment_targets: numpy arrays of ints - node indices of the edge every segment belongs to
+			segment_x, segment_y: numpy arrays of floats (segments x 2) - projected end points of every segment
+			segment_fractions: numpy array of floats (segments x 2) - position of the end points along their edge,
+				from 0 (the source node) to 1 (the target node)
+			segment_offsets, segment_items: numpy arrays of ints - segments overlapping every cell
+		"""
+		self.node_ids = node_ids
+		self.grid = grid
+		self.shape = shape
+		self.node_x = node_x
+		self.node_y = node_y
+		self.node_offsets = node_offsets
+		self.node_items = node_items
+		self.segment_sources = segment_sources
+		self.segment_targets = segment_targets
+		self.segment_x = segment_x
+		self.segment_y = segment_y
+		self.segment_fractions = segment_fractions
+		self.segment_offsets = segment_offsets
+		self.segment_items = segment_items
+
+		self._lists = None
+
+	def matches(self, compiled):
+		"""
+		Checks that the index was built for `compiled`.
+
+		params:
+			compiled: CompiledGraph
+
+		return: bool
+		"""
+		return len(self.node_ids) == compiled.node_count and np.array_equal(self.node_ids, compiled.node_ids)
+
+	def nearest_node(self, longitude, latitude):
+		"""
+		Finds the node closest to a location.
+
+		params:
+			longitude: float
+			latitude: float
+
+		return: (node index, distance in meters), or (-1, inf) if the graph has no nodes
+		"""
+		x, y = self._project(longitude, latitude)
+		lists = self._get_lists()
+		node_x, node_y = lists["node_x"], lists["node_y"]
+
+		def get_distance(node):
+			return math.hypot(node_x[node] - x, node_y[node] - y), None
+
+		node, distance, _ = self._search(x, y, lists["node_offsets"], lists["node_items"], get_distance)
+		return node, distance
+
+	def nearest_nodes(self, longitudes, latitudes):
+		"""
+		Finds the node closest to each of many locations, searching for all of them at once.
+
+		params:
+			longitudes: list or numpy array of floats
+			latitudes: list or numpy array of floats
+
+		return: (numpy array of node indices, numpy array of distances in meters)
+		"""
+		x, y = self._project(np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64))
+
+		def get_distances(queries, nodes):
+			return np.hypot(self.node_x[nodes] - x[queries], self.node_y[nodes] - y[queries]), None
+
+		nodes, distances, _ = self._search_many(x, y, self.node_offsets, self.node_items, get_distances)
+		return nodes, distances
+
+	def nearest_edge(self, longitude, latitude):
+		"""
+		Finds the edge closest to a location, following the edge's shape when the graph has its geometry. Both
+		directions of a two-way street are the same distance away; the first one found is returned.
+
+		params:
+			longitude: float
+			latitude: float
+
+		return: (source node index, target node index, position of the closest point along the edge from 0 to 1,
+			distance in meters), or (-1, -1, 0.0, inf) if the graph has no edges
+		"""
+		x, y = self._project(longitude, latitude)
+		lists = self._get_lists()
+		segment_x, segment_y = lists["segment_x"], lists["segment_y"]
+
+		def get_distance(segment):
+			(x1, x2), (y1, y2) = segment_x[segment], segment_y[segment]
+			dx, dy = x2 - x1, y2 - y1
+			squared_length = dx * dx + dy * dy
+			t = min(max(((x - x1) * dx + (y - y1) * dy) / squared_length, 0.0), 1.0) if squared_length > 0 else 0.0
+			return math.hypot(x1 + t * dx - x, y1 + t * dy - y), t
+
+		segment, distance, t = self._search(x, y, lists["segment_offsets"], lists["segment_items"], get_distance)
+		if segment == -1:
+			return -1, -1, 0.0, distance
+
+		start, end = lists["segment_fractions"][segment]
+		return lists["segment_sources"][segment], lists["segment_targets"][segment], start + t * (end - start), distance
+
+	def nearest_edges(self, longitudes, latitudes):
+		"""
+		Finds the edge closest to each of many locations, searching for all of them at once.
+
+		params:
+			longitudes: list or numpy array of floats
+			latitudes: list or numpy array of floats
+
+		return: (numpy array of source node indices, numpy array of target node indices, numpy array of positions
+			along the edges, numpy array of distances in meters)
+		"""
+		x, y = self._project(np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64))
+
+		def get_distances(queries, segments):
+			x1, x2 = self.segment_x[segments, 0], self.segment_x[segments, 1]
+			y1, y2 = self.segment_y[segments, 0], self.segment_y[segments, 1]
+			dx, dy = x2 - x1, y2 - y1
+			squared_lengths = dx * dx + dy * dy
+			with np.errstate(divide="ignore", invalid="ignore"):
+				t = np.where(squared_lengths > 0, np.clip(((x[queries] - x1) * dx + (y[queries] - y1) * dy) / squared_lengths, 0, 1), 0.0)
+			return np.hypot(x1 + t * dx - x[queries], y1 + t * dy - y[queries]), t
+
+		segments, distances, t = self._search_many(x, y, self.segment_offsets, self.segment_items, get_distances)
+		found = segments != -1
+		sources = np.where(found, self.segment_sources[segments], -1)
+		targets = np.where(found, self.segment_targets[segments], -1)
+		starts, ends = self.segment_fractions[segments, 0], self.segment_fractions[segments, 1]
+		positions = np.where(found, starts + t * (ends - starts), 0.0)
+		return sources, targets, positions, distances
+
+	def save(self, filename):
+		"""
+		Stores the index in a `.npz` file next to the cached map.
+
+		params:
+			filename: path of the file
+		"""
+		with open(filename, "wb") as file:
+			np.savez(file, node_ids=self.node_ids, grid=self.grid, shape=self.shape,
+				node_x=self.node_x, node_y=self.node_y, node_offsets=self.node_offsets, node_items=self.node_items,
+				segment_sources=self.segment_sources, segment_targets=self.segment_targets, segment_x=self.segment_x, segment_y=self.segment_y,
+				segment_fractions=self.segment_fractions, segment_offsets=self.segment_offsets, segment_items=self.segment_items)
+
+	@classmethod
+	def load(cls, filename):
+		"""
+		Loads an index stored by `save`.
+
+		params:
+			filename: path of the file
+
+		return: SpatialIndex
+		"""
+		with np.load(filename) as data:
+			return cls(data["node_ids"], data["grid"], data["shape"],
+				data["node_x"], data["node_y"], data["node_offsets"], data["node_items"],
+				data["segment_sources"], data["segment_targets"], data["segment_x"], data["segment_y"],
+				data["segment_fractions"], data["segment_offsets"], data["segment_items"])
+
+	def _project(self, longitude, latitude):
+		grid = self._get_lists()["grid"]
+		return longitude * grid[3], latitude * grid[4]
+
+	def _get_lists(self):
+		#a query only looks at a few items, which is much faster on python lists than on numpy arrays
+		if self._lists is None:
+			self._lists = {name: getattr(self, name).tolist() for name in ("grid", "shape", "node_x", "node_y", "node_offsets", "node_items",
+				"segment_sources", "segment_targets", "segment_x", "segment_y", "segment_fractions", "segment_offsets", "segment_items")}
+		return self._lists
+
+	def _search(self, x, y, offsets, items, get_distance):
+		lists = self._get_lists()
+		origin_x, origin_y, cell_size = lists["grid"][:3]
+		columns, rows = lists["shape"]
+		grid_right, grid_bottom = origin_x + columns * cell_size, origin_y + rows * cell_size
+
+		#locations outside the map start from the closest cell
+		column = min(max(int((x - origin_x) // cell_size), 0), columns - 1)
+		row = min(max(int((y - origin_y) // cell_size), 0), rows - 1)
+
+		best_item = -1
+		best_distance = float("inf")
+		best_extra = None
+		ring = 0
+		while True:
+			left, right, top, bottom = column - ring, column + ring, row - ring, row + ring
+
+			#the cells of a ring are its first and last rows plus the two cells at the ends of every row in between
+			slices = []
+			first_column, last_column = max(left, 0), min(right, columns - 1)
+			for ring_row in range(max(top, 0), min(bottom, rows - 1) + 1):
+				if ring_row == top or ring_row == bottom:
+					slices.append((ring_row * columns + first_column, ring_row * columns + last_column + 1))
+				else:
+					if left >= 0:
+						slices.append((ring_row * columns + left, ring_row * columns + left + 1))
+					if right < columns:
+						slices.append((ring_row * columns + right, ring_row * columns + right + 1))
+
+			for start, end in slices:
+				for i in range(offsets[start], offsets[end]):
+					distance, extra = get_distance(items[i])
+					if distance < best_distance:
+						best_item, best_distance, best_extra = items[i], distance, extra
+
+			#the cells not searched yet are in the parts of the grid beyond the sides of the searched square
+			bound = float("inf")
+			if left > 0:
+				bound = min(bound, _rectangle_distance(x, y, origin_x, origin_y, origin_x + left * cell_size, grid_bottom))
+			if right < columns - 1:
+				bound = min(bound, _rectangle_distance(x, y, origin_x + (right + 1) * cell_size, origin_y, grid_right, grid_bottom))
+			if top > 0:
+				bound = min(bound, _rectangle_distance(x, y, origin_x, origin_y, grid_right, origin_y + top * cell_size))
+			if bottom < rows - 1:
+				bound = min(bound, _rectangle_distance(x, y, origin_x, origin_y + (bottom + 1) * cell_size, grid_right, grid_bottom))
+			if best_distance <= bound:
+				return best_item, best_distance, best_extra
+			ring += 1
+
+	def _search_many(self, x, y, offsets, items, get_distances):
+		#the same ring search as `_search`, run on every location that still needs another ring at once
+		origin_x, origin_y, cell_size = float(self.grid[0]), float(self.grid[1]), float(self.grid[2])
+		columns, rows = int(self.shape[0]), int(self.shape[1])
+		grid_right, grid_bottom = origin_x + columns * cell_size, origin_y + rows * cell_size
+
+		column = np.clip(np.floor((x - origin_x) / cell_size), 0, columns - 1).astype(np.int64)
+		row = np.clip(np.floor((y - origin_y) / cell_size), 0, rows - 1).astype(np.int64)
+
+		best_items = np.full(len(x), -1, dtype=np.int64)
+		best_distances = np.full(len(x), np.inf)
+		best_extras = np.zeros(len(x))
+		active = np.arange(len(x))
+		ring = 0
+		while len(active) > 0:
+			#cells of the ring around every active location, as offsets from its cell, in the order `_search` visits them
+			ring_cells = [(column_offset, row_offset) for row_offset in range(-ring, ring + 1)
+				for column_offset in (range(-ring, ring + 1) if abs(row_offset) == ring else sorted({-ring, ring}))]
+			column_offsets, row_offsets = (np.array(offsets, dtype=np.int64) for offsets in zip(*ring_cells))
+
+			queries = np.repeat(active, len(column_offsets))
+			cell_columns = np.tile(column_offsets, len(active)) + column[queries]
+			cell_rows = np.tile(row_offsets, len(active)) + row[queries]
+			inside = (cell_columns >= 0) & (cell_columns < columns) & (cell_rows >= 0) & (cell_rows < rows)
+			queries, cells = queries[inside], (cell_rows * columns + cell_columns)[inside]
+
+			#every (location, item) pair in those cells
+			counts = offsets[cells + 1] - offsets[cells]
+			item_queries = np.repeat(queries, counts)
+			item_positions = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(offsets[cells], counts)
+			if len(item_positions) > 0:
+				candidates = items[item_positions]
+				distances, extras = get_distances(item_queries, candidates)
+
+				#the closest candidate of every location, keeping the earliest one on ties
+				order = np.lexsort((distances, item_queries))
+				first = np.ones(len(order), dtype=bool)
+				first[1:] = item_queries[order][1:] != item_queries[order][:-1]
+				closest = order[first]
+				better = distances[closest] < best_distances[item_queries[closest]]
+				closest = closest[better]
+				best_items[item_queries[closest]] = candidates[closest]
+				best_distances[item_queries[closest]] = distances[closest]
+				if extras is not None:
+					best_extras[item_queries[closest]] = extras[closest]
+
+			#the same bound as `_search`: the distance to the parts of the grid beyond the sides of the searched square
+			left, right = column[active] - ring, column[active] + ring
+			top, bottom = row[active] - ring, row[active] + ring
+			active_x, active_y = x[active], y[active]
+			bounds = np.full(len(active), np.inf)
+			for outside, rectangle in ((left > 0, (origin_x, origin_y, origin_x + left * cell_size, grid_bottom)),
+					(right < columns - 1, (origin_x + (right + 1) * cell_size, origin_y, grid_right, grid_bottom)),
+					(top > 0, (origin_x, origin_y, grid_right, origin_y + top * cell_size)),
+					(bottom < rows - 1, (origin_x, origin_y + (bottom + 1) * cell_size, grid_right, grid_bottom))):
+				rectangle_left, rectangle_top, rectangle_right, rectangle_bottom = rectangle
+				distances = np.hypot(np.maximum(np.maximum(rectangle_left - active_x, 0), active_x - rectangle_right),
+					np.maximum(np.maximum(rectangle_top - active_y, 0), active_y - rectangle_bottom))
+				bounds = np.where(outside, np.minimum(bounds, distances), bounds)
+
+			active = active[best_distances[active] > bounds]
+			ring += 1
+
+		return best_items, best_distances, best_extras
+
+
+def build_spatial_index(compiled, cell_size=None):
+	"""
+	Builds the spatial index of `compiled`, using the edge shapes from its geometry side file when it has one.
+
+	params:
+		compiled: CompiledGraph
+		cell_size: float - width of a grid cell in meters (None to pick one with about four cells per node, which
+			keeps the cells around a location small even where the streets are dense)
+
+	return: SpatialIndex
+	"""
+	valid = ~(np.isnan(compiled.x) | np.isnan(compiled.y))
+	center_latitude = float(np.mean(compiled.y[valid])) if valid.any() else 0.0
+	y_scale = np.radians(1) * EARTH_RADIUS
+	x_scale = y_scale * np.cos(np.radians(center_latitude))
+	node_x = np.asarray(compiled.x, dtype=np.float64) * x_scale
+	node_y = np.asarray(compiled.y, dtype=np.float64) * y_scale
+
+	segment_sources, segment_targets, segment_x, segment_y, segment_fractions = _get_segments(compiled, x_scale, y_scale)
+
+	#the grid covers the nodes and the shapes of the edges
+	all_x = np.concatenate((node_x[valid], segment_x.ravel()))
+	all_y = np.concatenate((node_y[valid], segment_y.ravel()))
+	origin_x, origin_y = (float(all_x.min()), float(all_y.min())) if len(all_x) else (0.0, 0.0)
+	width, height = (float(all_x.max()) - origin_x, float(all_y.max()) - origin_y) if len(all_x) else (0.0, 0.0)
+
+	if cell_size is None:
+		cell_size = np.sqrt(width * height / (4 * max(int(valid.sum()), 1)))
+	cell_size = max(float(cell_size), 1.0)
+	columns = int(width // cell_size) + 1
+	rows = int(height // cell_size) + 1
+
+	def get_columns(x):
+		return np.clip(np.floor((x - origin_x) / cell_size), 0, columns - 1).astype(np.int64)
+
+	def get_rows(y):
+		return np.clip(np.floor((y - origin_y) / cell_size), 0, rows - 1).astype(np.int64)
+
+	#nodes without coordinates can never be the closest
+	nodes = np.flatnonzero(valid)
+	node_offsets, node_items = _to_cells(get_rows(node_y[nodes]) * columns + get_columns(node_x[nodes]), nodes, columns * rows)
+
+	#every segment goes in each cell its bounding box overlaps
+	first_columns, last_columns = get_columns(segment_x.min(axis=1)), get_columns(segment_x.max(axis=1))
+	first_rows, last_rows = get_rows(segment_y.min(axis=1)), get_rows(segment_y.max(axis=1))
+	box_widths = last_columns - first_columns + 1
+	box_sizes = box_widths * (last_rows - first_rows + 1)
+
+	segments = np.repeat(np.arange(len(segment_x)), box_sizes)
+	box_starts = np.repeat(np.cumsum(box_sizes) - box_sizes, box_sizes)
+	cell_numbers = np.arange(len(segments)) - box_starts
+	segment_columns = first_columns[segments] + cell_numbers % box_widths[segments]
+	segment_rows = first_rows[segments] + cell_numbers // box_widths[segments]
+	segment_offsets, segment_items = _to_cells(segment_rows * columns + segment_columns, segments, columns * rows)
+
+	return SpatialIndex(compiled.node_ids, np.array([origin_x, origin_y, cell_size, x_scale, y_scale]), np.array([columns, rows], dtype=np.int64),
+		node_x, node_y, node_offsets, node_items,
+		segment_sources, segment_targets, segment_x, segment_y, segment_fractions, segment_offsets, segment_items)
+
+def get_spatial_index(compiled):
+	"""
+	Returns the spatial index attached to `compiled`, building and attaching it the first time if the map was not
+	stored with one.
+
+	params:
+		compiled: CompiledGraph
+
+	return: SpatialIndex
+	"""
+	if compiled.spatial_index is None:
+		compiled.spatial_index = build_spatial_index(compiled)
+	return compiled.spatial_index
+
+def snap_locations(compiled, longitudes, latitudes):
+	"""
+	Snaps locations to the closest point on the closest edge of `compiled`. A virtual node is added at every point
+	that is not (within `SNAP_TOLERANCE`) a node of the graph, in a view that leaves `compiled` unmodified.
+
+	params:
+		compiled: CompiledGraph
+		longitudes: list or numpy array of floats
+		latitudes: list or numpy array of floats
+
+	return: (SnappedGraph, list of node IDs of the snapped locations in the view)
+	"""
+	#snapping a view starts over from its base graph
+	if isinstance(compiled, SnappedGraph):
+		compiled = compiled.base
+
+	sources, targets, positions, _ = get_spatial_index(compiled).nearest_edges(longitudes, latitudes)
+	if (sources == -1).any():
+		raise ValueError("The map has no edges to snap to.")
+
+	virtual_nodes = []
+	nodes = []
+	for source, target, position in zip(sources.tolist(), targets.tolist(), positions.tolist()):
+		if position <= SNAP_TOLERANCE:
+			nodes.append(compiled.node_id(source))
+		elif position >= 1 - SNAP_TOLERANCE:
+			nodes.append(compiled.node_id(target))
+		else:
+			virtual_nodes.append((source, target, position))
+			nodes.append(-len(virtual_nodes))
+	return SnappedGraph(compiled, virtual_nodes), nodes
+
+def _get_segments(compiled, x_scale, y_scale):
+	#splits the shape of every edge into straight segments, with their position along the edge
+	sources = np.repeat(np.arange(compiled.node_count), np.diff(compiled.offsets))
+	targets = np.asarray(compiled.targets, dtype=np.int64)
+
+	geometry = compiled._get_geometry()
+	if geometry is None:
+		point_counts = np.zeros(len(targets), dtype=np.int64)
+	else:
+		point_offsets, point_x, point_y = geometry
+		point_counts = np.diff(point_offsets)
+
+	#edges without a stored shape are a straight line between their nodes
+	point_counts = np.where(point_counts >= 2, point_counts, 2)
+	starts = np.cumsum(point_counts) - point_counts
+	shape_x = np.empty(int(point_counts.sum()), dtype=np.float64)
+	shape_y = np.empty(len(shape_x), dtype=np.float64)
+	shape_x[starts], shape_y[starts] = compiled.x[sources], compiled.y[sources]
+	shape_x[starts + point_counts - 1], shape_y[starts + point_counts - 1] = compiled.x[targets], compiled.y[targets]
+	point_edges = np.repeat(np.arange(len(targets)), point_counts)
+	if geometry is not None:
+		shape_points = np.flatnonzero(np.diff(point_offsets)[point_edges] >= 2)
+		stored_points = point_offsets[:-1][point_edges[shape_points]] + shape_points - starts[point_edges[shape_points]]
+		shape_x[shape_points], shape_y[shape_points] = point_x[stored_points], point_y[stored_points]
+	shape_x *= x_scale
+	shape_y *= y_scale
+
+	#segment i goes from shape point i to i + 1, except across the end of an edge
+	is_first_point = np.ones(len(shape_x), dtype=bool)
+	is_first_point[starts + point_counts - 1] = False
+	first_points = np.flatnonzero(is_first_point)
+	edges = point_edges[first_points]
+
+	segment_x = np.stack((shape_x[first_points], shape_x[first_points + 1]), axis=1)
+	segment_y = np.stack((shape_y[first_points], shape_y[first_points + 1]), axis=1)
+	segment_lengths = np.hypot(segment_x[:, 1] - segment_x[:, 0], segment_y[:, 1] - segment_y[:, 0])
+
+	#position of every segment's end points along its edge, as a fraction of the edge's shape length
+	cumulative_lengths = np.cumsum(segment_lengths)
+	edge_firsts = np.cumsum(point_counts - 1) - (point_counts - 1)
+	edge_starts = np.repeat(cumulative_lengths[edge_firsts] - segment_lengths[edge_firsts], point_counts - 1) if len(edges) else np.zeros(0)
+	edge_lengths = np.repeat(np.add.reduceat(segment_lengths, edge_firsts), point_counts - 1) if len(edges) else np.zeros(0)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		segment_ends = np.where(edge_lengths > 0, (cumulative_lengths - edge_starts) / edge_lengths, 1.0)
+		segment_starts = np.where(edge_lengths > 0, (cumulative_lengths - segment_lengths - edge_starts) / edge_lengths, 0.0)
+
+	#segments of nodes without coordinates can never be the closest
+	valid = ~(np.isnan(segment_x).any(axis=1) | np.isnan(segment_y).any(axis=1))
+	return (sources[edges][valid], targets[edges][valid], segment_x[valid], segment_y[valid],
+		np.stack((segment_starts, segment_ends), axis=1)[valid])
+
+def _rectangle_distance(x, y, left, top, right, bottom):
+	return math.hypot(max(left - x, 0.0, x - right), max(top - y, 0.0, y - bottom))
+
+def _to_cells(cells, items, cell_count):
+	order = np.argsort(cells, kind="stable")
+	offsets = np.zeros(cell_count + 1, dtype=np.int64)
+	np.cumsum(np.bincount(cells, minlength=cell_count), out=offsets[1:])
+	return offsets, np.asarray(items, dtype=np.int64)[order]
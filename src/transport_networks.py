@@ -0,0 +1,170 @@
+import re
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import networkx as nx
+import osmnx
+
+#every network is derived from one download of the "all" network, which contains the ways of all of them
+TRANSPORT_METHODS = ["drive", "bike", "walk"]
+
+#a condition of an Overpass filter: ["key"], ["key"~"regex"] or ["key"!~"regex"]
+_FILTER_CONDITION = re.compile(r'\["([^"]+)"(?:(!?~)"([^"]*)")?\]')
+
+def get_osm_filter(network_type):
+	"""
+	Returns the Overpass filter string osmnx uses to download a network type. osmnx 1.1.2 has no public API for
+	it, so this is the only place that calls its private `osmnx.downloader._get_osm_filter`. The tests pin the
+	output, so an osmnx upgrade that changes it fails loudly.
+
+	params:
+		network_type: string - "drive", "bike", "walk" or "all"
+
+	return: string
+	"""
+	get_filter = getattr(osmnx.downloader, "_get_osm_filter", None)
+	if get_filter is None:
+		raise RuntimeError("osmnx {} does not have downloader._get_osm_filter, which the network filters are read from; install the osmnx version in requirements.txt.".format(osmnx.__version__))
+	return get_filter(network_type)
+
+def get_tag_filter(network_type):
+	"""
+	Returns the conditions osmnx uses to select the ways of a network type in the Overpass API, so the ways of
+	the network can be selected from a superset network with the same result.
+
+	params:
+		network_type: string - "drive", "bike", "walk" or "all"
+
+	return: list of (key, operator, compiled regex) tuples, where operator is None (the way has the tag), "~"
+		(the tag matches the regex) or "!~" (the way does not have the tag or it does not match the regex)
+	"""
+	osm_filter = get_osm_filter(network_type)
+	return [(key, operator or None, re.compile(regex) if operator else None) for key, operator, regex in _FILTER_CONDITION.findall(osm_filter)]
+
+def matches_tag_filter(tags, tag_filter):
+	"""
+	Checks whether a way with `tags` passes a filter from `get_tag_filter`. Like in the Overpass API, regexes
+	match anywhere in the tag value.
+
+	params:
+		tags: dict of tag values
+		tag_filter: list of (key, operator, compiled regex) tuples
+
+	return: bool
+	"""
+	for key, operator, regex in tag_filter:
+		value = tags.get(key)
+		if operator is None:
+			if value is None:
+				return False
+		elif operator == "~":
+			if value is None or not regex.search(str(value)):
+				return False
+		elif value is not None and regex.search(str(value)):
+			return False
+	return True
+
+def get_filter_keys():
+	"""
+	Returns the tag keys checked by the filter of any network type.
+
+	return: list of strings
+	"""
+	keys = []
+	for network_type in TRANSPORT_METHODS + ["all"]:
+		keys.extend(key for key, _, _ in get_tag_filter(network_type))
+	return list(dict.fromkeys(keys))
+
+@contextmanager
+def _keeping_filter_tags():
+	#osmnx only keeps a few way tags on the edges, which do not include all the tags the filters check
+	useful_tags_way = osmnx.settings.useful_tags_way
+	osmnx.settings.useful_tags_way = list(dict.fromkeys(useful_tags_way + get_filter_keys()))
+	try:
+		yield useful_tags_way
+	finally:
+		osmnx.settings.useful_tags_way = useful_tags_way
+
+def download_superset_network(place_query):
+	"""
+	Downloads the unsimplified "all" network of a place from the OSM API, keeping the way tags needed to derive
+	the other networks from it.
+
+	params:
+		place_query: dict of city, state, country
+
+	return: networkx.MultiDiGraph
+	"""
+	with _keeping_filter_tags():
+		return osmnx.graph_from_place(place_query, network_type="all", simplify=False, retain_all=True)
+
+def load_superset_network(osm_filename):
+	"""
+	Loads the unsimplified network of every way in a local OSM XML extract, keeping the way tags needed to derive
+	the transport networks from it.
+
+	params:
+		osm_filename: path of the .osm XML file
+
+	return: networkx.MultiDiGraph
+	"""
+	with _keeping_filter_tags():
+		return osmnx.graph_from_xml(osm_filename, bidirectional=False, simplify=False, retain_all=True)
+
+def derive_network(graph, network_type, retain_all=False):
+	"""
+	Derives the network of a transport method from an unsimplified superset network: selects the edges whose
+	way passes the osmnx filter of the transport method, makes every edge two-way for walking (like osmnx does),
+	simplifies the result and keeps its largest weakly connected component.
+
+	params:
+		graph: networkx.MultiDiGraph - unsimplified network from `download_superset_network` or
+			`load_superset_network`
+		network_type: string - "drive", "bike" or "walk"
+		retain_all: bool - if True, keep every component
+
+	return: networkx.MultiDiGraph
+	"""
+	tag_filter = get_tag_filter(network_type)
+	bidirectional = network_type in osmnx.settings.bidirectional_network_types
+	filter_keys = set(get_filter_keys()) - set(osmnx.settings.useful_tags_way)
+
+	network = nx.MultiDiGraph(**graph.graph)
+	for node1, node2, data in graph.edges(data=True):
+		if not matches_tag_filter(data, tag_filter):
+			continue
+
+		#the tags only used for filtering are dropped, so the network has the attributes osmnx would give it
+		data = {key: value for key, value in data.items() if key not in filter_keys}
+		network.add_node(node1, **graph.nodes[node1])
+		network.add_node(node2, **graph.nodes[node2])
+
+		if bidirectional and data.get("oneway"):
+			data["oneway"] = False
+			network.add_edge(node2, node1, **data)
+		network.add_edge(node1, node2, **data)
+
+	if len(network.edges) == 0:
+		raise ValueError("No {} network in the downloaded area.".format(network_type))
+
+	network = osmnx.simplify_graph(network)
+	if not retain_all:
+		network = osmnx.utils_graph.get_largest_component(network)
+
+	nx.set_node_attributes(network, values=osmnx.stats.count_streets_per_node(network), name="street_count")
+	return network
+
+def derive_networks(graph, network_types=TRANSPORT_METHODS, workers=None):
+	"""
+	Derives the network of every transport method from one superset network, each in its own worker process.
+
+	params:
+		graph: networkx.MultiDiGraph - unsimplified network from `download_superset_network` or
+			`load_superset_network`
+		network_types: list of strings
+		workers: int - number of worker processes (None for one per network)
+
+	return: dict of network type to networkx.MultiDiGraph
+	"""
+	with ProcessPoolExecutor(max_workers=workers or len(network_types)) as executor:
+		networks = executor.map(derive_network, [graph] * len(network_types), network_types)
+		return dict(zip(network_types, networks))
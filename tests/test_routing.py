@@ -3,11 +3,22 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import pytest
 import osmnx
+import numpy as np
 import sys
+import os
+import json
+import csv
+import threading
+import asyncio
+import time
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 sys.path.insert(0, '.')
 
-from src import routing_actions, routing_helper, context
+from src import routing_actions, routing_helper, context, compiled_graph, map, shortest_distance, heuristics, landmarks, contraction_hierarchy, elevation, transport_networks, osm_extract, spatial_index, geocoder, service, query_executor, batch_routing, distance_matrix
+#the label_setting fixture takes the name of the module
+from src import label_setting as label_setting_module
 
 @pytest.fixture(scope="session")
 def small_test_graph():
@@ -27,6 +38,19 @@ def medium_test_graph():
 		graph = pkl.load(file)
 		return graph
 
+@pytest.fixture(scope="session")
+def compiled_map(medium_test_graph, tmp_path_factory):
+	filename = str(tmp_path_factory.mktemp("maps") / "test-medium-graph.pkl")
+	with open(filename, "wb") as file:
+		pkl.dump(medium_test_graph, file)
+	map.build_compiled_map_file(filename)
+	return filename
+
+def sleep_on_graph(compiled, seconds):
+	#runs in the worker processes of a QueryExecutor
+	time.sleep(seconds)
+	return compiled.node_count
+
 @pytest.fixture(scope="session")
 def dijkstra():
 	dijkstra_context = context.Context(routing_actions.RoutingDijkstra())
@@ -42,6 +66,16 @@ def dfs():
 	dfs_context = context.Context(routing_actions.RoutingDFS())
 	return dfs_context
 
+@pytest.fixture(scope="session")
+def bidirectional():
+	bidirectional_context = context.Context(routing_actions.RoutingBidirectional())
+	return bidirectional_context
+
+@pytest.fixture(scope="session")
+def label_setting():
+	label_setting_context = context.Context(routing_actions.RoutingLabelSetting())
+	return label_setting_context
+
 class TestUtils:
 	def test_get_path_elevation(self, small_test_graph):
 		path = [1, 0, 4]
@@ -70,6 +104,1181 @@ class TestUtils:
 		expected_max_length = 10.5
 		assert max_length == expected_max_length
 
+	def test_add_edge_elevation_data(self, small_test_graph):
+		graph = map.add_edge_elevation_data(small_test_graph.copy())
+
+		for node1, node2, data in graph.edges(data=True):
+			elevation_diff = graph.nodes[node2]["elevation"] - graph.nodes[node1]["elevation"]
+			assert data["elevation_gain"] == routing_helper.RoutingHelper().get_elevation_diff(graph, node1, node2)
+			assert data["grade"] * data["length"] == pytest.approx(elevation_diff)
+
+	def test_get_path_elevation_with_edge_elevation_data(self, small_test_graph):
+		graph = map.upgrade_graph(small_test_graph.copy())
+		path = [1, 0, 4]
+
+		assert routing_helper.RoutingHelper().get_path_elevation(path, graph) == 13
+		assert compiled_graph.compile_graph(graph).elevation_gains.tolist() == compiled_graph.compile_graph(small_test_graph).elevation_gains.tolist()
+
+class TestCompiledGraph:
+	def test_compiled_graph_structure(self, small_test_graph):
+		compiled = compiled_graph.compile_graph(small_test_graph)
+
+		assert compiled.node_count == small_test_graph.number_of_nodes()
+		assert compiled.offsets[-1] == compiled.edge_count
+
+		for node in small_test_graph.nodes:
+			index = compiled.index_of(node)
+			targets = compiled.targets[compiled.offsets[index]:compiled.offsets[index + 1]]
+			expected_targets = {compiled.index_of(next_node) for next_node in small_test_graph.successors(node) if next_node != node}
+			assert set(targets.tolist()) == expected_targets
+
+	def test_compiled_graph_edge_data(self, small_test_graph):
+		compiled = compiled_graph.compile_graph(small_test_graph)
+
+		for index, edges in enumerate(compiled.adjacency()):
+			node = compiled.node_id(index)
+			for next_index, length, elevation_gain in edges:
+				next_node = compiled.node_id(next_index)
+				assert length == small_test_graph[node][next_node][0]["length"]
+				assert elevation_gain == routing_helper.RoutingHelper().get_elevation_diff(small_test_graph, node, next_node)
+
+	def test_compiled_graph_is_cached(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+
+		assert compiled_graph.compile_graph(medium_test_graph) is compiled
+		assert compiled_graph.compile_graph(compiled) is compiled
+
+	def test_path_to_ids(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		path = [0, 3, 7]
+
+		indices = [compiled.index_of(node) for node in path]
+		assert compiled.path_to_ids(indices) == path
+
+	def test_save_and_load_compiled_graph(self, medium_test_graph, tmp_path):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		directory = str(tmp_path / "test-medium-graph.graph")
+		compiled.save(directory)
+
+		loaded = compiled_graph.CompiledGraph.load(directory)
+
+		assert isinstance(loaded.lengths, np.memmap)
+		for name in compiled_graph.GRAPH_ARRAYS:
+			assert np.array_equal(getattr(loaded, name), getattr(compiled, name), equal_nan=True)
+		assert loaded.adjacency() == compiled.adjacency()
+
+		#the test graph has no edge geometry, so edges are drawn as straight lines
+		next_node = compiled.adjacency()[0][0][0]
+		assert loaded.edge_geometry(0, next_node) == [(compiled.x[0], compiled.y[0]), (compiled.x[next_node], compiled.y[next_node])]
+
+	def test_load_compiled_map(self, medium_test_graph, tmp_path):
+		filename = str(tmp_path / "test-medium-graph.pkl")
+		with open("cached_maps/test-medium-graph.pkl", "rb") as source, open(filename, "wb") as copy:
+			copy.write(source.read())
+
+		map.build_compiled_map_file(filename)
+		compiled = map.load_compiled_map(filename)
+
+		x = 50
+		for start_node, end_node in [(0, 2), (3, 9), (14, 6)]:
+			for elevation_setting in ["minimize", "maximize", None]:
+				expected_path = routing_actions.RoutingDijkstra().routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+				path = routing_actions.RoutingDijkstra().routing_action(compiled, start_node, end_node, x, elevation_setting)
+				assert path == expected_path
+
+				assert routing_helper.RoutingHelper().get_total_path_length(path, compiled) == pytest.approx(routing_helper.RoutingHelper().get_total_path_length(path, medium_test_graph))
+				assert routing_helper.RoutingHelper().get_path_elevation(path, compiled) == pytest.approx(routing_helper.RoutingHelper().get_path_elevation(path, medium_test_graph))
+
+	def test_build_preprocessing_files(self, medium_test_graph, tmp_path, monkeypatch, capsys):
+		filename = str(tmp_path / "test-medium-graph.pkl")
+		with open("cached_maps/test-medium-graph.pkl", "rb") as source, open(filename, "wb") as copy:
+			copy.write(source.read())
+		map.build_preprocessing_files(filename)
+
+		#rebuilding the preprocessing of a changed map loads it once and ignores the stale preprocessing
+		graph = medium_test_graph.copy()
+		graph.remove_node(14)
+		with open(filename, "wb") as file:
+			pkl.dump(graph, file)
+
+		loads = []
+		load_map = map.load_map
+		monkeypatch.setattr(map, "load_map", lambda *args, **kwargs: loads.append(args) or load_map(*args, **kwargs))
+		map.build_preprocessing_files(filename)
+		assert len(loads) == 1
+		assert "Warning" not in capsys.readouterr().out
+
+		compiled = map.load_compiled_map(filename)
+		assert compiled.node_count == len(graph)
+		assert compiled.landmarks is not None and compiled.contraction_hierarchy is not None and compiled.spatial_index is not None
+
+	def test_get_nearest_node(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+
+		for node in [0, 7, 14]:
+			longitude = medium_test_graph.nodes[node]["x"]
+			latitude = medium_test_graph.nodes[node]["y"]
+			assert routing_helper.RoutingHelper().get_nearest_node(medium_test_graph, longitude, latitude) == node
+			assert routing_helper.RoutingHelper().get_nearest_node(compiled, longitude, latitude) == node
+
+class TestMapCache:
+	@pytest.fixture
+	def cache_directory(self, tmp_path):
+		#a converted copy of the medium test graph, registered as a drive map
+		with open("cached_maps/test-medium-graph.pkl", "rb") as source, open(str(tmp_path / "medium-drive.pkl"), "wb") as copy:
+			copy.write(source.read())
+		assert map.convert_cached_maps(str(tmp_path)) == ["medium-drive"]
+		return str(tmp_path)
+
+	def test_convert_cached_maps(self, medium_test_graph, cache_directory):
+		manifest = map.load_manifest(cache_directory)
+		entry = manifest["maps"]["medium-drive"]
+
+		assert manifest["schema_version"] == map.SCHEMA_VERSION
+		assert entry["city"] == "medium"
+		assert entry["network_type"] == "drive"
+		assert entry["node_count"] == medium_test_graph.number_of_nodes()
+		assert entry["edge_count"] == compiled_graph.compile_graph(medium_test_graph).edge_count
+		assert entry["checksum"] == map.get_checksum(os.path.join(cache_directory, entry["compiled"]))
+
+		west, south, east, north = entry["bbox"]
+		for _, data in medium_test_graph.nodes(data=True):
+			assert west <= data["x"] <= east and south <= data["y"] <= north
+
+	def test_load_cached_map(self, medium_test_graph, cache_directory):
+		compiled = map.load_cached_map("medium-drive", cache_directory)
+
+		path = routing_actions.RoutingDijkstra().routing_action(compiled, 3, 9, 50, "maximize")
+		assert path == routing_actions.RoutingDijkstra().routing_action(medium_test_graph, 3, 9, 50, "maximize")
+
+		with pytest.raises(ValueError):
+			map.load_cached_map("medium-walk", cache_directory)
+
+	def test_load_cached_map_validates_changed_map(self, cache_directory):
+		compiled_directory = os.path.join(cache_directory, "medium-drive.graph")
+		lengths_filename = os.path.join(compiled_directory, "lengths.npy")
+		lengths = np.load(lengths_filename)
+
+		#files touched without changing are accepted, and their new modification time recorded
+		os.utime(lengths_filename, ns=(0, 0))
+		map.load_cached_map("medium-drive", cache_directory)
+		assert map.load_manifest(cache_directory)["maps"]["medium-drive"]["file_stats"] == map.get_file_stats(compiled_directory)
+		map.load_cached_map("medium-drive", cache_directory, verify=True)
+
+		#a change that keeps the size and modification time is only found by verifying the checksum
+		np.save(lengths_filename, lengths * 3)
+		os.utime(lengths_filename, ns=(0, 0))
+		map.load_cached_map("medium-drive", cache_directory)
+		with pytest.raises(ValueError, match="convert it again"):
+			map.load_cached_map("medium-drive", cache_directory, verify=True)
+
+		#any other change is found when loading, and the map has to be converted again
+		np.save(lengths_filename, lengths * 2)
+		with pytest.raises(ValueError, match="convert it again"):
+			map.load_cached_map("medium-drive", cache_directory)
+
+	def test_find_map(self, medium_test_graph, cache_directory):
+		locations = [(medium_test_graph.nodes[node]["x"], medium_test_graph.nodes[node]["y"]) for node in [0, 9]]
+
+		assert map.find_map(locations, "drive", cache_directory) == "medium-drive"
+		assert map.find_map(locations, "walk", cache_directory) is None
+		assert map.find_map([(1000, 1000)], "drive", cache_directory) is None
+
+class ElevationRequestHandler(BaseHTTPRequestHandler):
+	#stand-in for the Open Elevation lookup API; the elevation of a location is latitude + longitude
+	def do_POST(self):
+		locations = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["locations"]
+		with self.server.lock:
+			self.server.batch_sizes.append(len(locations))
+			failing = len(self.server.batch_sizes) <= self.server.failures
+
+		if failing:
+			self.send_response(503)
+			self.end_headers()
+		elif len(locations) > self.server.max_locations:
+			self.send_response(413)
+			self.end_headers()
+		else:
+			body = json.dumps({"results": [{"latitude": location["latitude"], "longitude": location["longitude"], "elevation": location["latitude"] + location["longitude"]} for location in locations]}).encode()
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+@pytest.fixture
+def elevation_server():
+	server = ThreadingHTTPServer(("127.0.0.1", 0), ElevationRequestHandler)
+	server.lock = threading.Lock()
+	server.batch_sizes = []
+	server.failures = 0
+	server.max_locations = float("inf")
+	server.api = "http://127.0.0.1:{}/api/v1/lookup".format(server.server_address[1])
+
+	thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+
+class TestElevation:
+	def test_get_elevations(self, elevation_server):
+		latitudes = [40 + i / 1000 for i in range(250)]
+		longitudes = [-105 - i / 1000 for i in range(250)]
+
+		provider = elevation.OpenElevationProvider(elevation_server.api, workers=4, batch_size=100, backoff=0)
+		elevations = provider.get_elevations(latitudes, longitudes)
+
+		assert elevations == pytest.approx([latitude + longitude for latitude, longitude in zip(latitudes, longitudes)])
+		assert sum(elevation_server.batch_sizes) == 250
+
+	def test_get_elevations_retries_and_adapts_batch_size(self, elevation_server):
+		elevation_server.failures = 2
+		elevation_server.max_locations = 40
+		latitudes = [40 + i / 1000 for i in range(300)]
+		longitudes = [-105] * 300
+
+		provider = elevation.OpenElevationProvider(elevation_server.api, workers=2, batch_size=100, min_batch_size=10, backoff=0)
+		elevations = provider.get_elevations(latitudes, longitudes)
+
+		assert elevations == pytest.approx([latitude - 105 for latitude in latitudes])
+		assert min(elevation_server.batch_sizes) < 40
+
+	def test_get_elevations_gives_up(self, elevation_server):
+		elevation_server.failures = float("inf")
+
+		provider = elevation.OpenElevationProvider(elevation_server.api, workers=1, max_retries=2, backoff=0)
+		with pytest.raises(elevation.ElevationError):
+			provider.get_elevations([40], [-105])
+
+		assert len(elevation_server.batch_sizes) == 3
+
+	def test_get_elevations_resumes_from_checkpoint(self, elevation_server, tmp_path):
+		checkpoint_filename = str(tmp_path / "elevation-checkpoint")
+		latitudes = [40 + i / 1000 for i in range(100)]
+		longitudes = [-105] * 100
+
+		elevation.OpenElevationProvider(elevation_server.api, batch_size=10, checkpoint_filename=checkpoint_filename).get_elevations(latitudes[:60], longitudes[:60])
+		elevation_server.batch_sizes.clear()
+
+		#the previous lookup was interrupted while saving its last batch
+		with open(checkpoint_filename, "a") as file:
+			file.write("[[40.06")
+
+		provider = elevation.OpenElevationProvider(elevation_server.api, batch_size=10, checkpoint_filename=checkpoint_filename)
+		elevations = provider.get_elevations(latitudes, longitudes)
+
+		assert elevations == pytest.approx([latitude - 105 for latitude in latitudes])
+		assert sum(elevation_server.batch_sizes) == 40
+
+	def test_srtm_bilinear_sampling(self, tmp_path):
+		#elevation rises by 1m per row (southwards) and 2m per column (eastwards), which bilinear sampling reproduces exactly
+		rows, columns = np.mgrid[0:121, 0:121]
+		(1000 + rows + 2 * columns).astype(">i2").tofile(str(tmp_path / "N40W106.hgt"))
+		(np.ones((121, 121)) * 5).astype(">i2").tofile(str(tmp_path / "S01E000.hgt"))
+
+		latitudes = [40.999, 40, 40.5, 40.25, 40.001, -0.5]
+		longitudes = [-106, -105.0001, -105.5, -105.9, -105.3, 0.5]
+		elevations = elevation.SRTMElevationProvider(str(tmp_path)).get_elevations(latitudes, longitudes)
+
+		expected_elevations = [1000 + (41 - latitude) * 120 + 2 * (longitude + 106) * 120 for latitude, longitude in zip(latitudes[:5], longitudes[:5])] + [5]
+		assert elevations == pytest.approx(expected_elevations)
+
+		with pytest.raises(elevation.ElevationError):
+			elevation.SRTMElevationProvider(str(tmp_path)).get_elevations([42.5], [-105.5])
+
+	def test_srtm_voids(self, tmp_path):
+		tile = np.full((3, 3), 100, dtype=">i2")
+		tile[0, 0] = elevation.SRTM_VOID
+		tile[2, :] = elevation.SRTM_VOID
+		tile.tofile(str(tmp_path / "N40W106.hgt"))
+		provider = elevation.SRTMElevationProvider(str(tmp_path))
+
+		#void samples are left out of the interpolation
+		assert provider.get_elevations([40.9], [-105.9]) == pytest.approx([100])
+
+		with pytest.raises(elevation.ElevationError):
+			provider.get_elevations([40], [-105.75])
+
+	def test_elevation_cache(self, tmp_path):
+		cache = elevation.ElevationCache(str(tmp_path / "elevations.sqlite"))
+		cache.add_elevations("open-elevation", [40.01, 40.0099999], [-105.3, -105.3], [1600, 1601])
+
+		assert cache.get_elevations("open-elevation", [40.01, 40.0099999, 40.02], [-105.3, -105.3, -105.3]) == [1600, 1601, None]
+		assert cache.get_elevations("srtm", [40.01], [-105.3]) == [None]
+
+		#the cache is persistent
+		assert elevation.ElevationCache(str(tmp_path / "elevations.sqlite")).get_elevations("open-elevation", [40.01], [-105.3]) == [1600]
+
+	def test_add_elevation_data_with_cache(self, medium_test_graph, elevation_server, tmp_path):
+		cache = elevation.ElevationCache(str(tmp_path / "elevations.sqlite"))
+		provider = elevation.OpenElevationProvider(elevation_server.api, backoff=0)
+
+		map.add_elevation_data(nx.MultiDiGraph(medium_test_graph.subgraph(range(10))), provider, cache)
+		assert sum(elevation_server.batch_sizes) == 10
+
+		#only the nodes that were not looked up before are fetched
+		elevation_server.batch_sizes.clear()
+		graph = medium_test_graph.copy()
+		map.add_elevation_data(graph, provider, cache)
+		assert sum(elevation_server.batch_sizes) == medium_test_graph.number_of_nodes() - 10
+
+		elevation_server.batch_sizes.clear()
+		map.add_elevation_data(graph, provider, cache)
+		assert elevation_server.batch_sizes == []
+
+		for _, data in graph.nodes(data=True):
+			assert data["elevation"] == pytest.approx(data["x"] + data["y"])
+
+	def test_add_elevation_data(self, medium_test_graph, elevation_server):
+		graph = medium_test_graph.copy()
+		map.add_elevation_data(graph, elevation.OpenElevationProvider(elevation_server.api, backoff=0))
+
+		for _, data in graph.nodes(data=True):
+			assert data["elevation"] == pytest.approx(data["x"] + data["y"])
+
+class TestTransportNetworks:
+	def test_osm_filter(self):
+		#the filters come from a private osmnx function, so pin them to the osmnx version in requirements.txt
+		assert osmnx.__version__ == "1.1.2"
+		assert transport_networks.get_osm_filter("drive") == '["highway"]["area"!~"yes"]["access"!~"private"]["highway"!~"abandoned|bridleway|bus_guideway|construction|corridor|cycleway|elevator|escalator|footway|path|pedestrian|planned|platform|proposed|raceway|service|steps|track"]["motor_vehicle"!~"no"]["motorcar"!~"no"]["service"!~"alley|driveway|emergency_access|parking|parking_aisle|private"]'
+		assert transport_networks.get_osm_filter("all") == '["highway"]["area"!~"yes"]["access"!~"private"]["highway"!~"abandoned|construction|planned|platform|proposed|raceway"]["service"!~"private"]'
+		assert transport_networks.get_filter_keys() == ["highway", "area", "access", "motor_vehicle", "motorcar", "service", "bicycle", "foot"]
+
+	def test_tag_filter(self):
+		drive_filter = transport_networks.get_tag_filter("drive")
+
+		assert transport_networks.matches_tag_filter({"highway": "residential"}, drive_filter)
+		assert not transport_networks.matches_tag_filter({"highway": "footway"}, drive_filter)
+		assert not transport_networks.matches_tag_filter({"highway": "residential", "access": "private"}, drive_filter)
+		assert not transport_networks.matches_tag_filter({"building": "yes"}, drive_filter)
+
+	def test_derive_networks(self):
+		superset_graph = transport_networks.load_superset_network("cached_maps/test-town.osm")
+		networks = transport_networks.derive_networks(superset_graph)
+
+		def highways(graph):
+			values = set()
+			for _, _, data in graph.edges(data=True):
+				values.update(data["highway"] if isinstance(data["highway"], list) else [data["highway"]])
+			return values
+
+		#the town has a one way street, a footway, a cycleway, a street with foot=no and a private road
+		assert highways(networks["drive"]) == {"residential"}
+		assert highways(networks["bike"]) == {"residential", "cycleway"}
+		assert highways(networks["walk"]) == {"residential", "footway"}
+
+		assert not networks["drive"].has_edge(103, 102)
+		assert all(networks["walk"].has_edge(node2, node1) for node1, node2 in networks["walk"].edges())
+
+	def test_download_map_from_osm_file(self, tmp_path):
+		rows, columns = np.mgrid[0:121, 0:121]
+		(1600 + rows + 2 * columns).astype(">i2").tofile(str(tmp_path / "N40W106.hgt"))
+
+		map.download_map({"city": "Town", "state": "Colorado", "country": "USA"}, str(tmp_path), "cached_maps/test-town.osm", str(tmp_path))
+
+		manifest = map.load_manifest(str(tmp_path))
+		assert sorted(manifest["maps"]) == ["town-bike", "town-drive", "town-walk"]
+
+		for name, entry in manifest["maps"].items():
+			assert entry["elevation_source"] == "srtm"
+
+			graph = map.load_map(str(tmp_path / entry["filename"]))
+			assert all(data["elevation"] > 1600 for _, data in graph.nodes(data=True))
+
+			compiled = map.load_cached_map(name, str(tmp_path))
+			assert compiled.landmarks is not None and compiled.contraction_hierarchy is not None
+
+		#the SRTM elevations are cached like the ones looked up online
+		cache = elevation.ElevationCache(str(tmp_path / map.ELEVATION_CACHE_FILENAME))
+		assert cache.get_elevations("srtm", [graph.nodes[node]["y"] for node in graph], [graph.nodes[node]["x"] for node in graph]) == pytest.approx([graph.nodes[node]["elevation"] for node in graph])
+
+		#maps built from an extract never look up elevations online
+		with pytest.raises(ValueError, match="SRTM"):
+			map.download_map({"city": "Town", "state": "Colorado", "country": "USA"}, None, "cached_maps/test-town.osm", str(tmp_path))
+
+		#the addresses of the extract are geocoded offline
+		offline_geocoder = geocoder.Geocoder(str(tmp_path / map.GEOCODER_FILENAME), geocode=None)
+		assert offline_geocoder.geocode("Town Library, Town") == pytest.approx((40.0105, -105.2785))
+
+class TestOSMExtract:
+	def test_read_extract(self):
+		extract = osm_extract.read_extract("cached_maps/test-town.osm")
+
+		#the building way and its nodes are not part of any street network
+		assert extract.way_count == 7
+		assert 900 not in extract.node_ids and len(extract.node_ids) == 16
+		assert list(extract.refs[extract.way_offsets[0]:extract.way_offsets[1]]) == [100, 101, 102, 103]
+
+	def test_build_network_matches_osmnx(self):
+		extract = osm_extract.read_extract("cached_maps/test-town.osm")
+		superset_graph = transport_networks.load_superset_network("cached_maps/test-town.osm")
+
+		for network_type in transport_networks.TRANSPORT_METHODS:
+			network = osm_extract.build_network(extract, network_type)
+			expected_network = transport_networks.derive_network(superset_graph, network_type)
+
+			#ways that continue each other are not merged, so only the intersections are compared
+			distances = dict(nx.all_pairs_dijkstra_path_length(network, weight="length"))
+			expected_distances = dict(nx.all_pairs_dijkstra_path_length(expected_network, weight="length"))
+			for node1, lengths in expected_distances.items():
+				for node2, length in lengths.items():
+					assert distances[node1][node2] == pytest.approx(length)
+
+	def test_build_network_edges(self):
+		extract = osm_extract.read_extract("cached_maps/test-town.osm")
+		drive_network = osm_extract.build_network(extract, "drive")
+		walk_network = osm_extract.build_network(extract, "walk")
+
+		assert drive_network.has_edge(102, 103) and not drive_network.has_edge(103, 102)
+		assert all(walk_network.has_edge(node2, node1) for node1, node2 in walk_network.edges())
+
+		#edges through nodes that are not intersections keep their shape
+		geometries = [(node1, node2, data["geometry"]) for node1, node2, data in drive_network.edges(data=True) if "geometry" in data]
+		assert geometries
+		for node1, node2, geometry in geometries:
+			assert len(geometry.coords) > 2
+			assert geometry.coords[0] == (drive_network.nodes[node1]["x"], drive_network.nodes[node1]["y"])
+			assert geometry.coords[-1] == (drive_network.nodes[node2]["x"], drive_network.nodes[node2]["y"])
+
+	def test_missing_nodes(self, tmp_path):
+		osm_filename = str(tmp_path / "cut.osm")
+		with open(osm_filename, "w") as file:
+			file.write('''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+	<node id="1" lat="40.0" lon="-105.0"/>
+	<node id="2" lat="40.0" lon="-105.001"/>
+	<node id="4" lat="40.0" lon="-105.003"/>
+	<node id="5" lat="40.0" lon="-105.004"/>
+	<way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="5"/><tag k="highway" v="residential"/></way>
+</osm>''')
+
+		#the way is cut where it leaves the extract
+		extract = osm_extract.read_extract(osm_filename)
+		assert extract.way_count == 2
+		assert list(extract.refs) == [1, 2, 4, 5]
+
+		with pytest.raises(ValueError):
+			osm_extract.read_extract(str(tmp_path / "town.osm.pbf"))
+
+class TestSpatialIndex:
+	def brute_force_edge_distances(self, index, x, y):
+		x1, x2 = index.segment_x[:, 0], index.segment_x[:, 1]
+		y1, y2 = index.segment_y[:, 0], index.segment_y[:, 1]
+		t = np.clip(((x - x1) * (x2 - x1) + (y - y1) * (y2 - y1)) / ((x2 - x1) ** 2 + (y2 - y1) ** 2), 0, 1)
+		return np.hypot(x1 + t * (x2 - x1) - x, y1 + t * (y2 - y1) - y)
+
+	def test_nearest_nodes(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		index = spatial_index.build_spatial_index(compiled, cell_size=50000)
+
+		#locations all over the map and outside of it
+		generator = np.random.default_rng(0)
+		longitudes = generator.uniform(compiled.x.min() - 2, compiled.x.max() + 2, 200)
+		latitudes = generator.uniform(compiled.y.min() - 2, compiled.y.max() + 2, 200)
+		nodes, distances = index.nearest_nodes(longitudes, latitudes)
+
+		for i in range(len(longitudes)):
+			x, y = longitudes[i] * index.grid[3], latitudes[i] * index.grid[4]
+			expected_distances = np.hypot(index.node_x - x, index.node_y - y)
+			assert distances[i] == pytest.approx(expected_distances.min())
+			assert expected_distances[nodes[i]] == pytest.approx(expected_distances.min())
+			assert index.nearest_node(longitudes[i], latitudes[i])[1] == pytest.approx(distances[i])
+
+	def test_nearest_edges(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		index = spatial_index.build_spatial_index(compiled, cell_size=50000)
+
+		generator = np.random.default_rng(1)
+		longitudes = generator.uniform(compiled.x.min() - 2, compiled.x.max() + 2, 200)
+		latitudes = generator.uniform(compiled.y.min() - 2, compiled.y.max() + 2, 200)
+		sources, targets, positions, distances = index.nearest_edges(longitudes, latitudes)
+
+		for i in range(len(longitudes)):
+			x, y = longitudes[i] * index.grid[3], latitudes[i] * index.grid[4]
+			assert distances[i] == pytest.approx(self.brute_force_edge_distances(index, x, y).min())
+			assert compiled.edge_length(sources[i], targets[i]) is not None
+
+			#the closest point is at `position` along the edge
+			closest_x = index.node_x[sources[i]] + positions[i] * (index.node_x[targets[i]] - index.node_x[sources[i]])
+			closest_y = index.node_y[sources[i]] + positions[i] * (index.node_y[targets[i]] - index.node_y[sources[i]])
+			assert np.hypot(closest_x - x, closest_y - y) == pytest.approx(distances[i])
+
+			#several edges can be the closest (at a shared node, or both directions of a street)
+			_, _, _, distance = index.nearest_edge(longitudes[i], latitudes[i])
+			assert distance == pytest.approx(distances[i])
+
+	def test_nearest_edge_follows_geometry(self, tmp_path):
+		extract = osm_extract.read_extract("cached_maps/test-town.osm")
+		graph = osm_extract.build_network(extract, "drive")
+		compiled = compiled_graph.compile_graph(graph)
+		compiled.save(str(tmp_path / "town.graph"))
+		compiled_graph.save_edge_geometry(compiled, graph, str(tmp_path / "town.graph"))
+		compiled = compiled_graph.CompiledGraph.load(str(tmp_path / "town.graph"))
+		index = spatial_index.build_spatial_index(compiled)
+
+		#a location on a shape point in the middle of an edge
+		node1, node2, data = next((node1, node2, data) for node1, node2, data in graph.edges(data=True) if "geometry" in data)
+		coordinates = list(data["geometry"].coords)
+		longitude, latitude = coordinates[1]
+		source, target, position, distance = index.nearest_edge(longitude, latitude)
+
+		assert distance == pytest.approx(0, abs=1e-6)
+		assert {compiled.node_id(source), compiled.node_id(target)} == {node1, node2}
+		assert 0 < position < 1
+
+		nodes = routing_helper.RoutingHelper().get_nearest_nodes(compiled, [coordinates[0][0], coordinates[-1][0]], [coordinates[0][1], coordinates[-1][1]])
+		assert nodes == [node1, node2]
+
+	def test_stored_with_map(self, tmp_path):
+		filename = str(tmp_path / "medium-drive.pkl")
+		with open("cached_maps/test-medium-graph.pkl", "rb") as source, open(filename, "wb") as copy:
+			copy.write(source.read())
+		map.build_compiled_map_file(filename)
+		map.build_spatial_index_file(filename)
+
+		compiled = map.load_compiled_map(filename)
+		assert compiled.spatial_index is not None and compiled.spatial_index.matches(compiled)
+		assert spatial_index.get_spatial_index(compiled) is compiled.spatial_index
+
+class TestSnapping:
+	def split_graph(self, graph, snapped):
+		#a copy of `graph` with the streets split at the virtual nodes, to compare the view against
+		split_graph = graph.copy()
+		for node in range(snapped.base.node_count, snapped.node_count):
+			split_graph.add_node(snapped.node_id(node), x=snapped.x[node], y=snapped.y[node], elevation=snapped.elevations[node])
+		for node1, edges in snapped._added_edges.items():
+			for node2, length, elevation_gain in edges:
+				split_graph.add_edge(snapped.node_id(node1), snapped.node_id(node2), length=length, elevation_gain=elevation_gain)
+		return split_graph
+
+	def test_snapped_graph_splits_edges(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		node1, node2, _ = next(edge for edge in medium_test_graph.edges if medium_test_graph.has_edge(edge[1], edge[0]))
+		index1, index2 = compiled.index_of(node1), compiled.index_of(node2)
+		base_edges = list(compiled.adjacency()[index1])
+
+		snapped = compiled_graph.SnappedGraph(compiled, [(index1, index2, 0.25)])
+		virtual = snapped.index_of(-1)
+
+		assert virtual == compiled.node_count and snapped.node_id(virtual) == -1
+		assert snapped.edge_length(index1, virtual) == pytest.approx(0.25 * compiled.edge_length(index1, index2))
+		assert snapped.edge_length(virtual, index2) == pytest.approx(0.75 * compiled.edge_length(index1, index2))
+		assert snapped.edge_length(index2, virtual) == pytest.approx(0.75 * compiled.edge_length(index2, index1))
+		assert snapped.elevations[virtual] == pytest.approx(0.75 * compiled.elevations[index1] + 0.25 * compiled.elevations[index2])
+
+		#the base graph is shared, not modified
+		assert compiled.adjacency()[index1] == base_edges
+		assert snapped.adjacency()[index1][:len(base_edges)] == base_edges
+		assert snapped.adjacency()[0] is compiled.adjacency()[0]
+
+		#the per-node arrays read the base arrays instead of copying them
+		assert snapped.elevations.base is compiled.elevations and snapped.x.base is compiled.x
+		assert len(snapped.x) == snapped.node_count and snapped.elevations.tolist() == np.asarray(snapped.elevations).tolist()
+		assert snapped.x[[0, virtual]] == pytest.approx([compiled.x[0], snapped.x[virtual]])
+		assert snapped.y[-1] == snapped.y[virtual]
+
+	def test_routing_on_snapped_graph(self, medium_test_graph, dijkstra, astar, label_setting):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		edges = [(compiled.index_of(node1), compiled.index_of(node2)) for node1, node2, _ in medium_test_graph.edges]
+		snapped = compiled_graph.SnappedGraph(compiled, [edges[3] + (0.4,), edges[20] + (0.7,)])
+		split_graph = self.split_graph(medium_test_graph, snapped)
+
+		helper = routing_helper.RoutingHelper()
+		for start, end in [(-1, -2), (-2, -1), (-1, 5), (9, -2)]:
+			expected_length = nx.shortest_path_length(split_graph, start, end, weight="length")
+			assert helper.get_shortest_length(snapped, start, end) == pytest.approx(expected_length)
+			assert helper.get_shortest_length(snapped, start, end, point_to_point=True) == pytest.approx(expected_length)
+
+			for strategy in [dijkstra, astar, label_setting]:
+				for elevation_setting in ["minimize", "maximize", None]:
+					path = strategy.execute_routing_mode(snapped, start, end, 50, elevation_setting)
+					expected_path = strategy.execute_routing_mode(split_graph, start, end, 50, elevation_setting)
+					assert path[0] == start and path[-1] == end
+					assert helper.get_total_path_length(path, snapped) <= 1.5 * expected_length + 1e-9
+					assert helper.get_path_elevation(path, snapped) == pytest.approx(helper.get_path_elevation(expected_path, split_graph))
+
+	def test_lower_bounds(self, medium_test_graph):
+		compiled = compiled_graph.CompiledGraph.from_graph(medium_test_graph)
+		compiled.landmarks = landmarks.build_landmarks(compiled, 4)
+		edges = [(compiled.index_of(node1), compiled.index_of(node2)) for node1, node2, _ in medium_test_graph.edges]
+		snapped = compiled_graph.SnappedGraph(compiled, [edges[3] + (0.4,), edges[20] + (0.7,)])
+
+		for target in [snapped.index_of(-2), snapped.index_of(5)]:
+			exact_bounds = heuristics.get_lower_bounds(snapped, target, "exact")
+			for method in ["haversine", "landmarks"]:
+				bounds = heuristics.get_lower_bounds(snapped, target, method)
+				assert len(bounds) == snapped.node_count
+				assert all(bound <= exact_bound + 1e-9 for bound, exact_bound in zip(bounds, exact_bounds))
+
+	def test_same_edge(self, medium_test_graph):
+		compiled = compiled_graph.CompiledGraph.from_graph(medium_test_graph)
+		compiled.contraction_hierarchy = contraction_hierarchy.build_contraction_hierarchy(compiled)
+		node1, node2, _ = next(iter(medium_test_graph.edges))
+		index1, index2 = compiled.index_of(node1), compiled.index_of(node2)
+		snapped = compiled_graph.SnappedGraph(compiled, [(index1, index2, 0.6), (index1, index2, 0.2)])
+
+		#both virtual nodes are on the same street, so the route goes straight along it
+		path = routing_helper.RoutingHelper().get_shortest_path(snapped, -2, -1, point_to_point=True)
+		assert path == [-2, -1]
+		assert routing_helper.RoutingHelper().get_total_path_length(path, snapped) == pytest.approx(0.4 * compiled.edge_length(index1, index2))
+
+		#the route drawn on the base map keeps the street, in the direction of travel
+		assert snapped.base_path(path) == [node1, node2]
+		assert snapped.base_path([-1, -2]) == [node2, node1]
+		assert snapped.base_path([-2]) == [node1, node2]
+		assert snapped.base_path([-2, node2, node1, -1]) == [node1, node2, node1, node2]
+
+	def test_snap_locations(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		node1, node2, _ = next(iter(medium_test_graph.edges))
+		x1, y1 = medium_test_graph.nodes[node1]["x"], medium_test_graph.nodes[node1]["y"]
+		x2, y2 = medium_test_graph.nodes[node2]["x"], medium_test_graph.nodes[node2]["y"]
+
+		#a location on a node snaps to it, one in the middle of a street gets a virtual node
+		snapped, nodes = routing_helper.RoutingHelper().snap_locations(medium_test_graph, [x1, (x1 + x2) / 2], [y1, (y1 + y2) / 2])
+		assert nodes[0] == node1 and nodes[1] == -1
+		assert snapped.base is compiled and len(snapped.virtual_nodes) == 1
+		assert snapped.x[snapped.index_of(-1)] == pytest.approx((x1 + x2) / 2)
+		assert snapped.base_path([node1, -1]) == [node1, node2]
+
+class TestGeocoder:
+	class FakeNominatim:
+		def __init__(self, locations):
+			self.locations = locations
+			self.queries = []
+
+		def __call__(self, address):
+			self.queries.append(address)
+			if address not in self.locations:
+				raise ValueError("Nominatim could not geocode query")
+			return self.locations[address]
+
+	def test_normalize_address(self):
+		assert geocoder.normalize_address("  12 First Street, Town ") == "12 first st, town"
+		assert geocoder.normalize_address("12 first st., TOWN,") == "12 first st, town"
+		assert geocoder.normalize_address("100 North Main Avenue") == "100 n main ave"
+
+	def test_read_gazetteer(self):
+		gazetteer = geocoder.read_gazetteer("cached_maps/test-town.osm")
+
+		#buildings are located at the mean of their nodes, named streets are left out, and places with a city are only stored with it
+		assert "12 first st" not in gazetteer
+		assert gazetteer["12 first st, town"] == pytest.approx((40.0205, -105.27))
+		assert gazetteer["town library, town"] == pytest.approx((40.0105, -105.2785))
+		assert "first" not in gazetteer
+
+	def test_geocode_offline(self, tmp_path):
+		nominatim = self.FakeNominatim({})
+		cache = geocoder.Geocoder(str(tmp_path / "geocodes.sqlite"), geocode=nominatim, min_interval=0)
+		cache.add_gazetteer(geocoder.read_gazetteer("cached_maps/test-town.osm"))
+
+		#trailing parts of the address that are not in the gazetteer are ignored
+		locations = cache.geocode_many(["12 First Street, Town, Colorado, USA", "Town Library, Town", "Somewhere Else"])
+		assert locations[0] == pytest.approx((40.0205, -105.27))
+		assert locations[1] == pytest.approx((40.0105, -105.2785))
+		assert locations[2] is None
+		assert nominatim.queries == ["Somewhere Else"]
+
+	def test_geocode_other_city(self, tmp_path):
+		nominatim = self.FakeNominatim({"12 First Street, Other Town, CO": (39.0, -104.0)})
+		cache = geocoder.Geocoder(str(tmp_path / "geocodes.sqlite"), geocode=nominatim, min_interval=0)
+		cache.add_gazetteer(geocoder.read_gazetteer("cached_maps/test-town.osm"))
+
+		#the same address in a city the extract does not cover, or without its city, is not resolved from the extract
+		assert cache.geocode("12 First Street, Other Town, CO") == (39.0, -104.0)
+		assert cache.geocode_many(["12 First Street"]) == [None]
+		assert nominatim.queries == ["12 First Street, Other Town, CO", "12 First Street"]
+
+		#addresses looked up online before take precedence over the gazetteer
+		cache.add_gazetteer({"12 first st, other town": (40.0, -105.0)})
+		stored = geocoder.Geocoder(str(tmp_path / "geocodes.sqlite"), geocode=None)
+		assert stored.geocode("12 First Street, Other Town, CO") == (39.0, -104.0)
+
+	def test_geocode_cache(self, tmp_path):
+		filename = str(tmp_path / "geocodes.sqlite")
+		nominatim = self.FakeNominatim({"1 Main St, Boulder": (40.0, -105.2)})
+		cache = geocoder.Geocoder(filename, geocode=nominatim, min_interval=0)
+
+		#each distinct address is looked up once, whatever its spelling
+		locations = cache.geocode_many(["1 Main St, Boulder", "1 main street, boulder", "2 Main St, Boulder"])
+		assert locations == [(40.0, -105.2), (40.0, -105.2), None]
+		assert cache.geocode("1 MAIN ST., BOULDER") == (40.0, -105.2)
+		with pytest.raises(ValueError):
+			cache.geocode("2 Main St, Boulder")
+		assert nominatim.queries == ["1 Main St, Boulder", "2 Main St, Boulder"]
+
+		#both the locations and the addresses that were not found are stored
+		stored = geocoder.Geocoder(filename, geocode=self.FakeNominatim({}), cache_size=1)
+		assert stored.geocode_many(["1 Main St, Boulder", "2 Main St, Boulder"]) == [(40.0, -105.2), None]
+		assert stored.geocode_online.queries == [] and len(stored._cache) == 1
+
+class TestService:
+	async def request(self, port, method, path, query=None):
+		reader, writer = await asyncio.open_connection("127.0.0.1", port)
+		body = json.dumps(query).encode() if query is not None else b""
+		writer.write("{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(method, path, len(body)).encode() + body)
+		response = await reader.read()
+		writer.close()
+
+		head, _, body = response.partition(b"\r\n\r\n")
+		return int(head.split()[1]), json.loads(body)
+
+	def test_route(self, medium_test_graph, dijkstra):
+		routing_service = service.RoutingService()
+		nodes = list(medium_test_graph.nodes)
+		start, end = nodes[0], nodes[-1]
+
+		for method, elevation_setting in (("dijkstra", "maximize"), ("a*", "minimize"), ("bidirectional", None)):
+			query = {"map": "test-medium-graph", "start": start, "end": end, "x": 20, "elevation_setting": elevation_setting, "method": method}
+			result = asyncio.run(routing_service.route(query))
+
+			#the service finds the same routes as the strategies on the networkx graph
+			expected = context.Context(routing_actions.ROUTING_MODES[method]()).execute_routing_mode(medium_test_graph, start, end, 20, elevation_setting)
+			assert result["path"] == expected
+			assert result["length"] == pytest.approx(routing_helper.RoutingHelper().get_total_path_length(expected, medium_test_graph))
+			assert result["elevation_gain"] == pytest.approx(routing_helper.RoutingHelper().get_path_elevation(expected, medium_test_graph))
+			assert result["coordinates"][0] == pytest.approx([medium_test_graph.nodes[start]["x"], medium_test_graph.nodes[start]["y"]])
+
+		#the map was only loaded once
+		assert list(routing_service.maps) == ["test-medium-graph"]
+
+	def test_route_processes(self, medium_test_graph, compiled_map):
+		nodes = list(medium_test_graph.nodes)
+		routing_service = service.RoutingService(os.path.dirname(compiled_map), processes=1, timeout=60)
+		query = {"map": "test-medium-graph", "start": nodes[0], "end": nodes[-1], "x": 20, "elevation_setting": "maximize"}
+
+		async def run():
+			try:
+				return await routing_service.route(query)
+			finally:
+				routing_service.query_executors["test-medium-graph"].shutdown()
+
+		#routed in a worker process attached to the compiled map
+		result = asyncio.run(run())
+		assert result["path"] == asyncio.run(service.RoutingService().route(query))["path"]
+		assert not routing_service.maps
+
+	def test_route_timeout(self, medium_test_graph, monkeypatch):
+		time_limits = []
+		def slow_route(compiled, start, end, x, elevation_setting, method, time_limit):
+			time_limits.append(time_limit)
+			time.sleep(1)
+
+		monkeypatch.setattr(service, "_route", slow_route)
+		routing_service = service.RoutingService(timeout=0.2)
+		nodes = list(medium_test_graph.nodes)
+
+		async def run():
+			await routing_service.get_map("test-medium-graph")
+			routing = asyncio.ensure_future(routing_service.handle_request("POST", "/route", json.dumps({"map": "test-medium-graph", "start": nodes[0], "end": nodes[-1]}).encode()))
+			await asyncio.sleep(0.05)
+
+			#maps are loaded while the routing thread is busy
+			await routing_service.get_map("test-small-uniform-graph")
+			assert not routing.done()
+			return await routing
+
+		status, response = asyncio.run(run())
+		assert status == 504 and "0.2 seconds" in response["error"]
+		assert time_limits == [pytest.approx(service.SEARCH_TIME_FRACTION * 0.2)]
+
+	def test_route_locations(self, medium_test_graph):
+		node1, node2, _ = next(iter(medium_test_graph.edges))
+		x1, y1 = medium_test_graph.nodes[node1]["x"], medium_test_graph.nodes[node1]["y"]
+		x2, y2 = medium_test_graph.nodes[node2]["x"], medium_test_graph.nodes[node2]["y"]
+
+		query = {"map": "test-medium-graph", "start": [(x1 + x2) / 2, (y1 + y2) / 2], "end": node2, "method": "dijkstra"}
+		result = asyncio.run(service.RoutingService().route(query))
+		assert result["start"] == -1 and result["path"] == [-1, node2]
+		assert result["coordinates"][0] == pytest.approx([(x1 + x2) / 2, (y1 + y2) / 2])
+
+	def test_http(self, medium_test_graph):
+		node1, node2, _ = next(iter(medium_test_graph.edges))
+
+		async def run():
+			routing_service = service.RoutingService()
+			server = await asyncio.start_server(routing_service.handle_connection, "127.0.0.1", 0)
+			port = server.sockets[0].getsockname()[1]
+			async with server:
+				responses = [
+					await self.request(port, "POST", "/route", {"map": "test-medium-graph", "start": node1, "end": node2}),
+					await self.request(port, "GET", "/health"),
+					await self.request(port, "POST", "/route", {"map": "test-medium-graph", "start": node1, "end": node2, "method": "teleport"}),
+					await self.request(port, "POST", "/route", {"map": "test-medium-graph", "start": node1, "end": -1}),
+					await self.request(port, "POST", "/route", {"map": "nowhere-drive", "start": node1, "end": node2}),
+					await self.request(port, "GET", "/route"),
+				]
+			return responses
+
+		responses = asyncio.run(run())
+		assert responses[0][0] == 200 and responses[0][1]["path"] == [node1, node2]
+		assert responses[1] == (200, {"status": "ok", "maps": ["test-medium-graph"]})
+		assert [status for status, _ in responses[2:]] == [400, 404, 404, 405]
+
+	def test_no_gui_imports(self):
+		#the service and the routing core run without the GUI and plotting libraries
+		code = "import sys; from src import service; print(sorted({name.split('.')[0] for name in sys.modules} & {'osmnx', 'matplotlib', 'tkinter'}))"
+		assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip() == "[]"
+
+class TestQueryExecutor:
+	def test_routes(self, medium_test_graph, compiled_map):
+		nodes = list(medium_test_graph.nodes)
+		queries = [(nodes[i], nodes[-1 - i], 20, elevation_setting, method) for i in range(4) for elevation_setting, method in (("maximize", "dijkstra"), ("minimize", "a*"), (None, "bidirectional"))]
+
+		with query_executor.QueryExecutor(compiled_map, workers=2) as executor:
+			futures = [executor.submit(start, end, x, elevation_setting, method) for start, end, x, elevation_setting, method in queries]
+
+			#the workers find the same routes as the strategies on the networkx graph
+			for future, (start, end, x, elevation_setting, method) in zip(futures, queries):
+				expected = context.Context(routing_actions.ROUTING_MODES[method]()).execute_routing_mode(medium_test_graph, start, end, x, elevation_setting)
+				assert future.result() == expected
+
+	def test_timeout_and_cancel(self, medium_test_graph, compiled_map):
+		with query_executor.QueryExecutor(compiled_map, workers=1, timeout=0.5) as executor:
+			with pytest.raises(query_executor.QueryTimeoutError):
+				executor.submit_function(sleep_on_graph, 30).result()
+
+			#a running query is stopped, a queued one is never run
+			running = executor.submit_function(sleep_on_graph, 30, timeout=60)
+			queued = executor.submit_function(sleep_on_graph, 0)
+			while not running.running():
+				time.sleep(0.01)
+			assert executor.cancel(queued) and executor.cancel(running)
+			with pytest.raises(query_executor.CancelledError):
+				running.result()
+			assert queued.cancelled()
+
+			#the stopped workers were replaced (this module is imported again in the new worker, which takes a while)
+			finished = executor.submit_function(sleep_on_graph, 0, timeout=60)
+			assert finished.result() == len(medium_test_graph)
+
+			#a finished query cannot be cancelled, and no query is left tracked
+			assert not executor.cancel(finished) and not finished.cancelled()
+			assert not executor._running and not executor._cancelled
+
+	def test_shutdown_with_full_queue(self, compiled_map):
+		executor = query_executor.QueryExecutor(compiled_map, workers=1, max_pending=1)
+		running = executor.submit_function(sleep_on_graph, 30)
+		while not running.running():
+			time.sleep(0.01)
+		queued = executor.submit_function(sleep_on_graph, 0)
+
+		#shutting down does not wait for room in the full queue
+		start_time = time.monotonic()
+		executor.shutdown(wait=False)
+		assert time.monotonic() - start_time < 1
+		with pytest.raises(RuntimeError):
+			executor.submit_function(sleep_on_graph, 0)
+
+		assert executor.cancel(queued) and executor.cancel(running)
+		executor.shutdown()
+		assert not any(thread.is_alive() for thread in executor._threads)
+
+	def test_errors(self, compiled_map, tmp_path):
+		with query_executor.QueryExecutor(compiled_map, workers=1) as executor:
+			with pytest.raises(KeyError):
+				executor.submit(-1, -2).result()
+			assert executor.submit_function(sleep_on_graph, 0).result() > 0
+
+		with pytest.raises(ValueError):
+			query_executor.QueryExecutor(str(tmp_path / "missing.pkl"))
+
+class TestBatchRouting:
+	def get_queries(self, medium_test_graph):
+		nodes = list(medium_test_graph.nodes)
+		settings = [(20, "maximize"), (10, "minimize"), (0, None)]
+		return [(nodes[i], nodes[-1 - i % 3], *settings[i % 3]) for i in range(12)]
+
+	def test_route_batch(self, medium_test_graph, compiled_map, dijkstra):
+		queries = self.get_queries(medium_test_graph)
+
+		for workers in (0, 2):
+			results = list(batch_routing.route_batch(compiled_map, queries, "dijkstra", workers=workers))
+			assert sorted(result["index"] for result in results) == list(range(len(queries)))
+
+			for result in results:
+				start, end, x, elevation_setting = queries[result["index"]]
+				expected = dijkstra.execute_routing_mode(medium_test_graph, start, end, x, elevation_setting)
+				assert result["path"] == expected and result["error"] is None
+				assert result["length"] == pytest.approx(routing_helper.RoutingHelper().get_total_path_length(expected, medium_test_graph))
+				assert result["elevation_gain"] == pytest.approx(routing_helper.RoutingHelper().get_path_elevation(expected, medium_test_graph))
+
+	def test_streaming(self, medium_test_graph, compiled_map):
+		queries = self.get_queries(medium_test_graph)
+		read = []
+
+		def stream():
+			for query in queries:
+				read.append(query)
+				yield query
+
+		#the first results are ready before the whole input was read
+		results = batch_routing.route_batch(compiled_map, stream(), workers=0, window=4)
+		next(results)
+		assert len(read) == 4
+		assert len(list(results)) == len(queries) - 1
+
+	def test_files(self, medium_test_graph, compiled_map, tmp_path):
+		node = next(iter(medium_test_graph.nodes))
+		queries = [{"start": start, "end": end, "x": x, "elevation_setting": elevation_setting} for start, end, x, elevation_setting in self.get_queries(medium_test_graph)]
+		queries.append({"start": -1, "end": node, "x": 0, "elevation_setting": None})
+
+		with open(tmp_path / "queries.jsonl", "w") as file:
+			file.writelines(json.dumps(query) + "\n" for query in queries)
+		with open(tmp_path / "queries.csv", "w") as file:
+			file.write("start,end,x,elevation_setting\n")
+			file.writelines("{},{},{},{}\n".format(query["start"], query["end"], query["x"], query["elevation_setting"] or "") for query in queries)
+		assert list(batch_routing.read_queries(str(tmp_path / "queries.jsonl"))) == queries
+		assert list(batch_routing.read_queries(str(tmp_path / "queries.csv"))) == queries
+
+		results = sorted(batch_routing.route_batch(compiled_map, queries, workers=0), key=lambda result: result["index"])
+		assert results[-1]["path"] is None and results[-1]["error"].startswith("KeyError")
+
+		for format in ("jsonl", "csv"):
+			with open(tmp_path / ("results." + format), "w", newline="") as file:
+				assert batch_routing.write_results(results, file, format) == len(queries)
+
+		with open(tmp_path / "results.jsonl") as file:
+			assert [json.loads(line) for line in file] == results
+		with open(tmp_path / "results.csv") as file:
+			rows = list(csv.DictReader(file))
+		assert [int(node) for node in rows[0]["path"].split()] == results[0]["path"]
+
+class TestDistanceMatrix:
+	def get_shortest_path_gains(self, graph, source, target):
+		#the elevation gain of every shortest path, since paths of the same length can have different gains
+		simple_graph = nx.DiGraph()
+		for node1, node2, data in graph.edges(data=True):
+			if not simple_graph.has_edge(node1, node2) or simple_graph[node1][node2]["length"] > data["length"]:
+				simple_graph.add_edge(node1, node2, length=data["length"])
+		return [routing_helper.RoutingHelper().get_path_elevation(path, graph) for path in nx.all_shortest_paths(simple_graph, source, target, weight="length")]
+
+	def test_distance_matrix(self, medium_test_graph):
+		compiled = compiled_graph.CompiledGraph.from_graph(medium_test_graph)
+		compiled.contraction_hierarchy = contraction_hierarchy.build_contraction_hierarchy(compiled)
+		nodes = list(medium_test_graph.nodes)
+		sources, targets = nodes[:8], nodes[::3]
+		expected_lengths = dict(nx.all_pairs_dijkstra_path_length(medium_test_graph, weight="length"))
+
+		#one-to-many trees and hierarchy buckets find the same lengths, and gains along one of the shortest paths
+		for use_hierarchy in (False, True):
+			lengths, elevation_gains = distance_matrix.get_distance_matrix(compiled, sources, targets, use_hierarchy)
+			assert lengths.shape == elevation_gains.shape == (len(sources), len(targets))
+			for i, source in enumerate(sources):
+				for j, target in enumerate(targets):
+					assert lengths[i, j] == pytest.approx(expected_lengths[source][target])
+					assert any(elevation_gains[i, j] == pytest.approx(gain) for gain in self.get_shortest_path_gains(medium_test_graph, source, target))
+
+	def test_unreachable(self, small_test_graph):
+		graph = small_test_graph.copy()
+		graph.add_node(99, x=0.0, y=0.0, elevation=0)
+		nodes = list(graph.nodes)
+
+		lengths, elevation_gains = distance_matrix.get_distance_matrix(graph, nodes, [99, 0])
+		assert np.isinf(lengths[:-1, 0]).all() and np.isnan(elevation_gains[:-1, 0]).all()
+		assert lengths[-1, 0] == 0 and elevation_gains[-1, 0] == 0
+		assert lengths[0, 1] == 0 and np.isfinite(lengths[1:-1, 1]).all()
+
+		with pytest.raises(ValueError):
+			distance_matrix.get_distance_matrix(graph, nodes, nodes, use_hierarchy=True)
+
+	def test_parallel(self, medium_test_graph, compiled_map):
+		nodes = list(medium_test_graph.nodes)
+		lengths, elevation_gains = distance_matrix.get_parallel_distance_matrix(compiled_map, nodes[:10], nodes, workers=2)
+		expected_lengths, expected_elevation_gains = distance_matrix.get_distance_matrix(medium_test_graph, nodes[:10], nodes, use_hierarchy=False)
+		assert np.array_equal(lengths, expected_lengths) and np.array_equal(elevation_gains, expected_elevation_gains)
+
+class TestShortestDistance:
+	def test_reverse_tree_distances(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		end_node = 2
+
+		tree = shortest_distance.shortest_distance_tree(compiled, compiled.index_of(end_node), reverse=True)
+		expected_distances = nx.single_source_dijkstra_path_length(medium_test_graph.reverse(), end_node, weight="length")
+
+		for node in medium_test_graph.nodes:
+			expected_distance = expected_distances.get(node, float("inf"))
+			assert tree.distance(compiled.index_of(node)) == expected_distance
+
+	def test_reverse_tree_is_cached(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+
+		tree = shortest_distance.get_reverse_tree(compiled, compiled.index_of(2))
+		assert shortest_distance.get_reverse_tree(compiled, compiled.index_of(2)) is tree
+
+	def test_get_shortest_path(self, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		shortest_path = osmnx.distance.shortest_path(medium_test_graph, start_node, end_node)
+		helper_path = routing_helper.RoutingHelper().get_shortest_path(medium_test_graph, start_node, end_node)
+
+		shortest_length = routing_helper.RoutingHelper().get_total_path_length(shortest_path, medium_test_graph)
+		helper_length = routing_helper.RoutingHelper().get_total_path_length(helper_path, medium_test_graph)
+
+		assert helper_path[0] == start_node and helper_path[-1] == end_node
+		assert helper_length == shortest_length
+		assert routing_helper.RoutingHelper().get_shortest_length(medium_test_graph, start_node, end_node) == shortest_length
+
+	def test_get_shortest_path_no_path(self, small_test_nonuniform_graph):
+		assert routing_helper.RoutingHelper().get_shortest_path(small_test_nonuniform_graph, 1, 2) == None
+		assert routing_helper.RoutingHelper().find_max_length(small_test_nonuniform_graph, 50, 1, 2) == -1
+
+	def test_bidirectional_shortest_path(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+
+		for start_node in medium_test_graph.nodes:
+			for end_node in medium_test_graph.nodes:
+				start = compiled.index_of(start_node)
+				end = compiled.index_of(end_node)
+
+				tree = shortest_distance.shortest_distance_tree(compiled, end, reverse=True)
+				path = shortest_distance.bidirectional_shortest_path(compiled, start, end)
+
+				if tree.distance(start) == float("inf"):
+					assert path == None
+				else:
+					assert path[0] == start and path[-1] == end
+					assert shortest_distance.path_length(compiled, path) == pytest.approx(tree.distance(start))
+
+	def test_find_max_length_point_to_point(self, small_test_graph):
+		max_length = routing_helper.RoutingHelper().find_max_length(small_test_graph, 50, 1, 4, point_to_point=True)
+		expected_max_length = 10.5
+		assert max_length == expected_max_length
+
+	def test_haversine_distances(self):
+		#one degree of latitude along a meridian
+		distances = heuristics.haversine_distances(np.array([0.0, 10.0]), np.array([0.0, 45.0]), 0.0, 1.0)
+
+		assert distances[0] == pytest.approx(111195, rel=1e-4)
+		assert distances[1] > distances[0]
+
+	def test_geometric_lower_bounds_are_admissible(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+
+		for end_node in medium_test_graph.nodes:
+			end = compiled.index_of(end_node)
+			tree = shortest_distance.shortest_distance_tree(compiled, end, reverse=True)
+			lower_bounds = heuristics.geometric_lower_bounds(compiled, end)
+
+			assert (lower_bounds <= tree.distances + 1e-9).all()
+			assert lower_bounds[end] == 0
+
+class TestLandmarks:
+	def test_landmark_lower_bounds_are_admissible(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		graph_landmarks = landmarks.build_landmarks(compiled, 4)
+
+		assert graph_landmarks.count == 4
+		assert len(set(graph_landmarks.landmark_nodes.tolist())) == 4
+
+		for end_node in medium_test_graph.nodes:
+			end = compiled.index_of(end_node)
+			tree = shortest_distance.shortest_distance_tree(compiled, end, reverse=True)
+			lower_bounds = graph_landmarks.lower_bounds_to(end)
+
+			for node in range(compiled.node_count):
+				assert lower_bounds[node] <= tree.distances[node]
+				assert graph_landmarks.lower_bound(node, end) == lower_bounds[node]
+
+	def test_landmarks_save_and_load(self, medium_test_graph, tmp_path):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		graph_landmarks = landmarks.build_landmarks(compiled, 3)
+
+		filename = str(tmp_path / "test-medium-graph.landmarks.npz")
+		graph_landmarks.save(filename)
+		loaded_landmarks = landmarks.Landmarks.load(filename)
+
+		assert loaded_landmarks.matches(compiled)
+		assert not loaded_landmarks.matches(compiled_graph.compile_graph(nx.MultiDiGraph(medium_test_graph.subgraph(range(10)))))
+		assert (loaded_landmarks.from_distances == graph_landmarks.from_distances).all()
+		assert (loaded_landmarks.to_distances == graph_landmarks.to_distances).all()
+
+	def test_landmark_bounds_without_landmarks(self, medium_test_graph):
+		graph = medium_test_graph.copy()
+
+		for strategy in [routing_actions.RoutingDijkstra(lower_bounds="landmarks"), routing_actions.RoutingAStar(heuristic="landmarks")]:
+			with pytest.raises(ValueError, match="--landmarks"):
+				strategy.routing_action(graph, 0, 2, 50, "minimize")
+
+	def test_load_map_with_landmarks(self, tmp_path):
+		filename = str(tmp_path / "test-medium-graph.pkl")
+		with open("cached_maps/test-medium-graph.pkl", "rb") as source, open(filename, "wb") as copy:
+			copy.write(source.read())
+
+		map.build_landmarks_file(filename, 4)
+		graph = map.load_map(filename)
+
+		assert compiled_graph.compile_graph(graph).landmarks.count == 4
+
+		x = 50
+		for start_node, end_node in [(0, 2), (3, 9), (14, 6)]:
+			expected_max_length = routing_helper.RoutingHelper().find_max_length(graph, x, start_node, end_node)
+			max_length = routing_helper.RoutingHelper().find_max_length(graph, x, start_node, end_node, point_to_point=True)
+			assert max_length == pytest.approx(expected_max_length)
+
+			for elevation_setting in ["minimize", "maximize", None]:
+				astar_path = routing_actions.RoutingAStar().routing_action(graph, start_node, end_node, x, elevation_setting)
+				dijkstra_path = routing_actions.RoutingDijkstra(lower_bounds="landmarks").routing_action(graph, start_node, end_node, x, elevation_setting)
+
+				assert routing_helper.RoutingHelper().get_total_path_length(astar_path, graph) <= max_length
+				assert routing_helper.RoutingHelper().get_total_path_length(dijkstra_path, graph) <= max_length
+
+class TestContractionHierarchy:
+	def test_contraction_hierarchy_shortest_paths(self, medium_test_graph):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		hierarchy = contraction_hierarchy.build_contraction_hierarchy(compiled)
+
+		for start_node in medium_test_graph.nodes:
+			start = compiled.index_of(start_node)
+			tree = shortest_distance.shortest_distance_tree(compiled, start)
+
+			for end in range(compiled.node_count):
+				path = hierarchy.shortest_path(start, end)
+
+				if tree.distances[end] == float("inf"):
+					assert path is None
+					continue
+
+				assert path[0] == start and path[-1] == end
+				assert all(compiled.edge_length(path[i], path[i + 1]) is not None for i in range(len(path) - 1))
+				assert shortest_distance.path_length(compiled, path) == pytest.approx(tree.distances[end])
+				assert hierarchy.shortest_distance(start, end) == pytest.approx(tree.distances[end])
+
+	def test_contraction_hierarchy_save_and_load(self, medium_test_graph, tmp_path):
+		compiled = compiled_graph.compile_graph(medium_test_graph)
+		hierarchy = contraction_hierarchy.build_contraction_hierarchy(compiled)
+
+		filename = str(tmp_path / "test-medium-graph.ch.npz")
+		hierarchy.save(filename)
+		loaded_hierarchy = contraction_hierarchy.ContractionHierarchy.load(filename)
+
+		assert loaded_hierarchy.matches(compiled)
+		assert not loaded_hierarchy.matches(compiled_graph.compile_graph(nx.MultiDiGraph(medium_test_graph.subgraph(range(10)))))
+		assert (loaded_hierarchy.ranks == hierarchy.ranks).all()
+		assert loaded_hierarchy.shortcut_count == hierarchy.shortcut_count
+
+	def test_load_map_with_contraction_hierarchy(self, tmp_path):
+		filename = str(tmp_path / "test-medium-graph.pkl")
+		with open("cached_maps/test-medium-graph.pkl", "rb") as source, open(filename, "wb") as copy:
+			copy.write(source.read())
+
+		map.build_contraction_hierarchy_file(filename)
+		graph = map.load_map(filename)
+
+		assert compiled_graph.compile_graph(graph).contraction_hierarchy is not None
+
+		x = 50
+		for start_node, end_node in [(0, 2), (3, 9), (14, 6)]:
+			#query the hierarchy before the reverse tree of end_node is cached
+			max_length = routing_helper.RoutingHelper().find_max_length(graph, x, start_node, end_node, point_to_point=True)
+			expected_max_length = routing_helper.RoutingHelper().find_max_length(graph, x, start_node, end_node)
+			assert max_length == pytest.approx(expected_max_length)
+
 class TestDijkstra:
 	def test_small_min_elevation(self, dijkstra, small_test_graph):
 		start_node = 3
@@ -361,6 +1570,22 @@ class TestDijkstra:
 		assert dijkstra_path == [1]
 		assert dijkstra_length == 0
 
+	def test_medium_target_pruning(self, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		x = 50
+
+		for elevation_setting in ["minimize", "maximize", None]:
+			pruned_path = routing_actions.RoutingDijkstra().routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+			unpruned_path = routing_actions.RoutingDijkstra(target_pruning=False).routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+
+			max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+			pruned_length = routing_helper.RoutingHelper().get_total_path_length(pruned_path, medium_test_graph)
+
+			assert pruned_path == unpruned_path
+			assert pruned_length <= max_length
+
 class TestAStar:
 	def test_small_min_elevation(self, astar, small_test_graph):
 		start_node = 3
@@ -652,6 +1877,39 @@ class TestAStar:
 		assert a_star_path == [1]
 		assert a_star_length == 0
 
+	def test_medium_target_pruning(self, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		x = 50
+
+		for elevation_setting in ["minimize", "maximize", None]:
+			pruned_path = routing_actions.RoutingAStar().routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+			unpruned_path = routing_actions.RoutingAStar(target_pruning=False).routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+
+			max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+			pruned_length = routing_helper.RoutingHelper().get_total_path_length(pruned_path, medium_test_graph)
+
+			assert pruned_path == unpruned_path
+			assert pruned_length <= max_length
+
+	def test_medium_exact_heuristic(self, medium_test_graph):
+		x = 50
+
+		for start_node, end_node in [(0, 2), (3, 9), (14, 6)]:
+			for elevation_setting in ["minimize", "maximize", None]:
+				haversine_path = routing_actions.RoutingAStar().routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+				exact_path = routing_actions.RoutingAStar(heuristic="exact").routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+
+				haversine_length = routing_helper.RoutingHelper().get_total_path_length(haversine_path, medium_test_graph)
+				exact_length = routing_helper.RoutingHelper().get_total_path_length(exact_path, medium_test_graph)
+				max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+
+				assert haversine_length <= max_length
+				assert exact_length <= max_length
+				if elevation_setting is None:
+					assert haversine_length == exact_length
+
 class TestDFS:
 	def test_small_min_elevation(self, dfs, small_test_graph):
 		start_node = 3
@@ -943,6 +2201,345 @@ class TestDFS:
 		assert dfs_path == [1]
 		assert dfs_length == 0
 
+	def test_medium_expansion_budget(self, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		x = 400
+
+		max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+
+		for max_expansions in [0, 1, 5]:
+			dfs_path = routing_actions.RoutingDFS(max_expansions=max_expansions).routing_action(medium_test_graph, start_node, end_node, x, "maximize")
+			dfs_length = routing_helper.RoutingHelper().get_total_path_length(dfs_path, medium_test_graph)
+
+			assert dfs_path[0] == start_node and dfs_path[-1] == end_node
+			assert dfs_length <= max_length
+
+	def test_medium_max_elevation_matches_unbounded_search(self, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		x = 50
+
+		dfs_path = routing_actions.RoutingDFS(max_expansions=None, time_limit=None).routing_action(medium_test_graph, start_node, end_node, x, "maximize")
+		timed_dfs_path = routing_actions.RoutingDFS(time_limit=60).routing_action(medium_test_graph, start_node, end_node, x, "maximize")
+
+		assert dfs_path == timed_dfs_path
+
+	def test_grid_max_elevation_stops_at_budget(self):
+		#a 20x20 grid has far too many routes within max length to try them all
+		grid = nx.MultiDiGraph()
+		for i in range(20):
+			for j in range(20):
+				grid.add_node(20 * i + j, x=j, y=i, elevation=(7 * i + 13 * j) % 10)
+		for u in grid.nodes:
+			for v in [u + 1 if u % 20 < 19 else None, u + 20 if u < 380 else None]:
+				if v is not None:
+					grid.add_edge(u, v, length=1, elevation_gain=max(0, grid.nodes[v]["elevation"] - grid.nodes[u]["elevation"]))
+					grid.add_edge(v, u, length=1, elevation_gain=max(0, grid.nodes[u]["elevation"] - grid.nodes[v]["elevation"]))
+
+		x = 100
+		max_length = routing_helper.RoutingHelper().find_max_length(grid, x, 0, 399)
+
+		assert routing_actions.RoutingDFS().max_expansions is not None and routing_actions.RoutingDFS().time_limit is not None
+		for dfs in [routing_actions.RoutingDFS(max_expansions=20000), routing_actions.RoutingDFS(time_limit=0.2)]:
+			start_time = time.monotonic()
+			dfs_path = dfs.routing_action(grid, 0, 399, x, "maximize")
+
+			assert time.monotonic() - start_time < 10
+			assert dfs_path[0] == 0 and dfs_path[-1] == 399
+			assert routing_helper.RoutingHelper().get_total_path_length(dfs_path, grid) <= max_length
+
+class TestBidirectional:
+	def test_small_shortest_path(self, bidirectional, small_test_graph):
+		start_node = 1
+		end_node = 4
+
+		shortest_path = osmnx.distance.shortest_path(small_test_graph, start_node, end_node)
+		bidirectional_path = bidirectional.execute_routing_mode(small_test_graph, start_node, end_node)
+
+		shortest_length = routing_helper.RoutingHelper().get_total_path_length(shortest_path, small_test_graph)
+		bidirectional_length = routing_helper.RoutingHelper().get_total_path_length(bidirectional_path, small_test_graph)
+
+		assert shortest_length == bidirectional_length
+		assert shortest_path == bidirectional_path
+
+	def test_medium_shortest_path(self, bidirectional, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		shortest_path = osmnx.distance.shortest_path(medium_test_graph, start_node, end_node)
+		bidirectional_path = bidirectional.execute_routing_mode(medium_test_graph, start_node, end_node)
+
+		shortest_length = routing_helper.RoutingHelper().get_total_path_length(shortest_path, medium_test_graph)
+		bidirectional_length = routing_helper.RoutingHelper().get_total_path_length(bidirectional_path, medium_test_graph)
+
+		assert shortest_length == bidirectional_length
+
+	def test_medium_min_elevation(self, bidirectional, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		x = 50
+
+		shortest_path = osmnx.distance.shortest_path(medium_test_graph, start_node, end_node)
+		bidirectional_path = bidirectional.execute_routing_mode(medium_test_graph, start_node, end_node, x, "minimize")
+
+		shortest_path_elevation = routing_helper.RoutingHelper().get_path_elevation(shortest_path, medium_test_graph)
+		bidirectional_path_elevation = routing_helper.RoutingHelper().get_path_elevation(bidirectional_path, medium_test_graph)
+
+		max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+		bidirectional_length = routing_helper.RoutingHelper().get_total_path_length(bidirectional_path, medium_test_graph)
+
+		assert bidirectional_path_elevation < shortest_path_elevation
+		assert bidirectional_length <= max_length
+
+	def test_small_no_path(self, bidirectional, small_test_nonuniform_graph):
+		bidirectional_path = bidirectional.execute_routing_mode(small_test_nonuniform_graph, 1, 2)
+		assert bidirectional_path == None
+
+	def test_small_same_start_end(self, bidirectional, small_test_graph):
+		bidirectional_path = bidirectional.execute_routing_mode(small_test_graph, 1, 1)
+		assert bidirectional_path == [1]
+
+	def test_ignores_preprocessing(self, bidirectional, medium_test_graph, monkeypatch):
+		compiled = compiled_graph.CompiledGraph.from_graph(medium_test_graph)
+		compiled.contraction_hierarchy = contraction_hierarchy.build_contraction_hierarchy(compiled)
+		compiled.landmarks = landmarks.build_landmarks(compiled, 4)
+
+		#the strategy runs bidirectional Dijkstra even when the map has a contraction hierarchy and landmarks
+		searches = []
+		bidirectional_shortest_path = shortest_distance.bidirectional_shortest_path
+		monkeypatch.setattr(routing_actions, "bidirectional_shortest_path", lambda *args: searches.append(args) or bidirectional_shortest_path(*args))
+		bidirectional_path = bidirectional.execute_routing_mode(compiled, 0, 2)
+
+		assert len(searches) == 1
+		assert bidirectional_path == routing_helper.RoutingHelper().get_shortest_path(compiled, 0, 2)
+
+	def test_boulder_settled_nodes(self, bidirectional, monkeypatch):
+		class CountingAdjacency:
+			def __init__(self, adjacency):
+				self.adjacency = adjacency
+				self.lookups = 0
+
+			def __getitem__(self, node):
+				self.lookups += 1
+				return self.adjacency[node]
+
+		#every settled node reads its adjacency list once, so count the lookups across town
+		graph = map.load_map("cached_maps/boulder-drive.pkl")
+		compiled = compiled_graph.compile_graph(graph)
+		start, end = compiled.index_of(176487678), compiled.index_of(176480431)
+		forward, backward = CountingAdjacency(compiled.adjacency()), CountingAdjacency(compiled.reverse_adjacency())
+		monkeypatch.setattr(compiled, "adjacency", lambda: forward)
+		monkeypatch.setattr(compiled, "reverse_adjacency", lambda: backward)
+
+		bidirectional_path = bidirectional.execute_routing_mode(compiled, 176487678, 176480431)
+		bidirectional_settled = forward.lookups + backward.lookups
+
+		#A* without a heuristic is unidirectional Dijkstra that stops at the end
+		forward.lookups = backward.lookups = 0
+		dijkstra_path = shortest_distance.astar_shortest_path(compiled, start, end, [0] * compiled.node_count)
+		dijkstra_settled = forward.lookups + backward.lookups
+
+		assert bidirectional_path == compiled.path_to_ids(dijkstra_path)
+		assert bidirectional_settled < 0.7 * dijkstra_settled
+
+class TestLabelSetting:
+	def test_small_min_elevation(self, label_setting, small_test_graph):
+		start_node = 3
+		end_node = 4
+
+		x = 50
+
+		elevation_setting = "minimize"
+
+		shortest_path = osmnx.distance.shortest_path(small_test_graph, start_node, end_node)
+		label_setting_path = label_setting.execute_routing_mode(small_test_graph, start_node, end_node, x, elevation_setting)
+
+		shortest_path_elevation = routing_helper.RoutingHelper().get_path_elevation(shortest_path, small_test_graph)
+		label_setting_path_elevation = routing_helper.RoutingHelper().get_path_elevation(label_setting_path, small_test_graph)
+
+		max_length = routing_helper.RoutingHelper().find_max_length(small_test_graph, x, start_node, end_node)
+		label_setting_length = routing_helper.RoutingHelper().get_total_path_length(label_setting_path, small_test_graph)
+
+		assert label_setting_path_elevation < shortest_path_elevation
+		assert label_setting_length <= max_length
+
+	def test_medium_min_elevation_is_optimal(self, label_setting, dfs, medium_test_graph):
+		#the exhaustive branch-and-bound DFS finds the true minimum, so both should agree
+		for start_node, end_node in [(0, 2), (3, 9), (14, 6)]:
+			for x in [0, 25, 100]:
+				label_setting_path = label_setting.execute_routing_mode(medium_test_graph, start_node, end_node, x, "minimize")
+				dfs_path = dfs.execute_routing_mode(medium_test_graph, start_node, end_node, x, "minimize")
+
+				label_setting_path_elevation = routing_helper.RoutingHelper().get_path_elevation(label_setting_path, medium_test_graph)
+				dfs_path_elevation = routing_helper.RoutingHelper().get_path_elevation(dfs_path, medium_test_graph)
+
+				max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+				label_setting_length = routing_helper.RoutingHelper().get_total_path_length(label_setting_path, medium_test_graph)
+
+				assert label_setting_path_elevation == dfs_path_elevation
+				assert label_setting_length <= max_length
+
+	def test_medium_max_elevation(self, label_setting, dijkstra, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		x = 50
+
+		elevation_setting = "maximize"
+
+		dijkstra_path = dijkstra.execute_routing_mode(medium_test_graph, start_node, end_node, x, elevation_setting)
+		label_setting_path = label_setting.execute_routing_mode(medium_test_graph, start_node, end_node, x, elevation_setting)
+
+		dijkstra_path_elevation = routing_helper.RoutingHelper().get_path_elevation(dijkstra_path, medium_test_graph)
+		label_setting_path_elevation = routing_helper.RoutingHelper().get_path_elevation(label_setting_path, medium_test_graph)
+
+		max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+		label_setting_length = routing_helper.RoutingHelper().get_total_path_length(label_setting_path, medium_test_graph)
+
+		assert label_setting_path_elevation >= dijkstra_path_elevation
+		assert label_setting_length <= max_length
+		assert len(set(label_setting_path)) == len(label_setting_path)
+
+	def test_boulder_max_elevation_not_worse_than_dijkstra(self, label_setting, dijkstra):
+		#maximizing over elementary routes misses the Dijkstra route here, which has 65 m of gain instead of 60 m
+		graph = map.load_map("cached_maps/boulder-drive.pkl")
+		start_node = 176567538
+		end_node = 176423142
+
+		x = 50
+
+		max_length = routing_helper.RoutingHelper().find_max_length(graph, x, start_node, end_node)
+
+		label_setting_path = label_setting.execute_routing_mode(graph, start_node, end_node, x, "maximize")
+		dijkstra_path = dijkstra.execute_routing_mode(graph, start_node, end_node, x, "maximize")
+
+		assert routing_helper.RoutingHelper().get_path_elevation(label_setting_path, graph) >= routing_helper.RoutingHelper().get_path_elevation(dijkstra_path, graph)
+		assert routing_helper.RoutingHelper().get_total_path_length(label_setting_path, graph) <= max_length
+
+	def test_medium_label_limit(self, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		x = 100
+
+		#a search cut short by the label limit says so, along with the best route it found
+		for elevation_setting in ["minimize", "maximize"]:
+			with pytest.raises(label_setting_module.LabelLimitError) as error:
+				routing_actions.RoutingLabelSetting(max_labels=3).routing_action(medium_test_graph, start_node, end_node, x, elevation_setting)
+			assert error.value.result[0] == start_node and error.value.result[-1] == end_node
+
+		with pytest.raises(label_setting_module.LabelLimitError) as error:
+			routing_actions.RoutingLabelSetting(max_labels=3).frontier_action(medium_test_graph, start_node, end_node, x)
+		assert error.value.result.shortest_length is not None
+
+		assert routing_actions.RoutingLabelSetting().max_labels * label_setting_module.LABEL_SIZE <= label_setting_module.LABEL_MEMORY_BUDGET
+
+	def test_medium_shortest_path(self, label_setting, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		shortest_path = osmnx.distance.shortest_path(medium_test_graph, start_node, end_node)
+		label_setting_path = label_setting.execute_routing_mode(medium_test_graph, start_node, end_node)
+
+		shortest_length = routing_helper.RoutingHelper().get_total_path_length(shortest_path, medium_test_graph)
+		label_setting_length = routing_helper.RoutingHelper().get_total_path_length(label_setting_path, medium_test_graph)
+
+		assert shortest_length == label_setting_length
+
+	def test_small_no_path(self, label_setting, small_test_nonuniform_graph):
+		start_node = 1
+		end_node = 2
+
+		label_setting_path = label_setting.execute_routing_mode(small_test_nonuniform_graph, start_node, end_node, 50, "minimize")
+
+		assert label_setting_path == None
+
+	def test_small_same_start_end(self, label_setting, small_test_graph):
+		start_node = 1
+		end_node = 1
+
+		label_setting_path = label_setting.execute_routing_mode(small_test_graph, start_node, end_node, 50, "maximize")
+
+		assert label_setting_path == [1]
+
+class TestParetoFrontier:
+	def test_medium_frontier_min_elevation(self, label_setting, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		frontier = label_setting.execute_frontier_query(medium_test_graph, start_node, end_node, 100)
+
+		for x in [0, 10, 25, 50, 100]:
+			frontier_path = frontier.route_for(x, "minimize")
+			label_setting_path = label_setting.execute_routing_mode(medium_test_graph, start_node, end_node, x, "minimize")
+
+			frontier_path_elevation = routing_helper.RoutingHelper().get_path_elevation(frontier_path, medium_test_graph)
+			label_setting_path_elevation = routing_helper.RoutingHelper().get_path_elevation(label_setting_path, medium_test_graph)
+
+			max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+			frontier_length = routing_helper.RoutingHelper().get_total_path_length(frontier_path, medium_test_graph)
+
+			assert frontier_path_elevation == label_setting_path_elevation
+			assert frontier_length <= max_length
+
+	def test_medium_frontier_max_elevation(self, label_setting, dijkstra, medium_test_graph):
+		start_node = 0
+		end_node = 2
+
+		frontier = label_setting.execute_frontier_query(medium_test_graph, start_node, end_node, 100)
+
+		for x in [0, 10, 25, 50, 100]:
+			frontier_path = frontier.route_for(x, "maximize")
+			dijkstra_path = dijkstra.execute_routing_mode(medium_test_graph, start_node, end_node, x, "maximize")
+
+			frontier_path_elevation = routing_helper.RoutingHelper().get_path_elevation(frontier_path, medium_test_graph)
+			dijkstra_path_elevation = routing_helper.RoutingHelper().get_path_elevation(dijkstra_path, medium_test_graph)
+
+			max_length = routing_helper.RoutingHelper().find_max_length(medium_test_graph, x, start_node, end_node)
+			frontier_length = routing_helper.RoutingHelper().get_total_path_length(frontier_path, medium_test_graph)
+
+			assert frontier_path_elevation >= dijkstra_path_elevation
+			assert frontier_length <= max_length
+
+	def test_medium_frontier_is_pareto_optimal(self, label_setting, medium_test_graph):
+		frontier = label_setting.execute_frontier_query(medium_test_graph, 0, 2, 100)
+
+		minimum_routes = frontier.get_minimum_elevation_routes()
+		maximum_routes = frontier.get_maximum_elevation_routes()
+
+		assert frontier.routes[0][0] == frontier.shortest_length
+		for front, compare in [(minimum_routes, lambda a, b: a > b), (maximum_routes, lambda a, b: a < b)]:
+			for i in range(len(front) - 1):
+				assert front[i][0] <= front[i + 1][0]
+				assert compare(front[i][1], front[i + 1][1])
+
+	def test_medium_frontier_shortest_path(self, label_setting, medium_test_graph):
+		frontier = label_setting.execute_frontier_query(medium_test_graph, 0, 2, 100)
+
+		frontier_length = routing_helper.RoutingHelper().get_total_path_length(frontier.route_for(50), medium_test_graph)
+
+		assert frontier_length == frontier.shortest_length
+
+	def test_frontier_x_too_large(self, label_setting, medium_test_graph):
+		frontier = label_setting.execute_frontier_query(medium_test_graph, 0, 2, 50)
+
+		with pytest.raises(ValueError):
+			frontier.route_for(100, "minimize")
+
+	def test_small_frontier_no_path(self, label_setting, small_test_nonuniform_graph):
+		frontier = label_setting.execute_frontier_query(small_test_nonuniform_graph, 1, 2, 50)
+
+		assert frontier.route_for(50, "minimize") == None
+
+	def test_frontier_not_supported(self, dijkstra, label_setting, medium_test_graph):
+		assert label_setting.routing_mode.supports_frontier and not dijkstra.routing_mode.supports_frontier
+		with pytest.raises(ValueError):
+			dijkstra.execute_frontier_query(medium_test_graph, 0, 2, 50)
+
 #FOR TESTING PURPOSES
 def show_graph(graph_name):
 	with open("cached_maps/{}".format(graph_name), 'rb') as file: